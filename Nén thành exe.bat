@@ -13,7 +13,7 @@ echo [1/2] Installing requirements...
 
 echo.
 echo [2/2] Building exe...
-%PYTHON% -m PyInstaller --onefile --windowed --icon=icon.ico --name="YouTubeChannelDownloader" --clean youtube_channel_downloader.py
+%PYTHON% -m PyInstaller --onefile --windowed --icon=icon.ico --name="YouTubeChannelDownloader" --hidden-import requests --hidden-import PIL.Image --hidden-import concurrent.futures --hidden-import sqlite3 --clean youtube_channel_downloader.py
 
 echo.
 echo ========================================
@@ -0,0 +1,308 @@
+"""
+Kiểm tra tải file của capnhat_congcu.py với server Range chạy cục bộ, hoàn toàn offline
+
+Server HTTP trong thread nền phục vụ file từ bộ nhớ, có thể tắt hỗ trợ Range hoặc
+cắt kết nối giữa chừng. Các tình huống được kiểm tra:
+    - tải nhiều đoạn song song + kiểm tra sha256 (đúng thì qua, sai thì xoá file dở)
+    - kết nối bị cắt giữa chừng, lần chạy sau tải tiếp từ file .download
+    - process bị kill giữa chừng: tải tiếp nhờ checkpoint định kỳ
+    - server không gửi ETag/Last-Modified: không tải tiếp, tải lại từ đầu
+    - server không hỗ trợ Range: tải tuần tự, zip từ xa trả None
+    - zip từ xa (kể cả Zip64): chỉ tải các exe cần, đúng nội dung
+
+Ví dụ:
+    python benchmarks/capnhat_check.py
+    python benchmarks/capnhat_check.py --mb 16 --keep
+"""
+
+import io
+import os
+import sys
+import time
+import shutil
+import struct
+import hashlib
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HERE)
+
+sys.path.insert(0, REPO_ROOT)
+
+import capnhat_congcu  # noqa: E402
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0: mỗi request một kết nối, dễ cắt kết nối giữa chừng
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        start, end, status = 0, len(body) - 1, 200
+        header = self.headers.get("Range", "")
+        if server.ranges and header.startswith("bytes="):
+            first, _, last = header[6:].partition("-")
+            start = int(first)
+            end = min(int(last), len(body) - 1) if last else len(body) - 1
+            status = 206
+        chunk = body[start:end + 1]
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(chunk)))
+        if server.validators:
+            self.send_header("ETag", f'"{hashlib.md5(body).hexdigest()}"')
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.end_headers()
+
+        with server.lock:
+            # Chỉ cắt các đoạn dữ liệu thật, không cắt request dò Range: bytes=0-0
+            drop = server.drops_left > 0 and len(chunk) > 1
+            if drop:
+                server.drops_left -= 1
+        if drop:
+            chunk = chunk[:len(chunk) // 2]
+        try:
+            for i in range(0, len(chunk), 64 * 1024):
+                piece = chunk[i:i + 64 * 1024]
+                self.wfile.write(piece)
+                with server.lock:
+                    server.sent += len(piece)
+                if server.rate:
+                    time.sleep(len(piece) / server.rate)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client đóng sớm (vd. đọc xong phần cần khi server bỏ qua Range)
+            return
+        with server.lock:
+            server.requests += 1
+
+
+class RangeServer:
+    """Server file tĩnh trong thread nền, đếm số byte đã gửi; rate = byte/s mỗi kết nối (0 = không giới hạn)"""
+
+    def __init__(self, files):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.files = files
+        self.httpd.ranges = True
+        self.httpd.validators = True
+        self.httpd.rate = 0
+        self.httpd.drops_left = 0
+        self.httpd.sent = 0
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+        host, port = self.httpd.server_address[:2]
+        self.base_url = f"http://{host}:{port}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return self.base_url + path
+
+    def reset(self, ranges=True, drops=0, validators=True, rate=0):
+        with self.httpd.lock:
+            self.httpd.ranges = ranges
+            self.httpd.validators = validators
+            self.httpd.rate = rate
+            self.httpd.drops_left = drops
+            self.httpd.sent = 0
+            self.httpd.requests = 0
+
+    @property
+    def sent(self):
+        with self.httpd.lock:
+            return self.httpd.sent
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def build_zip(members):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data, method in members:
+            zf.writestr(name, data, compress_type=method)
+    return buf.getvalue()
+
+
+def to_zip64(raw):
+    """
+    Viết lại central directory theo Zip64: kích thước/offset trong bản ghi và EOCD đặt 0xFFFFFFFF,
+    giá trị thật nằm ở extra 0x0001, EOCD64 + locator đứng trước EOCD
+    """
+    count, _, cd_offset = struct.unpack("<2xH2L", raw[-22:][8:20])
+    infos = zipfile.ZipFile(io.BytesIO(raw)).infolist()
+    cd = b""
+    for info in infos:
+        name = info.filename.encode("utf-8")
+        extra = struct.pack("<2H3Q", 0x0001, 24, info.file_size, info.compress_size, info.header_offset)
+        cd += struct.pack("<4s6H3L5H2L", capnhat_congcu.ZIP_CENTRAL_SIG, 45, 45, 0x800,
+                          info.compress_type, 0, 0x21, info.CRC, 0xFFFFFFFF, 0xFFFFFFFF,
+                          len(name), len(extra), 0, 0, 0, 0, 0xFFFFFFFF) + name + extra
+    eocd64_offset = cd_offset + len(cd)
+    eocd64 = struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, len(cd), cd_offset)
+    locator = struct.pack("<4sLQL", capnhat_congcu.ZIP64_LOCATOR_SIG, 0, eocd64_offset, 1)
+    eocd = struct.pack("<4s4H2LH", capnhat_congcu.ZIP_EOCD_SIG, 0, 0, 0xFFFF, 0xFFFF,
+                       0xFFFFFFFF, 0xFFFFFFFF, 0)
+    data = raw[:cd_offset] + cd + eocd64 + locator + eocd
+    # Tự kiểm tra bằng zipfile trước khi dùng
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert [i.filename for i in zf.infolist()] == [i.filename for i in infos]
+    return data
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra download_file / zip từ xa của capnhat_congcu.py")
+    parser.add_argument("--mb", type=float, default=8.0, help="Kích thước file tải thử (MB)")
+    parser.add_argument("--keep", action="store_true", help="Giữ thư mục tạm sau khi chạy")
+    args = parser.parse_args()
+
+    payload = os.urandom(int(args.mb * 1024 * 1024))
+    digest = "sha256:" + hashlib.sha256(payload).hexdigest()
+    exes = {
+        "ffmpeg.exe": os.urandom(300_000),
+        "ffprobe.exe": b"probe " * 50_000,
+    }
+    members = [
+        ("ffmpeg-x/bin/ffmpeg.exe", exes["ffmpeg.exe"], zipfile.ZIP_STORED),
+        ("ffmpeg-x/bin/ffprobe.exe", exes["ffprobe.exe"], zipfile.ZIP_DEFLATED),
+        ("ffmpeg-x/doc/manual.html", os.urandom(2_000_000), zipfile.ZIP_STORED),
+    ]
+    plain_zip = build_zip(members)
+    files = {"/file.bin": payload, "/plain.zip": plain_zip, "/zip64.zip": to_zip64(plain_zip)}
+
+    # Ngưỡng nhỏ để file thử cũng chia nhiều kết nối; chunk nhỏ để đoạn bị cắt vẫn ghi được phần đã nhận
+    capnhat_congcu.PARALLEL_MIN_SIZE = 1024 * 1024
+    capnhat_congcu.CHUNK_SIZE = 64 * 1024
+
+    server = RangeServer(files)
+    work_dir = tempfile.mkdtemp(prefix="ntb_capnhat_")
+    dest = os.path.join(work_dir, "file.bin")
+    results = []
+
+    def check(name, ok, detail=""):
+        results.append(ok)
+        print(f"{'✅' if ok else '❌'} {name}" + (f" | {detail}" if detail else ""))
+
+    def attempt(func, *a, **kw):
+        try:
+            return func(*a, **kw), None
+        except Exception as e:
+            return None, e
+
+    try:
+        # 1) Range + nhiều kết nối + sha256 đúng
+        server.reset()
+        started = time.perf_counter()
+        _, error = attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest,
+                           expected_size=len(payload), expected_digest=digest)
+        check("Tải song song + sha256", error is None and read(dest) == payload,
+              f"{time.perf_counter() - started:.2f}s, {server.httpd.requests} request" + (f", lỗi: {error}" if error else ""))
+
+        # 2) Cắt kết nối giữa chừng, lần sau tải tiếp
+        os.remove(dest)
+        capnhat_congcu.DOWNLOAD_RETRIES = 1
+        server.reset(drops=2)
+        _, error = attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest, expected_digest=digest)
+        kept = os.path.exists(dest + ".download") and os.path.exists(dest + ".download.json")
+        check("Lỗi giữa chừng giữ lại file dở", error is not None and kept)
+        server.reset()
+        _, error = attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest, expected_digest=digest)
+        resumed = server.sent
+        check("Tải tiếp từ file dở", error is None and read(dest) == payload and resumed < len(payload),
+              f"lần 2 tải {resumed / 1024 / 1024:.2f} / {len(payload) / 1024 / 1024:.2f} MB"
+              + (f", lỗi: {error}" if error else ""))
+
+        # 3) Không có ETag/Last-Modified: file dở không được dùng lại
+        os.remove(dest)
+        server.reset(drops=2, validators=False)
+        attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest, expected_digest=digest)
+        server.reset(validators=False)
+        _, error = attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest, expected_digest=digest)
+        check("Không validator: tải lại từ đầu", error is None and read(dest) == payload
+              and server.sent >= len(payload), f"lần 2 tải {server.sent / 1024 / 1024:.2f} MB"
+              + (f", lỗi: {error}" if error else ""))
+        capnhat_congcu.DOWNLOAD_RETRIES = 3
+
+        # 4) Kill process đang tải (như mất điện): checkpoint định kỳ giữ tiến độ
+        os.remove(dest)
+        connections = capnhat_congcu.DOWNLOAD_CONNECTIONS
+        server.reset(rate=len(payload) / 8 / connections)
+        child = subprocess.Popen(
+            [sys.executable, "-c",
+             "import sys; sys.path.insert(0, sys.argv[1]); import capnhat_congcu as c; "
+             f"c.PARALLEL_MIN_SIZE = {capnhat_congcu.PARALLEL_MIN_SIZE}; c.CHUNK_SIZE = {capnhat_congcu.CHUNK_SIZE}; "
+             "c.download_file(sys.argv[2], sys.argv[3])",
+             REPO_ROOT, server.url("/file.bin"), dest],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(capnhat_congcu.CHECKPOINT_SECONDS + 1.5)
+        child.kill()
+        child.wait()
+        server.reset()
+        _, error = attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest, expected_digest=digest)
+        check("Bị kill: tải tiếp từ checkpoint", error is None and read(dest) == payload
+              and server.sent < len(payload), f"lần 2 tải {server.sent / 1024 / 1024:.2f} / "
+              f"{len(payload) / 1024 / 1024:.2f} MB" + (f", lỗi: {error}" if error else ""))
+
+        # 5) sha256 sai: báo lỗi, xoá file dở để lần sau tải lại từ đầu
+        os.remove(dest)
+        server.reset()
+        _, error = attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest,
+                           expected_digest="sha256:" + "0" * 64)
+        leftovers = [p for p in (dest, dest + ".download", dest + ".download.json") if os.path.exists(p)]
+        check("sha256 sai bị từ chối", error is not None and "sha256" in str(error) and not leftovers,
+              str(error).splitlines()[0] if error else "không báo lỗi")
+
+        # 6) Server không hỗ trợ Range
+        server.reset(ranges=False)
+        _, error = attempt(capnhat_congcu.download_file, server.url("/file.bin"), dest, expected_digest=digest)
+        check("Không Range: tải tuần tự", error is None and read(dest) == payload,
+              f"lỗi: {error}" if error else "")
+        extracted, error = attempt(capnhat_congcu.extract_exes_from_remote_zip, server.url("/plain.zip"), work_dir)
+        check("Không Range: zip từ xa trả None", error is None and extracted is None,
+              f"lỗi: {error}" if error else "")
+
+        # 7) Zip từ xa, zip thường và Zip64
+        for path in ("/plain.zip", "/zip64.zip"):
+            target = os.path.join(work_dir, path.strip("/").replace(".", "_"))
+            os.makedirs(target)
+            server.reset()
+            extracted, error = attempt(capnhat_congcu.extract_exes_from_remote_zip, server.url(path), target)
+            same = bool(extracted) and set(extracted) == set(exes) and all(
+                read(extracted[base]) == data for base, data in exes.items())
+            check(f"Zip từ xa {path}", error is None and same and server.sent < len(files[path]),
+                  f"tải {server.sent / 1024:.0f} / {len(files[path]) / 1024:.0f} KB"
+                  + (f", lỗi: {error}" if error else ""))
+    finally:
+        server.stop()
+        if args.keep:
+            print(f"📁 Giữ thư mục tạm: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not all(results):
+        print(f"❌ {results.count(False)} / {len(results)} kiểm tra không đạt")
+        return 1
+    print(f"✅ Đạt cả {len(results)} kiểm tra")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,343 @@
+"""
+yt-dlp / ffmpeg giả lập cho benchmark
+
+Không truy cập mạng: ghi file với tốc độ cấu hình được và in output giống
+công cụ thật (yt-dlp --newline, ffmpeg stats) để các phần parse progress/stage
+của tool chạy như thật.
+
+Cấu hình qua biến môi trường:
+    FAKE_YTDLP_BYTES            kích thước mỗi video (byte), mặc định 4 MB
+    FAKE_YTDLP_RATE             tốc độ tải giả lập (byte/s), mặc định 50 MB/s
+    FAKE_YTDLP_EXTRACT_SECONDS  thời gian extraction giả lập, mặc định 0.05
+    FAKE_FFMPEG_RATE            tốc độ ghi của ffmpeg (byte/s), mặc định 200 MB/s
+    FAKE_YTDLP_FAIL_IDS         danh sách id (phân tách bởi dấu phẩy) luôn lỗi (video riêng tư)
+    FAKE_YTDLP_FLAKY_IDS        danh sách id lỗi HTTP 403 ở FAKE_YTDLP_FLAKY_TIMES lần đầu (mặc định 1),
+                                số lần đã chạy đếm bằng file trong FAKE_YTDLP_STATE_DIR
+    FAKE_YTDLP_STALL_IDS        danh sách id bị treo (tải được một phần rồi đứng yên) ở lần đầu
+    FAKE_YTDLP_TRUNCATE_IDS     danh sách id mà file video bị cắt còn một nửa ở lần đầu
+    FAKE_FFPROBE_CODEC          codec ffprobe báo về cho file nguồn (source.*), mặc định vp9
+    FAKE_FFPROBE_OUTPUT_CODEC   codec ffprobe báo về cho file mp4 đã xử lý, mặc định h264
+    FAKE_FFPROBE_FPS            fps ffprobe báo về, mặc định 30
+    FAKE_FFPROBE_DURATION       thời lượng (giây) ffprobe báo về / dùng để chia đoạn; không đặt thì
+                                ffprobe lấy thời lượng của video trên kênh giả lập (theo id trong tên file),
+                                nhân theo tỉ lệ kích thước file / kích thước đầy đủ (file bị cắt sẽ ngắn hơn)
+
+Các file thực thi nằm trong benchmarks/fake_bin/.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+
+CHUNK_SIZE = 256 * 1024
+
+
+def env_number(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return float(default)
+
+
+def human_size(nbytes):
+    return f"{nbytes / 1024 / 1024:.2f}MiB"
+
+
+def write_paced(path, nbytes, rate, on_progress=None):
+    """Ghi nbytes vào path với tốc độ tối đa rate byte/s"""
+    started = time.perf_counter()
+    written = 0
+    chunk = b"\0" * CHUNK_SIZE
+    with open(path, "wb") as f:
+        while written < nbytes:
+            n = min(CHUNK_SIZE, nbytes - written)
+            f.write(chunk[:n])
+            written += n
+            if rate > 0:
+                ahead = written / rate - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            if on_progress:
+                on_progress(written, time.perf_counter() - started)
+    return written
+
+
+def copy_paced(sources, dest, rate):
+    """Nối các file nguồn vào dest với tốc độ tối đa rate byte/s"""
+    started = time.perf_counter()
+    written = 0
+    with open(dest, "wb") as out:
+        for src in sources:
+            with open(src, "rb") as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    written += len(chunk)
+                    if rate > 0:
+                        ahead = written / rate - (time.perf_counter() - started)
+                        if ahead > 0:
+                            time.sleep(ahead)
+    return written
+
+
+# ==================== yt-dlp ====================
+def parse_ytdlp_args(argv):
+    opts = {'output': None, 'extract_audio': False, 'audio_format': 'mp3',
+            'ffmpeg_location': None, 'url': None, 'urls': [], 'info_json': None,
+            'merge_format': 'mp4'}
+    with_value = {'-o', '-f', '--cookies', '--ffmpeg-location', '--merge-output-format',
+                  '--postprocessor-args', '--audio-format', '--audio-quality',
+                  '--concurrent-fragments', '-N', '--load-info-json'}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in with_value and i + 1 < len(argv):
+            value = argv[i + 1]
+            if arg == '-o':
+                opts['output'] = value
+            elif arg == '--ffmpeg-location':
+                opts['ffmpeg_location'] = value
+            elif arg == '--audio-format':
+                opts['audio_format'] = value
+            elif arg == '--load-info-json':
+                opts['info_json'] = value
+            elif arg == '--merge-output-format':
+                opts['merge_format'] = value
+            i += 2
+            continue
+        if arg == '-x':
+            opts['extract_audio'] = True
+        elif not arg.startswith('-'):
+            opts['url'] = arg
+            opts['urls'].append(arg)
+        i += 1
+    return opts
+
+
+def find_ffmpeg(location):
+    if location:
+        for name in ("ffmpeg", "ffmpeg.exe"):
+            path = os.path.join(location, name)
+            if os.path.isfile(path):
+                return path
+    return shutil.which("ffmpeg")
+
+
+def run_ffmpeg(ffmpeg, inputs, output):
+    """Gọi ffmpeg (thật hoặc giả lập); không có thì tự nối file"""
+    if ffmpeg:
+        cmd = [ffmpeg, "-y"]
+        for path in inputs:
+            cmd += ["-i", path]
+        cmd += ["-c", "copy", output]
+        return subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+    copy_paced(inputs, output, 0)
+    return 0
+
+
+def download_stream(path, nbytes, rate):
+    print(f"[download] Destination: {path}", flush=True)
+    last = [0.0]
+
+    def progress(written, elapsed):
+        if elapsed - last[0] >= 0.1 or written == nbytes:
+            last[0] = elapsed
+            pct = written * 100.0 / nbytes
+            speed = written / elapsed if elapsed > 0 else 0
+            eta = int((nbytes - written) / speed) if speed > 0 else 0
+            print(f"[download] {pct:5.1f}% of   {human_size(nbytes)} at  {human_size(speed)}/s "
+                  f"ETA {eta // 60:02d}:{eta % 60:02d}", flush=True)
+
+    write_paced(path, nbytes, rate, progress)
+    print(f"[download] 100% of   {human_size(nbytes)} in 00:00:01 at {human_size(rate)}/s", flush=True)
+
+
+def video_info(url, size):
+    """Info JSON rút gọn như yt-dlp -j: format video avc1 1080p + audio m4a"""
+    video_id = url.rsplit("=", 1)[-1]
+    return {
+        'id': video_id, 'duration': 30,
+        'formats': [
+            {'format_id': '137', 'ext': 'mp4', 'vcodec': 'avc1.640028', 'acodec': 'none',
+             'height': 1080, 'fps': 30, 'tbr': 4500, 'filesize': max(1, size * 9 // 10)},
+            {'format_id': '140', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+             'abr': 129, 'filesize': max(1, size // 10)},
+        ],
+    }
+
+
+def flaky_attempt(video_id):
+    """True nếu lần chạy này của video_id vẫn nằm trong số lần lỗi giả lập"""
+    state_dir = os.environ.get("FAKE_YTDLP_STATE_DIR")
+    if not state_dir:
+        return True
+    path = os.path.join(state_dir, f"{video_id}.attempts")
+    try:
+        with open(path, 'r') as f:
+            attempts = int(f.read() or 0)
+    except (OSError, ValueError):
+        attempts = 0
+    with open(path, 'w') as f:
+        f.write(str(attempts + 1))
+    return attempts < env_number("FAKE_YTDLP_FLAKY_TIMES", 1)
+
+
+def main_ytdlp(argv):
+    if "--version" in argv:
+        print("2025.12.08-fake")
+        return 0
+    opts = parse_ytdlp_args(argv)
+    if "-j" in argv or "--dump-json" in argv:
+        size = int(env_number("FAKE_YTDLP_BYTES", 4 * 1024 * 1024))
+        time.sleep(env_number("FAKE_YTDLP_EXTRACT_SECONDS", 0.05) * len(opts['urls']))
+        for url in opts['urls']:
+            print(json.dumps(video_info(url, size)), flush=True)
+        return 0
+    if not opts['output'] or not (opts['url'] or opts['info_json']):
+        print("ERROR: fake yt-dlp cần -o và URL/--load-info-json", file=sys.stderr)
+        return 2
+
+    size = int(env_number("FAKE_YTDLP_BYTES", 4 * 1024 * 1024))
+    rate = env_number("FAKE_YTDLP_RATE", 50 * 1024 * 1024)
+    extract_seconds = env_number("FAKE_YTDLP_EXTRACT_SECONDS", 0.05)
+    failing = {i for i in os.environ.get("FAKE_YTDLP_FAIL_IDS", "").split(",") if i}
+
+    if opts['info_json']:
+        # Đã có info: bỏ qua bước extraction như yt-dlp thật
+        with open(opts['info_json'], 'r', encoding='utf-8') as f:
+            video_id = json.load(f)['id']
+        print(f"[info] Loading info json: {opts['info_json']}", flush=True)
+    else:
+        video_id = opts['url'].rsplit("=", 1)[-1]
+        print(f"[youtube] Extracting URL: {opts['url']}", flush=True)
+        print(f"[youtube] {video_id}: Downloading webpage", flush=True)
+        time.sleep(extract_seconds)
+        print(f"[youtube] {video_id}: Downloading player", flush=True)
+    if video_id in failing:
+        print(f"ERROR: [youtube] {video_id}: Video unavailable. This video is private", file=sys.stderr)
+        return 1
+    if video_id in os.environ.get("FAKE_YTDLP_FLAKY_IDS", "").split(",") and flaky_attempt(video_id):
+        print("ERROR: [download] Got error: HTTP Error 403: Forbidden. Giving up after 10 retries",
+              file=sys.stderr)
+        return 1
+
+    output = opts['output'].replace('%(ext)s', opts['merge_format'])
+    truncate = (video_id in os.environ.get("FAKE_YTDLP_TRUNCATE_IDS", "").split(",")
+                and not opts['extract_audio'] and flaky_attempt(video_id))
+    root, _ = os.path.splitext(output)
+    ffmpeg = find_ffmpeg(opts['ffmpeg_location'])
+
+    if opts['extract_audio']:
+        print(f"[info] {video_id}: Downloading 1 format(s): 251", flush=True)
+        source = f"{root}.webm"
+        download_stream(source, max(1, size // 10), rate)
+        print(f'[ExtractAudio] Destination: {output}', flush=True)
+        code = run_ffmpeg(ffmpeg, [source], output)
+        os.remove(source)
+        return code
+
+    print(f"[info] {video_id}: Downloading 1 format(s): 137+140", flush=True)
+    if video_id in os.environ.get("FAKE_YTDLP_STALL_IDS", "").split(",") and flaky_attempt(video_id):
+        # Kết nối treo: ghi một phần .part rồi không nhận thêm byte nào
+        write_paced(f"{root}.f137.mp4.part", max(1, size // 4), rate)
+        print("[download]  25.0% of ~ 1.00MiB at  Unknown B/s ETA Unknown", flush=True)
+        time.sleep(3600)
+        return 1
+    video_part = f"{root}.f137.mp4"
+    audio_part = f"{root}.f140.m4a"
+    download_stream(video_part, max(1, size * 9 // 10), rate)
+    download_stream(audio_part, max(1, size // 10), rate)
+    print(f'[Merger] Merging formats into "{output}"', flush=True)
+    code = run_ffmpeg(ffmpeg, [video_part, audio_part], output)
+    os.remove(video_part)
+    os.remove(audio_part)
+    if truncate:
+        # Mất kết nối giữa chừng nhưng exit code vẫn 0: chỉ ffprobe mới phát hiện được
+        os.truncate(output, os.path.getsize(output) // 2)
+    return code
+
+
+# ==================== ffmpeg / ffprobe ====================
+def split_segments(source, pattern, segment_seconds):
+    """-f segment: chia file theo số đoạn = thời lượng / segment_time"""
+    duration = env_number("FAKE_FFPROBE_DURATION", 30)
+    count = max(1, int(-(-duration // segment_seconds)))
+    with open(source, "rb") as f:
+        data = f.read()
+    step = -(-len(data) // count) or 1
+    for index in range(count):
+        with open(pattern % index, "wb") as out:
+            out.write(data[index * step:(index + 1) * step])
+    return 0
+
+
+def probe_duration(path, full_size):
+    """Thời lượng theo FAKE_FFPROBE_DURATION, hoặc theo video trên kênh giả lập và kích thước file"""
+    if "FAKE_FFPROBE_DURATION" in os.environ or "_v" not in os.path.basename(path):
+        return env_number("FAKE_FFPROBE_DURATION", 30)
+    from fake_youtube_api import duration_seconds, video_index
+
+    video_id = os.path.splitext(os.path.basename(path))[0].split("_", 1)[1]
+    duration = duration_seconds(video_index(video_id))
+    return duration * min(1.0, os.path.getsize(path) / max(1, full_size))
+
+
+def main_ffprobe(argv):
+    path = argv[-1]
+    if not os.path.exists(path):
+        print(f"{path}: No such file or directory", file=sys.stderr)
+        return 1
+    ext = os.path.splitext(path)[1].lower()
+    size = int(env_number("FAKE_YTDLP_BYTES", 4 * 1024 * 1024))
+    if ext in (".jpg", ".jpeg", ".png", ".webp"):
+        from PIL import Image
+
+        with Image.open(path) as img:
+            width, height = img.size
+        streams = [{'codec_type': 'video', 'codec_name': 'mjpeg', 'avg_frame_rate': '0/0',
+                    'width': width, 'height': height}]
+        fmt = {'format_name': 'image2'}
+    elif ext in (".mp3", ".m4a", ".opus", ".wav", ".flac", ".aac"):
+        streams = [{'codec_type': 'audio', 'codec_name': ext[1:]}]
+        fmt = {'format_name': ext[1:], 'duration': str(probe_duration(path, max(1, size // 10)))}
+    else:
+        source = os.path.basename(path).startswith("source.")
+        codec = (os.environ.get("FAKE_FFPROBE_CODEC", "vp9") if source
+                 else os.environ.get("FAKE_FFPROBE_OUTPUT_CODEC", "h264"))
+        fps = os.environ.get("FAKE_FFPROBE_FPS", "30")
+        streams = [{'codec_type': 'video', 'codec_name': codec, 'avg_frame_rate': f"{fps}/1",
+                    'width': 1920, 'height': 1080},
+                   {'codec_type': 'audio', 'codec_name': 'aac'}]
+        fmt = {'format_name': 'matroska,webm' if ext == ".mkv" else 'mov,mp4,m4a,3gp,3g2,mj2',
+               'duration': str(probe_duration(path, size))}
+    print(json.dumps({'streams': streams, 'format': fmt}))
+    return 0
+
+
+def main_ffmpeg(argv):
+    if "-version" in argv or "--version" in argv:
+        print("ffmpeg version 7.1-fake Copyright (c) 2000-2025 the FFmpeg developers")
+        return 0
+    inputs = [argv[i + 1] for i, a in enumerate(argv[:-1]) if a == "-i"]
+    if not inputs or argv[-1].startswith("-"):
+        print("fake ffmpeg: thiếu input/output", file=sys.stderr)
+        return 1
+    output = argv[-1]
+    rate = env_number("FAKE_FFMPEG_RATE", 200 * 1024 * 1024)
+    if "concat" in argv:
+        # -f concat -i list.txt: danh sách file dạng file '<path>'
+        with open(inputs[0], 'r', encoding='utf-8') as f:
+            listed = [line.strip()[6:-1].replace("'\\''", "'") for line in f if line.startswith("file '")]
+        inputs = listed + inputs[1:]
+    if "segment" in argv:
+        return split_segments(inputs[0], output, float(argv[argv.index("-segment_time") + 1]))
+    written = copy_paced(inputs, output, rate)
+    print(f"frame=  900 fps=300 q=-1.0 Lsize={written // 1024}kB time=00:00:30.00 "
+          "bitrate=N/A speed=10x", file=sys.stderr)
+    return 0
+
@@ -0,0 +1,254 @@
+"""
+Server giả lập YouTube Data API v3 cho benchmark (chạy offline)
+
+Hỗ trợ các endpoint mà YouTubeChannelDownloader dùng:
+    /youtube/v3/search          -> luôn trả về channel UCbenchmark
+    /youtube/v3/channels        -> uploads playlist UUbenchmark
+    /youtube/v3/playlistItems   -> phân trang 50 video/trang (pageToken)
+    /youtube/v3/videos          -> duration + viewCount cho tối đa 50 id
+    /thumb/<video_id>.jpg       -> ảnh JPEG 1280x720 (sinh một lần, dùng lại)
+
+Chạy riêng:
+    python benchmarks/fake_youtube_api.py --videos 5000 --latency 0.05
+Dòng đầu tiên in ra stdout là base URL (dùng cho NTB_YOUTUBE_API_BASE).
+"""
+
+import io
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+CHANNEL_ID = "UCbenchmark"
+UPLOADS_PLAYLIST_ID = "UUbenchmark"
+PAGE_SIZE = 50
+
+
+def make_video_id(index):
+    """ID 11 ký tự giống YouTube, cố định theo index"""
+    return f"v{index:010d}"
+
+
+def video_index(video_id):
+    try:
+        return int(video_id[1:])
+    except ValueError:
+        return -1
+
+
+def duration_seconds(index):
+    # Trải đều từ 30 giây đến ~3 giờ
+    return 30 + (index * 7919) % (3 * 3600)
+
+
+def make_thumbnail_jpeg(width=1280, height=720):
+    """Sinh ảnh JPEG (có gradient để kích thước gần với thumbnail thật)"""
+    from PIL import Image
+
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+class FakeChannel:
+    """Kênh tổng hợp có video_count video, dữ liệu sinh theo index (không lưu list)"""
+
+    def __init__(self, video_count, base_url=""):
+        self.video_count = video_count
+        self.base_url = base_url
+        self.newest = datetime(2025, 12, 27, tzinfo=timezone.utc)
+
+    def published_at(self, index):
+        return (self.newest - timedelta(hours=index * 7)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def duration(self, index):
+        seconds = duration_seconds(index)
+        return f"PT{seconds // 3600}H{seconds % 3600 // 60}M{seconds % 60}S"
+
+    def view_count(self, index):
+        return (index * 104729) % 10_000_000
+
+    def thumbnails(self, video_id):
+        url = f"{self.base_url}/thumb/{video_id}.jpg"
+        return {
+            'default': {'url': url, 'width': 120, 'height': 90},
+            'medium': {'url': url, 'width': 320, 'height': 180},
+            'high': {'url': url, 'width': 480, 'height': 360},
+            'maxres': {'url': url, 'width': 1280, 'height': 720},
+        }
+
+    def playlist_page(self, offset, max_results):
+        end = min(self.video_count, offset + max_results)
+        items = []
+        for index in range(offset, end):
+            video_id = make_video_id(index)
+            items.append({
+                'kind': 'youtube#playlistItem',
+                'snippet': {
+                    'publishedAt': self.published_at(index),
+                    'channelId': CHANNEL_ID,
+                    'title': f"Benchmark video #{index} – tiêu đề thử nghiệm",
+                    'thumbnails': self.thumbnails(video_id),
+                    'playlistId': UPLOADS_PLAYLIST_ID,
+                    'position': index,
+                },
+                'contentDetails': {'videoId': video_id, 'videoPublishedAt': self.published_at(index)},
+            })
+        page = {
+            'kind': 'youtube#playlistItemListResponse',
+            'items': items,
+            'pageInfo': {'totalResults': self.video_count, 'resultsPerPage': max_results},
+        }
+        if end < self.video_count:
+            page['nextPageToken'] = f"p{end}"
+        return page
+
+    def video_details(self, video_ids, parts=('contentDetails', 'statistics')):
+        items = []
+        for video_id in video_ids:
+            index = video_index(video_id)
+            if not 0 <= index < self.video_count:
+                continue
+            item = {'kind': 'youtube#video', 'id': video_id}
+            if 'snippet' in parts:
+                item['snippet'] = {'publishedAt': self.published_at(index), 'channelId': CHANNEL_ID,
+                                   'title': f"Benchmark video #{index} – tiêu đề thử nghiệm",
+                                   'thumbnails': self.thumbnails(video_id)}
+            if 'contentDetails' in parts:
+                item['contentDetails'] = {'duration': self.duration(index)}
+            if 'statistics' in parts:
+                item['statistics'] = {'viewCount': str(self.view_count(index))}
+            items.append(item)
+        return {'kind': 'youtube#videoListResponse', 'items': items}
+
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_payload(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_payload(status, json.dumps(payload).encode('utf-8'), "application/json; charset=utf-8")
+
+    def do_GET(self):
+        server = self.server
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        path = parsed.path.rstrip("/")
+        endpoint = path.rsplit("/", 1)[-1]
+
+        counter = endpoint if path.startswith("/youtube/v3") else "thumbnail"
+        with server.stats_lock:
+            server.stats[counter] = server.stats.get(counter, 0) + 1
+
+        if path.startswith("/thumb/"):
+            self.send_payload(200, server.thumbnail, "image/jpeg")
+            return
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        key = params.get('key')
+        if not key:
+            self.send_json({'error': {'code': 403, 'message': 'API key missing'}}, status=403)
+            return
+        if server.quota:
+            # Mỗi key chỉ được server.quota request, sau đó trả lỗi quotaExceeded như API thật
+            with server.stats_lock:
+                used = server.key_usage[key] = server.key_usage.get(key, 0) + 1
+            if used > server.quota:
+                self.send_json({'error': {'code': 403, 'message': 'The request cannot be completed because you have exceeded your quota.',
+                                          'errors': [{'reason': 'quotaExceeded', 'domain': 'youtube.quota'}]}},
+                               status=403)
+                return
+
+        channel = server.channel
+        if path == "/youtube/v3/search":
+            self.send_json({'items': [{'snippet': {'channelId': CHANNEL_ID}}]})
+        elif path == "/youtube/v3/channels":
+            self.send_json({'items': [{'id': CHANNEL_ID, 'contentDetails': {
+                'relatedPlaylists': {'uploads': UPLOADS_PLAYLIST_ID}}}]})
+        elif path == "/youtube/v3/playlistItems":
+            token = params.get('pageToken', 'p0')
+            offset = int(token[1:]) if token.startswith('p') and token[1:].isdigit() else 0
+            max_results = min(PAGE_SIZE, int(params.get('maxResults', 5)))
+            self.send_json(channel.playlist_page(offset, max_results))
+        elif path == "/youtube/v3/videos":
+            ids = [i for i in params.get('id', '').split(',') if i][:PAGE_SIZE]
+            self.send_json(channel.video_details(ids, params.get('part', '').split(',')))
+        else:
+            self.send_json({'error': {'code': 404, 'message': f'Unknown endpoint {path}'}}, status=404)
+
+
+class FakeYouTubeAPI:
+    """Chạy server giả lập trong thread nền"""
+
+    def __init__(self, video_count, latency=0.0, host="127.0.0.1", port=0, quota=0):
+        self.httpd = ThreadingHTTPServer((host, port), FakeAPIHandler)
+        self.httpd.daemon_threads = True
+        host, port = self.httpd.server_address[:2]
+        self.base_url = f"http://{host}:{port}"
+        self.httpd.channel = FakeChannel(video_count, self.base_url)
+        self.httpd.latency = latency
+        self.httpd.quota = quota
+        self.httpd.key_usage = {}
+        self.httpd.thumbnail = make_thumbnail_jpeg()
+        self.httpd.stats = {}
+        self.httpd.stats_lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def api_base(self):
+        return f"{self.base_url}/youtube/v3"
+
+    @property
+    def stats(self):
+        with self.httpd.stats_lock:
+            return dict(self.httpd.stats)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập YouTube Data API v3")
+    parser.add_argument("--videos", type=int, default=1000, help="Số video của kênh giả lập")
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ (giây) mỗi request API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--quota", type=int, default=0, help="Số request tối đa mỗi key (0 = không giới hạn)")
+    args = parser.parse_args()
+
+    api = FakeYouTubeAPI(args.videos, args.latency, args.host, args.port, args.quota)
+    print(api.api_base, flush=True)
+    try:
+        api.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # In thống kê request ra stderr để runner đọc khi dừng server
+        print(json.dumps(api.stats), file=sys.stderr, flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,280 @@
+"""
+Micro-benchmark + kiểm tra hồi quy cho các hàm chạy theo từng video
+
+Đo thời gian (ns/video) và bộ nhớ đỉnh (byte/video, tracemalloc) của:
+    parse_duration, get_filename_base, get_thumbnail_url,
+    playlist_item_to_video (dựng self.videos), collect_video_details +
+    merge_video_details (ghép kết quả videos API), filter_videos
+trên catalog tổng hợp 1k/10k/100k/1M video.
+
+So với baseline lưu trong benchmarks/micro_baseline.json; thoát với mã 1 nếu
+có case chậm/tốn bộ nhớ hơn ngưỡng cho phép. Thời gian được chuẩn hoá theo một
+vòng lặp hiệu chuẩn để baseline dùng được trên máy khác.
+
+Ví dụ:
+    python benchmarks/micro_benchmark.py                     # so với baseline
+    python benchmarks/micro_benchmark.py --sizes 1k,10k      # chạy nhanh
+    python benchmarks/micro_benchmark.py --sizes 1k,10k,100k,1m   # đủ 4 mức
+    python benchmarks/micro_benchmark.py --update-baseline   # ghi lại baseline
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from youtube_channel_downloader import YouTubeChannelDownloader  # noqa: E402
+
+BASELINE_FILE = os.path.join(HERE, "micro_baseline.json")
+SIZE_LABELS = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+
+# ==================== Dữ liệu tổng hợp ====================
+def make_dates(count=4000):
+    """Danh sách ngày đăng dạng ISO (dùng xoay vòng để sinh nhanh)"""
+    dates = []
+    for i in range(count):
+        year = 2010 + i // 360
+        month = 1 + (i // 30) % 12
+        day = 1 + i % 28
+        dates.append(f"{year:04d}-{month:02d}-{day:02d}T12:00:00Z")
+    return dates
+
+
+DATES = make_dates()
+
+
+def video_id(index):
+    return f"v{index:010d}"
+
+
+def iso_duration(index):
+    seconds = 30 + (index * 7919) % (3 * 3600)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"PT{hours}H{minutes}M{secs}S"
+    return f"PT{minutes}M{secs}S" if minutes else f"PT{secs}S"
+
+
+def thumbnails(vid, index):
+    base = f"https://i.ytimg.com/vi/{vid}"
+    thumbs = {'high': {'url': f"{base}/hqdefault.jpg"}}
+    if index % 3:
+        thumbs['maxres'] = {'url': f"{base}/maxresdefault.jpg"}
+    return thumbs
+
+
+def playlist_items(size):
+    items = []
+    for i in range(size):
+        vid = video_id(i)
+        items.append({
+            'snippet': {'title': f"Video số {i}", 'publishedAt': DATES[i % len(DATES)],
+                        'thumbnails': thumbnails(vid, i)},
+            'contentDetails': {'videoId': vid},
+        })
+    return items
+
+
+def detail_items(size):
+    # Bỏ sót ~1% video để nhánh "không có details" cũng được đo
+    return [{'id': video_id(i), 'contentDetails': {'duration': iso_duration(i)},
+             'statistics': {'viewCount': str((i * 104729) % 10_000_000)}}
+            for i in range(size) if i % 100 != 99]
+
+
+def videos(size, with_details=True):
+    result = []
+    for i in range(size):
+        vid = video_id(i)
+        video = {'id': vid, 'title': f"Video số {i}", 'published_at': DATES[i % len(DATES)],
+                 'thumbnails': thumbnails(vid, i)}
+        if with_details:
+            video['duration'] = 30 + (i * 7919) % (3 * 3600)
+            video['views'] = (i * 104729) % 10_000_000
+        result.append(video)
+    return result
+
+
+# ==================== Các case ====================
+def make_app():
+    return YouTubeChannelDownloader(None, {
+        'use_date_filter': True, 'date_from': '2012-01-01', 'date_to': '2018-12-31',
+        'use_duration_filter': True, 'duration_min': '1', 'duration_max': '120',
+        'use_view_filter': True, 'view_min': '1000', 'view_max': '5000000',
+    })
+
+
+def case_parse_duration(app, size):
+    durations = [iso_duration(i) for i in range(size)]
+    return lambda: [app.parse_duration(d) for d in durations]
+
+
+def case_get_filename_base(app, size):
+    data = videos(size, with_details=False)
+    return lambda: [app.get_filename_base(v) for v in data]
+
+
+def case_get_thumbnail_url(app, size):
+    data = videos(size, with_details=False)
+    return lambda: [app.get_thumbnail_url(v) for v in data]
+
+
+def case_build_videos(app, size):
+    items = playlist_items(size)
+    return lambda: [app.playlist_item_to_video(item) for item in items]
+
+
+def case_merge_details(app, size):
+    items = detail_items(size)
+    data = videos(size, with_details=False)
+    return lambda: app.merge_video_details(data, app.collect_video_details(items, {}))
+
+
+def case_filter_videos(app, size):
+    app.videos = videos(size)
+    return app.filter_videos
+
+
+CASES = {
+    'parse_duration': case_parse_duration,
+    'get_filename_base': case_get_filename_base,
+    'get_thumbnail_url': case_get_thumbnail_url,
+    'build_videos': case_build_videos,
+    'merge_details': case_merge_details,
+    'filter_videos': case_filter_videos,
+}
+
+
+# ==================== Đo ====================
+def calibrate():
+    """Thời gian (giây) của vòng lặp Python cố định, dùng để chuẩn hoá giữa các máy"""
+    best = float('inf')
+    for _ in range(5):
+        started = time.perf_counter()
+        total = 0
+        for i in range(300_000):
+            total += i * i % 7
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure_case(app, build, size):
+    run = build(app, size)
+    repeats = max(1, min(20, 200_000 // size))
+    run()  # warm-up: regex cache, cấp phát lần đầu
+    gc.collect()
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - started)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result, run
+    app.videos = []
+    gc.collect()
+    return {'ns_per_video': best * 1e9 / size, 'bytes_per_video': peak / size, 'seconds': best}
+
+
+def compare(results, baseline, calibration, time_tolerance, memory_tolerance):
+    """Trả về danh sách case vượt ngưỡng so với baseline"""
+    regressions = []
+    scale = calibration / baseline.get('calibration_seconds', calibration)
+    for key, current in results.items():
+        base = baseline.get('cases', {}).get(key)
+        if not base:
+            continue
+        allowed_ns = base['ns_per_video'] * scale * (1 + time_tolerance)
+        allowed_bytes = base['bytes_per_video'] * (1 + memory_tolerance) + 64
+        if current['ns_per_video'] > allowed_ns:
+            regressions.append(f"{key}: {current['ns_per_video']:.0f} ns/video > {allowed_ns:.0f} cho phép")
+        if current['bytes_per_video'] > allowed_bytes:
+            regressions.append(f"{key}: {current['bytes_per_video']:.0f} B/video > {allowed_bytes:.0f} cho phép")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark các hàm xử lý theo từng video")
+    parser.add_argument("--sizes", default="1k,10k,100k",
+                        help="Kích thước catalog: 1k,10k,100k,1m (1m mất vài phút)")
+    parser.add_argument("--cases", default=",".join(CASES), help="Danh sách case cần chạy")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true", help="Ghi kết quả làm baseline mới")
+    parser.add_argument("--time-tolerance", type=float, default=1.0,
+                        help="Cho phép chậm hơn (1.0 = gấp đôi; máy dùng chung dao động khá lớn)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Cho phép tốn bộ nhớ hơn")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    sizes = [s.strip().lower() for s in args.sizes.split(",") if s.strip()]
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [s for s in sizes if s not in SIZE_LABELS] + [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"Không hỗ trợ: {', '.join(unknown)}")
+
+    app = make_app()
+    app.log = lambda message: None
+    calibration = calibrate()
+
+    results = {}
+    print(f"{'case':<20}{'size':>6}{'ns/video':>12}{'B/video':>10}{'total s':>10}")
+    for case in cases:
+        for label in sizes:
+            measured = measure_case(app, CASES[case], SIZE_LABELS[label])
+            results[f"{case}@{label}"] = measured
+            print(f"{case:<20}{label:>6}{measured['ns_per_video']:>12.0f}"
+                  f"{measured['bytes_per_video']:>10.0f}{measured['seconds']:>10.3f}", flush=True)
+
+    report = {'calibration_seconds': calibration, 'python': sys.version.split()[0], 'cases': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {'cases': {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        # Chuẩn hoá kết quả mới về calibration của baseline cũ để các case không chạy lại vẫn hợp lệ
+        scale = baseline.get('calibration_seconds', calibration) / calibration
+        for key, value in results.items():
+            baseline['cases'][key] = {'ns_per_video': round(value['ns_per_video'] * scale, 1),
+                                      'bytes_per_video': round(value['bytes_per_video'], 1)}
+        baseline.setdefault('calibration_seconds', calibration)
+        baseline['python'] = report['python']
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Đã cập nhật baseline: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Chưa có baseline, chạy với --update-baseline để tạo.")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, calibration, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print("❌ Hồi quy hiệu năng:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    print("✅ Không có hồi quy so với baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
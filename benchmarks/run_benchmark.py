@@ -0,0 +1,196 @@
+"""
+Benchmark end-to-end cho quét kênh và tải video, chạy hoàn toàn offline (Linux)
+
+Dùng server giả lập YouTube Data API (fake_youtube_api.py) chạy ở process riêng
+và yt-dlp/ffmpeg giả lập (fake_bin/), rồi chạy đúng đường quét/tải của
+YouTubeChannelDownloader ở chế độ headless.
+
+Ví dụ:
+    python benchmarks/run_benchmark.py --videos 5000 --download 40 --threads 4
+    python benchmarks/run_benchmark.py --videos 20000 --latency 0.03 --download 0 --json scan.json
+
+Kết quả: thời gian quét, video/giờ, CPU (process + process con) và peak RSS.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import resource
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HERE)
+FAKE_BIN = os.path.join(HERE, "fake_bin")
+
+
+def start_fake_api(video_count, latency):
+    """Chạy server giả lập ở process riêng để CPU của server không tính vào app"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(HERE, "fake_youtube_api.py"),
+         "--videos", str(video_count), "--latency", str(latency)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    api_base = process.stdout.readline().strip()
+    if not api_base:
+        process.kill()
+        raise RuntimeError(f"Không khởi động được server giả lập: {process.stderr.read()}")
+    return process, api_base
+
+
+def stop_fake_api(process):
+    """Dừng server và đọc thống kê request (in ra stderr khi dừng)"""
+    process.send_signal(signal.SIGINT)
+    try:
+        _, err = process.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        return {}
+    for line in reversed(err.strip().splitlines()):
+        try:
+            return json.loads(line)
+        except ValueError:
+            continue
+    return {}
+
+
+def cpu_seconds(usage):
+    return usage.ru_utime + usage.ru_stime
+
+
+def measure(func):
+    """Chạy func, trả về (wall, cpu process, cpu process con)"""
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    func()
+    wall = time.perf_counter() - started
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (wall,
+            cpu_seconds(self_after) - cpu_seconds(self_before),
+            cpu_seconds(children_after) - cpu_seconds(children_before))
+
+
+def directory_size(path):
+    total = 0
+    count = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+            count += 1
+    return count, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark quét/tải offline cho YouTubeChannelDownloader")
+    parser.add_argument("--videos", type=int, default=2000, help="Số video của kênh giả lập")
+    parser.add_argument("--latency", type=float, default=0.0, help="Độ trễ mỗi request API (giây)")
+    parser.add_argument("--download", type=int, default=20, help="Số video tải thử (0 = chỉ quét)")
+    parser.add_argument("--threads", type=int, default=3, help="Số luồng tải")
+    parser.add_argument("--assets", default="video,thumbnail,title",
+                        help="Loại tải: video,audio,thumbnail,title")
+    parser.add_argument("--video-mb", type=float, default=4.0, help="Kích thước mỗi video giả lập (MB)")
+    parser.add_argument("--rate-mb", type=float, default=50.0, help="Tốc độ tải giả lập mỗi job (MB/s)")
+    parser.add_argument("--extract-seconds", type=float, default=0.05, help="Thời gian extraction giả lập")
+    parser.add_argument("--no-prefetch", action="store_true", help="Tắt lấy trước info-json (so sánh)")
+    parser.add_argument("--no-verify", action="store_true", help="Tắt kiểm tra file bằng ffprobe (so sánh)")
+    parser.add_argument("--output-dir", help="Thư mục lưu (mặc định: thư mục tạm, xoá sau khi chạy)")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    parser.add_argument("--verbose", action="store_true", help="In log của tool")
+    args = parser.parse_args()
+
+    server, api_base = start_fake_api(args.videos, args.latency)
+    output_dir = args.output_dir or tempfile.mkdtemp(prefix="ntb_bench_")
+
+    # Cấu hình trước khi import để YOUTUBE_API_BASE và tool giả lập có hiệu lực
+    os.environ["NTB_YOUTUBE_API_BASE"] = api_base
+    os.environ["FAKE_YTDLP_BYTES"] = str(int(args.video_mb * 1024 * 1024))
+    os.environ["FAKE_YTDLP_RATE"] = str(int(args.rate_mb * 1024 * 1024))
+    os.environ["FAKE_YTDLP_EXTRACT_SECONDS"] = str(args.extract_seconds)
+    sys.path.insert(0, REPO_ROOT)
+
+    try:
+        from youtube_channel_downloader import YouTubeChannelDownloader
+
+        assets = {a.strip() for a in args.assets.split(",") if a.strip()}
+        app = YouTubeChannelDownloader(None, {
+            'api_key': 'benchmark',
+            'channel_url': 'https://www.youtube.com/@benchmark',
+            'download_video': 'video' in assets,
+            'download_audio': 'audio' in assets,
+            'download_thumbnail': 'thumbnail' in assets,
+            'download_title': 'title' in assets,
+            'thread_count': str(args.threads),
+            'output_dir': output_dir,
+            # Archive riêng cho mỗi lần chạy để các lần benchmark không bỏ qua video của nhau
+            'download_archive': os.path.join(output_dir, "_archive.txt"),
+            'prefetch_info': not args.no_prefetch,
+            'verify_downloads': not args.no_verify,
+        })
+        app.api_quota_file = os.path.join(output_dir, "_api_quota.json")
+        app.api_cache_dir = os.path.join(output_dir, "_api_cache")
+        app.info_cache_dir = os.path.join(output_dir, "_info_cache")
+        app.ytdlp_path = os.path.join(FAKE_BIN, "yt-dlp")
+        app.ffmpeg_path = os.path.join(FAKE_BIN, "ffmpeg")
+        if not args.verbose:
+            app.log = lambda message: None
+
+        report = {'videos_in_channel': args.videos, 'api_latency': args.latency}
+
+        # Đi qua run_with_profiling như khi bấm nút trên UI (NTB_PROFILE=1 để bật profiling)
+        scan_wall, scan_cpu, _ = measure(
+            lambda: app.run_with_profiling("scan", app._scan_channel_thread))
+        scanned = len(app.videos)
+        report['scan'] = {
+            'seconds': round(scan_wall, 3),
+            'videos': scanned,
+            'videos_per_second': round(scanned / scan_wall, 1) if scan_wall else 0,
+            'cpu_seconds': round(scan_cpu, 3),
+            'stages': app.metrics.summary()['stages'],
+        }
+
+        if args.download > 0 and scanned:
+            app.videos = app.videos[:args.download]
+
+            def run_download():
+                app.is_downloading = True
+                app.run_with_profiling("download", app._download_thread)
+
+            dl_wall, dl_cpu, dl_children_cpu = measure(run_download)
+            files, total_bytes = directory_size(output_dir)
+            done = len(app.videos)
+            report['download'] = {
+                'seconds': round(dl_wall, 3),
+                'videos': done,
+                'videos_per_hour': round(done / dl_wall * 3600, 1) if dl_wall else 0,
+                'files': files,
+                'megabytes': round(total_bytes / 1024 / 1024, 2),
+                'cpu_seconds': round(dl_cpu, 3),
+                'cpu_seconds_children': round(dl_children_cpu, 3),
+                'stages': app.metrics.summary()['stages'],
+            }
+
+        # ru_maxrss trên Linux tính bằng KB
+        report['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        report['children_peak_rss_mb'] = round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+    finally:
+        report_requests = stop_fake_api(server)
+        if not args.output_dir:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    report['api_requests'] = report_requests
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            f.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,116 @@
+"""
+Chạy thử chế độ coordinator/worker trên một máy Linux, hoàn toàn offline
+
+Coordinator (--coordinator) quét kênh giả lập và đưa job vào hàng đợi SQLite;
+nhiều process worker (--worker) cùng nhận job. Một worker bị SIGKILL giữa chừng
+để kiểm tra lease hết hạn được trả lại hàng đợi và worker khác tải tiếp.
+
+Ví dụ:
+    python benchmarks/run_distributed.py --videos 300 --download 40 --workers 3
+    python benchmarks/run_distributed.py --workers 4 --threads 2 --kill-after 0
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HERE)
+FAKE_BIN = os.path.join(HERE, "fake_bin")
+APP = os.path.join(REPO_ROOT, "youtube_channel_downloader.py")
+
+sys.path.insert(0, HERE)
+sys.path.insert(0, REPO_ROOT)
+
+from run_benchmark import start_fake_api, stop_fake_api  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy thử coordinator + nhiều worker trên một máy")
+    parser.add_argument("--videos", type=int, default=300, help="Số video của kênh giả lập")
+    parser.add_argument("--download", type=int, default=30, help="Số video đưa vào hàng đợi")
+    parser.add_argument("--workers", type=int, default=3, help="Số process worker")
+    parser.add_argument("--threads", type=int, default=2, help="Số luồng mỗi worker")
+    parser.add_argument("--lease", type=float, default=3.0, help="Thời hạn lease (giây)")
+    parser.add_argument("--kill-after", type=float, default=1.5,
+                        help="SIGKILL worker đầu tiên sau N giây (0 = không kill)")
+    parser.add_argument("--video-mb", type=float, default=2.0, help="Kích thước mỗi video giả lập (MB)")
+    parser.add_argument("--rate-mb", type=float, default=8.0, help="Tốc độ tải giả lập mỗi job (MB/s)")
+    parser.add_argument("--output-dir", help="Thư mục làm việc (mặc định: thư mục tạm, xoá sau khi chạy)")
+    args = parser.parse_args()
+
+    server, api_base = start_fake_api(args.videos, 0.0)
+    work_dir = args.output_dir or tempfile.mkdtemp(prefix="ntb_dist_")
+    os.makedirs(work_dir, exist_ok=True)
+    queue_path = os.path.join(work_dir, "queue.db")
+    output_dir = os.path.join(work_dir, "downloads")
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": FAKE_BIN + os.pathsep + env.get("PATH", ""),
+        "NTB_YOUTUBE_API_BASE": api_base,
+        "FAKE_YTDLP_BYTES": str(int(args.video_mb * 1024 * 1024)),
+        "FAKE_YTDLP_RATE": str(int(args.rate_mb * 1024 * 1024)),
+    })
+    # Lọc theo ngày đăng để lấy khoảng N video mới nhất của kênh giả lập (lọc theo ngày nên có thể dư vài video)
+    from fake_youtube_api import FakeChannel
+    channel = FakeChannel(args.videos)
+    newest = channel.published_at(0)[:10]
+    oldest = channel.published_at(max(0, args.download - 1))[:10]
+    settings = {
+        'api_key': 'benchmark',
+        'channel_url': 'https://www.youtube.com/@benchmark',
+        'download_video': True, 'download_thumbnail': True, 'download_title': True,
+        'use_date_filter': True, 'date_from': oldest, 'date_to': newest,
+        'thread_count': str(args.threads),
+        'output_dir': output_dir,
+        'download_archive': os.path.join(work_dir, "_archive.txt"),
+        'prefetch_info': False,
+    }
+    settings_path = os.path.join(work_dir, "settings.json")
+    with open(settings_path, 'w', encoding='utf-8') as f:
+        json.dump(settings, f)
+
+    base = [sys.executable, APP, "--settings", settings_path, "--lease", str(args.lease)]
+    report = {}
+    try:
+        started = time.perf_counter()
+        subprocess.run(base + ["--coordinator", queue_path, "--no-wait"], env=env,
+                       check=True, stdout=subprocess.DEVNULL)
+        report['enqueue_seconds'] = round(time.perf_counter() - started, 3)
+
+        started = time.perf_counter()
+        workers = [subprocess.Popen(base + ["--worker", queue_path, "--worker-id", f"w{i}"], env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                   for i in range(args.workers)]
+        if args.kill_after > 0:
+            time.sleep(args.kill_after)
+            workers[0].kill()
+            report['killed'] = "w0"
+        for worker in workers:
+            worker.wait()
+        report['download_seconds'] = round(time.perf_counter() - started, 3)
+
+        from youtube_channel_downloader import JobQueue
+        queue = JobQueue(queue_path)
+        report['queue'] = queue.counts()
+        report['mp4_files'] = len([n for n in os.listdir(output_dir) if n.endswith(".mp4")])
+    finally:
+        stop_fake_api(server)
+        if not args.output_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(report, indent=2))
+    counts = report['queue']
+    ok = not counts['queued'] and not counts['leased'] and counts['done'] == report['mp4_files']
+    print("✅ Mọi job đã xong" if ok else "❌ Hàng đợi chưa xong hoặc thiếu file")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+"""
+Kiểm tra thời gian khởi động so với ngân sách
+
+Mỗi lần đo chạy một process Python mới: import youtube_channel_downloader và
+dựng app (headless, hoặc cửa sổ Tk thật nếu có --gui và có màn hình), rồi kiểm tra:
+    - thời gian (median) không vượt ngân sách
+    - requests / PIL / concurrent.futures chưa bị import
+    - không có lệnh pip nào bị gọi lúc import
+
+Ví dụ:
+    python benchmarks/startup_check.py
+    python benchmarks/startup_check.py --runs 10 --budget 0.5 --gui
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(HERE)
+
+PROBE = r"""
+import json, sys, time, subprocess
+started = time.perf_counter()
+calls = []
+_original = subprocess.Popen.__init__
+def _record(self, args, *a, **kw):
+    calls.append(args if isinstance(args, str) else ' '.join(map(str, args)))
+    _original(self, args, *a, **kw)
+subprocess.Popen.__init__ = _record
+
+sys.path.insert(0, sys.argv[1])
+import youtube_channel_downloader as app_module
+if sys.argv[2] == 'gui':
+    import tkinter as tk
+    root = tk.Tk()
+    app = app_module.YouTubeChannelDownloader(root)
+    root.update()
+    elapsed = time.perf_counter() - app_module.STARTUP_STARTED
+    root.destroy()
+else:
+    app_module.YouTubeChannelDownloader(None, {})
+    elapsed = time.perf_counter() - started
+heavy = [m for m in ('requests', 'PIL.Image', 'concurrent.futures') if m in sys.modules]
+print(json.dumps({'seconds': elapsed, 'heavy_modules': heavy, 'subprocess_calls': calls}))
+"""
+
+
+def probe(mode):
+    out = subprocess.run([sys.executable, "-c", PROBE, REPO_ROOT, mode],
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian khởi động của YouTubeChannelDownloader")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, help="Ngân sách (giây), mặc định theo NTB_STARTUP_BUDGET hoặc 1.0")
+    parser.add_argument("--gui", action="store_true", help="Dựng cửa sổ Tk thật (cần màn hình)")
+    args = parser.parse_args()
+
+    budget = args.budget or float(os.environ.get("NTB_STARTUP_BUDGET", "1.0"))
+    mode = "gui" if args.gui else "headless"
+    results = [probe(mode) for _ in range(args.runs)]
+    times = [r['seconds'] for r in results]
+    median = statistics.median(times)
+
+    problems = []
+    if median > budget:
+        problems.append(f"median {median:.3f}s vượt ngân sách {budget:.3f}s")
+    heavy = sorted({m for r in results for m in r['heavy_modules']})
+    if heavy:
+        problems.append(f"import sớm: {', '.join(heavy)}")
+    calls = sorted({c for r in results for c in r['subprocess_calls']})
+    if calls:
+        problems.append(f"gọi subprocess lúc khởi động: {'; '.join(calls)}")
+
+    print(f"Khởi động ({mode}, {args.runs} lần): median {median:.3f}s | "
+          f"min {min(times):.3f}s | max {max(times):.3f}s | ngân sách {budget:.3f}s")
+    if problems:
+        for line in problems:
+            print(f"❌ {line}")
+        return 1
+    print("✅ Đạt ngân sách khởi động")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
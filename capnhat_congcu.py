@@ -7,11 +7,16 @@ import sys
 import json
 import time
 import shutil
+import zlib
+import struct
 import zipfile
+import hashlib
 import platform
 import subprocess
+import threading
 import urllib.request
 import urllib.error
+from concurrent.futures import ThreadPoolExecutor
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 
@@ -22,6 +27,19 @@ FFPLAY_EXE = "ffplay.exe"
 
 # URL ổn định cho yt-dlp (Windows exe)
 YTDLP_DIRECT_URL = "https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp.exe"
+YTDLP_LATEST_API = "https://api.github.com/repos/yt-dlp/yt-dlp/releases/latest"
+
+# Tải song song nhiều đoạn (HTTP Range) cho file lớn, có thể tiếp tục khi bị ngắt
+DOWNLOAD_CONNECTIONS = 4
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+DOWNLOAD_RETRIES = 3
+CHUNK_SIZE = 1024 * 1024
+# Lưu tiến độ từng đoạn định kỳ để cả khi bị kill/mất điện vẫn tải tiếp được
+CHECKPOINT_SECONDS = 2.0
+
+# Lưu phiên bản đã cài, id asset và ETag/Last-Modified để lần sau chỉ hỏi có điều kiện
+STATE_FILE = os.path.join(HERE, "_capnhat_state.json")
+state_lock = threading.Lock()
 
 # Ưu tiên lấy ffmpeg từ GitHub API (BtbN), fallback sang gyan.dev nếu lỗi
 BTBN_LATEST_API = "https://api.github.com/repos/BtbN/FFmpeg-Builds/releases/latest"
@@ -50,53 +68,341 @@ def safe_remove(path: str) -> None:
         raise RuntimeError(f"Không xoá được file: {path} | Lỗi: {e}")
 
 
-def download_file(url: str, dest_path: str, desc: str = "") -> None:
-    tmp_path = dest_path + ".download"
-    safe_remove(tmp_path)
-
+def http_open(url: str, start: int | None = None, end: int | None = None, timeout: int = 60):
     headers = {
         "User-Agent": "Mozilla/5.0",
         "Accept": "*/*",
     }
-    req = urllib.request.Request(url, headers=headers)
+    if start is not None:
+        headers["Range"] = f"bytes={start}-" + (str(end) if end is not None else "")
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+
+
+def probe_download(url: str) -> tuple[dict, object]:
+    """
+    Hỏi server bằng Range: bytes=0-0 để biết tổng dung lượng, có hỗ trợ Range không và ETag.
+    Server bỏ qua Range (trả 200) thì giữ nguyên response để tải luôn, không phải mở lại.
+    """
+    resp = http_open(url, 0, 0, timeout=30)
+    headers = resp.headers
+    info = {
+        "ranges": resp.status == 206,
+        "size": None,
+        "etag": headers.get("ETag") or headers.get("Last-Modified") or "",
+    }
+    content_range = headers.get("Content-Range", "")
+    if resp.status == 206:
+        total = content_range.rsplit("/", 1)[-1]
+        info["size"] = int(total) if total.isdigit() else None
+        resp.close()
+        return info, None
+    if headers.get("Content-Length", "").isdigit():
+        info["size"] = int(headers["Content-Length"])
+    return info, resp
+
+
+class DownloadProgress:
+    """Cộng dồn số byte từ nhiều luồng, in tiến độ tối đa 5 lần/giây
+
+    checkpoint (nếu có) được gọi mỗi CHECKPOINT_SECONDS, trong lock nên không chạy chồng nhau.
+    """
+
+    def __init__(self, total: int | None, done: int = 0, checkpoint=None):
+        self.total = total
+        self.done = done
+        self.last_print = 0.0
+        self.checkpoint = checkpoint
+        self.last_checkpoint = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, n: int) -> None:
+        with self.lock:
+            self.done += n
+            now = time.time()
+            if self.checkpoint and now - self.last_checkpoint >= CHECKPOINT_SECONDS:
+                self.last_checkpoint = now
+                self.checkpoint()
+            if now - self.last_print < 0.2:
+                return
+            self.last_print = now
+            if self.total:
+                pct = self.done * 100.0 / self.total
+                log(f"   ... {pct:6.2f}% ({self.done/1024/1024:.2f} MB)")
+            else:
+                log(f"   ... {self.done/1024/1024:.2f} MB")
+
+
+def load_resume(meta_path: str, url: str, info: dict) -> list | None:
+    """Đọc danh sách đoạn đã tải dở; None nếu file dở dang không còn khớp với bản trên server
+
+    Server không gửi ETag/Last-Modified thì không biết file có đổi không (cùng kích thước
+    vẫn có thể là bản khác): không tải tiếp, tải lại từ đầu.
+    """
+    if not info["etag"]:
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("url") != url or meta.get("size") != info["size"] or meta.get("etag") != info["etag"]:
+        return None
+    return meta.get("parts")
+
+
+def save_resume(meta_path: str, url: str, info: dict, parts: list) -> None:
+    tmp = meta_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"url": url, "size": info["size"], "etag": info["etag"], "parts": parts}, f)
+    os.replace(tmp, meta_path)
+
+
+def fetch_range(url: str, path: str, part: dict, progress: DownloadProgress) -> None:
+    """Tải một đoạn [start, end] vào đúng vị trí trong file, thử lại và tiếp tục từ chỗ dừng"""
+    for attempt in range(1, DOWNLOAD_RETRIES + 1):
+        offset = part["start"] + part["done"]
+        if offset > part["end"]:
+            return
+        try:
+            with http_open(url, offset, part["end"]) as resp:
+                if resp.status != 206:
+                    raise RuntimeError(f"Server không trả về 206 cho Range (HTTP {resp.status})")
+                with open(path, "r+b") as f:
+                    f.seek(offset)
+                    while offset <= part["end"]:
+                        chunk = resp.read(min(CHUNK_SIZE, part["end"] - offset + 1))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        # Ghi xuống OS trước khi tính là đã xong (checkpoint đọc part["done"])
+                        f.flush()
+                        offset += len(chunk)
+                        part["done"] += len(chunk)
+                        progress.add(len(chunk))
+            if offset > part["end"]:
+                return
+            raise RuntimeError("Kết nối bị đóng trước khi tải xong đoạn")
+        except Exception:
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            time.sleep(attempt)
+
+
+def file_digest(path: str, algorithm: str) -> str:
+    h = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def verify_download(path: str, expected_size: int | None, expected_digest: str | None) -> None:
+    """Kiểm tra kích thước và digest ("sha256:<hex>" như GitHub công bố cho asset)"""
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise RuntimeError(f"Sai kích thước: {size} byte, mong đợi {expected_size}")
+    if expected_digest and ":" in expected_digest:
+        algorithm, want = expected_digest.split(":", 1)
+        if algorithm.lower() in hashlib.algorithms_available:
+            got = file_digest(path, algorithm.lower())
+            if got.lower() != want.lower():
+                raise RuntimeError(f"Sai {algorithm}: {got}, mong đợi {want}")
+
+
+def download_stream(resp, tmp_path: str, progress: DownloadProgress) -> None:
+    """Tải tuần tự một kết nối (server không hỗ trợ Range)"""
+    with resp, open(tmp_path, "wb") as f:
+        while True:
+            chunk = resp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            f.write(chunk)
+            progress.add(len(chunk))
+
+
+def download_file(url: str, dest_path: str, desc: str = "", expected_size: int | None = None,
+                  expected_digest: str | None = None, connections: int = DOWNLOAD_CONNECTIONS) -> None:
+    """
+    Tải url về dest_path.
+    - Server hỗ trợ Range: chia thành nhiều đoạn tải song song vào file đã cấp phát trước;
+      file .download + .download.json được giữ lại khi lỗi để lần sau tải tiếp.
+    - Không hỗ trợ Range: tải tuần tự như cũ.
+    Cuối cùng kiểm tra kích thước/digest rồi mới đổi tên sang file thật.
+    """
+    tmp_path = dest_path + ".download"
+    meta_path = tmp_path + ".json"
 
     log(f"⬇️  Tải {desc or os.path.basename(dest_path)} ...")
     try:
-        with urllib.request.urlopen(req, timeout=60) as resp:
-            total = resp.headers.get("Content-Length")
-            total = int(total) if total and total.isdigit() else None
-
-            downloaded = 0
-            last_print = 0.0
-            with open(tmp_path, "wb") as f:
-                while True:
-                    chunk = resp.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    downloaded += len(chunk)
-
-                    now = time.time()
-                    if now - last_print >= 0.2:
-                        last_print = now
-                        if total:
-                            pct = downloaded * 100.0 / total
-                            log(f"   ... {pct:6.2f}% ({downloaded/1024/1024:.2f} MB)")
-                        else:
-                            log(f"   ... {downloaded/1024/1024:.2f} MB")
+        try:
+            info, resp = probe_download(url)
+        except urllib.error.HTTPError as e:
+            # 416: file rỗng hoặc server không chịu Range -> tải thường
+            if e.code != 416:
+                raise
+            info, resp = {"ranges": False, "size": None, "etag": ""}, http_open(url)
+
+        if info["ranges"] and not info["size"]:
+            info["ranges"], resp = False, http_open(url)
+
+        if info["ranges"]:
+            size = info["size"]
+            parts = load_resume(meta_path, url, info) if os.path.exists(tmp_path) else None
+            if parts:
+                log(f"   ↪️  Tiếp tục bản tải dở ({sum(p['done'] for p in parts)/1024/1024:.2f} MB đã có)")
+            else:
+                count = max(1, connections if size >= PARALLEL_MIN_SIZE else 1)
+                step = -(-size // count)
+                parts = [{"start": s, "end": min(size, s + step) - 1, "done": 0}
+                         for s in range(0, size, step)]
+                with open(tmp_path, "wb") as f:
+                    f.truncate(size)
+            save_resume(meta_path, url, info, parts)
+
+            def checkpoint():
+                # Chụp tiến độ trước rồi fsync: mọi byte được ghi nhận đều đã nằm trên đĩa
+                snapshot = [dict(p) for p in parts]
+                with open(tmp_path, "r+b") as f:
+                    os.fsync(f.fileno())
+                save_resume(meta_path, url, info, snapshot)
+
+            progress = DownloadProgress(size, sum(p["done"] for p in parts), checkpoint)
+            pending = [p for p in parts if p["start"] + p["done"] <= p["end"]]
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+                    for future in [executor.submit(fetch_range, url, tmp_path, p, progress) for p in pending]:
+                        future.result()
+            finally:
+                # Luôn lưu tiến độ từng đoạn để lần chạy sau tải tiếp
+                save_resume(meta_path, url, info, parts)
+            expected_size = expected_size if expected_size is not None else size
+        else:
+            download_stream(resp, tmp_path, DownloadProgress(info["size"]))
+            expected_size = expected_size if expected_size is not None else info["size"]
     except urllib.error.URLError as e:
-        safe_remove(tmp_path)
-        raise RuntimeError(f"Tải thất bại: {url}\nLỗi mạng: {e}")
+        raise RuntimeError(f"Tải thất bại: {url}\nLỗi mạng: {e} (chạy lại để tải tiếp)")
     except Exception as e:
+        raise RuntimeError(f"Tải thất bại: {url}\nLỗi: {e} (chạy lại để tải tiếp)")
+
+    try:
+        verify_download(tmp_path, expected_size, expected_digest)
+    except Exception:
+        # File hỏng thì không tải tiếp được nữa: xoá để lần sau tải lại từ đầu
         safe_remove(tmp_path)
-        raise RuntimeError(f"Tải thất bại: {url}\nLỗi: {e}")
+        safe_remove(meta_path)
+        raise
 
     # Đổi tên sang file thật (tránh file dở dang)
     safe_remove(dest_path)
     os.replace(tmp_path, dest_path)
+    safe_remove(meta_path)
     log("✅ Tải xong.")
 
 
+# ==================== State & request có điều kiện ====================
+def load_state() -> dict:
+    try:
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state if isinstance(state, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state: dict) -> None:
+    tmp = STATE_FILE + ".tmp"
+    # Giữ khóa cả lúc ghi lẫn lúc thay file: hai luồng không giẫm lên cùng file .tmp
+    with state_lock:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, STATE_FILE)
+
+
+def file_signature(path: str) -> dict | None:
+    """Kích thước + mtime để biết file có bị thay đổi từ lần ghi nhận trước không"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def cached_version(entry: dict, path: str, cmd: list) -> str:
+    """Chỉ chạy lệnh đọc phiên bản khi file exe khác với lần đọc trước"""
+    sig = file_signature(path)
+    if sig and entry.get("version") and entry.get("version_signature") == sig:
+        return entry["version"]
+    code, out = run_cmd(cmd, cwd=HERE)
+    if code != 0 or not out:
+        return ""
+    version = out.splitlines()[0].strip()
+    entry["version"] = version
+    entry["version_signature"] = sig
+    return version
+
+
+def conditional_request(url: str, cache: dict, accept: str = "*/*", method: str = "GET") -> tuple[int, bytes, dict]:
+    """
+    Gửi request kèm If-None-Match / If-Modified-Since từ cache.
+    Trả về (status, body, headers); status 304 nghĩa là không đổi (body rỗng).
+    """
+    headers = {"User-Agent": "Mozilla/5.0", "Accept": accept}
+    if cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    if cache.get("last_modified"):
+        headers["If-Modified-Since"] = cache["last_modified"]
+    req = urllib.request.Request(url, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            body = resp.read() if method != "HEAD" else b""
+            resp_headers = resp.headers
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return 304, b"", dict(e.headers)
+        raise
+    if resp_headers.get("ETag"):
+        cache["etag"] = resp_headers["ETag"]
+    if resp_headers.get("Last-Modified"):
+        cache["last_modified"] = resp_headers["Last-Modified"]
+    return status, body, dict(resp_headers)
+
+
+def github_latest_release(api_url: str, state: dict) -> dict:
+    """
+    Lấy release mới nhất (tag + assets) qua GitHub API có ETag.
+    Khi GitHub trả 304 thì dùng lại bản đã lưu: không tốn byte tải về và không tính rate limit.
+    """
+    cache = state.setdefault("http", {}).setdefault(api_url, {})
+    status, body, _ = conditional_request(api_url, cache, accept="application/vnd.github+json")
+    if status == 304 and cache.get("release"):
+        return cache["release"]
+    if status == 304:
+        # Có ETag nhưng mất nội dung đã lưu: hỏi lại không điều kiện
+        cache.pop("etag", None)
+        cache.pop("last_modified", None)
+        status, body, _ = conditional_request(api_url, cache, accept="application/vnd.github+json")
+
+    data = json.loads(body.decode("utf-8", errors="replace"))
+    release = {
+        "tag_name": data.get("tag_name", ""),
+        "assets": [
+            {
+                "id": a.get("id"),
+                "name": a.get("name", ""),
+                "browser_download_url": a.get("browser_download_url", ""),
+                "size": a.get("size"),
+                "updated_at": a.get("updated_at"),
+                "digest": a.get("digest"),
+            }
+            for a in (data.get("assets", []) or [])
+            if a.get("name")
+        ],
+    }
+    cache["release"] = release
+    return release
+
+
 def run_cmd(cmd, cwd=None) -> tuple[int, str]:
     try:
         p = subprocess.run(
@@ -122,29 +428,65 @@ def find_existing_ytdlp() -> str | None:
     return None
 
 
-def ensure_ytdlp() -> str:
+def ytdlp_self_update(path: str, entry: dict) -> str:
+    """Cách cũ: yt-dlp -U (dùng khi không hỏi được GitHub API)"""
+    log(f"🔧 Đã có yt-dlp: {os.path.basename(path)} -> thử tự cập nhật (-U)")
+    code, out = run_cmd([path, "-U"], cwd=HERE)
+
+    # Có bản yt-dlp sẽ trả code=0, nhưng cũng có trường hợp trả khác 0 dù đã tải.
+    # Ta kiểm tra lại bằng --version.
+    vout = cached_version(entry, path, [path, "--version"])
+    if vout:
+        log(f"✅ yt-dlp phiên bản: {vout}")
+    else:
+        log("⚠️  Không đọc được phiên bản yt-dlp sau khi cập nhật.")
+        if out:
+            log(out)
+    return path
+
+
+def ensure_ytdlp(state: dict) -> str:
     path = find_existing_ytdlp()
+    entry = state.setdefault("yt-dlp", {})
+    asset_name = "yt-dlp.exe" if is_windows() else "yt-dlp"
+
+    try:
+        release = github_latest_release(YTDLP_LATEST_API, state)
+    except Exception as e:
+        log(f"⚠️  Không hỏi được GitHub API cho yt-dlp: {e}")
+        if path:
+            return ytdlp_self_update(path, entry)
+        release = None
+
+    asset = None
+    if release:
+        asset = next((a for a in release["assets"] if a["name"] == asset_name), None)
+
+    if path and asset:
+        # Đã ghi nhận đúng asset này và file chưa bị thay -> không cần làm gì
+        if entry.get("asset_id") == asset["id"] and entry.get("signature") == file_signature(path):
+            log(f"✅ yt-dlp đã mới nhất: {entry.get('version') or release['tag_name']}")
+            return path
+        # Lần đầu có state: so phiên bản đang cài với tag mới nhất (chỉ chạy --version một lần)
+        version = cached_version(entry, path, [path, "--version"])
+        if version and version == release["tag_name"]:
+            entry.update({"asset_id": asset["id"], "signature": file_signature(path)})
+            log(f"✅ yt-dlp đã mới nhất: {version}")
+            return path
 
-    # Nếu đã có: thử tự cập nhật
-    if path:
-        log(f"🔧 Đã có yt-dlp: {os.path.basename(path)} -> thử tự cập nhật (-U)")
-        code, out = run_cmd([path, "-U"], cwd=HERE)
+    if path and not asset:
+        return ytdlp_self_update(path, entry)
 
-        # Có bản yt-dlp sẽ trả code=0, nhưng cũng có trường hợp trả khác 0 dù đã tải.
-        # Ta kiểm tra lại bằng --version.
-        vcode, vout = run_cmd([path, "--version"], cwd=HERE)
-        if vcode == 0 and vout:
-            log(f"✅ yt-dlp phiên bản: {vout}")
-        else:
-            log("⚠️  Không đọc được phiên bản yt-dlp sau khi cập nhật.")
-            if out:
-                log(out)
-        return path
-
-    # Nếu chưa có: tải về
-    log("📌 Chưa có yt-dlp -> tải mới.")
-    dest = os.path.join(HERE, "yt-dlp.exe" if is_windows() else "yt-dlp")
-    download_file(YTDLP_DIRECT_URL, dest, desc="yt-dlp.exe")
+    # Chưa có hoặc đã cũ: tải về
+    if not path:
+        log("📌 Chưa có yt-dlp -> tải mới.")
+    else:
+        log(f"📌 yt-dlp {entry.get('version', '?')} -> {release['tag_name']}: tải bản mới.")
+    dest = path or os.path.join(HERE, asset_name)
+    url = asset["browser_download_url"] if asset else YTDLP_DIRECT_URL
+    download_file(url, dest, desc=asset_name,
+                  expected_size=asset.get("size") if asset else None,
+                  expected_digest=asset.get("digest") if asset else None)
     if is_windows():
         # Trên Windows không cần chmod
         pass
@@ -154,29 +496,28 @@ def ensure_ytdlp() -> str:
         except Exception:
             pass
 
-    vcode, vout = run_cmd([dest, "--version"], cwd=HERE)
-    if vcode == 0 and vout:
+    entry.pop("version_signature", None)
+    vout = cached_version(entry, dest, [dest, "--version"])
+    if vout:
         log(f"✅ yt-dlp phiên bản: {vout}")
+    if asset:
+        entry.update({"asset_id": asset["id"], "signature": file_signature(dest)})
     return dest
 
 
-def github_latest_ffmpeg_zip_url() -> tuple[str, str]:
+def github_latest_ffmpeg_zip_url(state: dict | None = None) -> tuple[str, str]:
     """
     Trả về (url, filename) của gói zip phù hợp từ BtbN.
     Ưu tiên bản 'gpl' (tĩnh), nếu không có thì lấy 'gpl-shared'.
     """
-    arch = pick_arch_tag()
+    asset = pick_ffmpeg_asset(github_latest_release(BTBN_LATEST_API, state if state is not None else {}))
+    return asset["browser_download_url"], asset["name"]
 
-    headers = {
-        "User-Agent": "Mozilla/5.0",
-        "Accept": "application/vnd.github+json",
-    }
-    req = urllib.request.Request(BTBN_LATEST_API, headers=headers)
-
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        data = json.loads(resp.read().decode("utf-8", errors="replace"))
 
-    assets = data.get("assets", []) or []
+def pick_ffmpeg_asset(release: dict) -> dict:
+    """Chọn asset zip phù hợp trong release BtbN"""
+    arch = pick_arch_tag()
+    assets = release.get("assets", []) or []
 
     # Ưu tiên thứ tự:
     preferred_names = [
@@ -191,34 +532,39 @@ def github_latest_ffmpeg_zip_url() -> tuple[str, str]:
     for name in preferred_names:
         a = by_name.get(name)
         if a and a.get("browser_download_url"):
-            return a["browser_download_url"], name
+            return a
 
     # Nếu không khớp đúng tên: thử tìm gần đúng
-    lower_assets = [(a.get("name", ""), a.get("browser_download_url", "")) for a in assets]
-    for nm, url in lower_assets:
-        if url and nm.lower().endswith(".zip") and arch in nm.lower() and "gpl" in nm.lower() and "ffmpeg" in nm.lower():
-            return url, nm
+    for a in assets:
+        nm = a.get("name", "").lower()
+        if a.get("browser_download_url") and nm.endswith(".zip") and arch in nm and "gpl" in nm and "ffmpeg" in nm:
+            return a
 
     raise RuntimeError("Không tìm thấy gói ffmpeg zip phù hợp từ BtbN (GitHub).")
 
 
+def wanted_exe(member: str) -> str | None:
+    """Tên file exe cần lấy (ffmpeg/ffprobe/ffplay) nếu member là một trong số đó"""
+    base = os.path.basename(member)
+    if base.lower() in {FFMPEG_EXE.lower(), FFPROBE_EXE.lower(), FFPLAY_EXE.lower()} \
+            and member.lower().endswith(".exe"):
+        return base
+    return None
+
+
 def extract_exes_from_zip(zip_path: str, target_dir: str) -> dict:
     """
     Giải nén đúng các file exe cần thiết từ zip và chép thẳng vào target_dir (không tạo thư mục con).
     Trả về dict {ten_file: duong_dan}
     """
-    want = {FFMPEG_EXE.lower(), FFPROBE_EXE.lower(), FFPLAY_EXE.lower()}
     extracted = {}
 
     with zipfile.ZipFile(zip_path, "r") as z:
         names = z.namelist()
 
         for member in names:
-            base = os.path.basename(member)
-            if not base:
-                continue
-            base_l = base.lower()
-            if base_l in want and member.lower().endswith(".exe"):
+            base = wanted_exe(member)
+            if base:
                 dest = os.path.join(target_dir, base)
                 # Chép đè an toàn: ghi ra file tạm trước
                 tmp = dest + ".new"
@@ -235,43 +581,212 @@ def extract_exes_from_zip(zip_path: str, target_dir: str) -> dict:
     return extracted
 
 
-def ensure_ffmpeg() -> dict:
+# ==================== Zip từ xa (chỉ tải phần cần) ====================
+ZIP_EOCD_SIG = b"PK\x05\x06"
+ZIP64_LOCATOR_SIG = b"PK\x06\x07"
+ZIP_CENTRAL_SIG = b"PK\x01\x02"
+ZIP_LOCAL_SIG = b"PK\x03\x04"
+ZIP_TAIL_SIZE = 64 * 1024 + 22
+
+
+def read_range(url: str, start: int, end: int) -> bytes:
+    with http_open(url, start, end) as resp:
+        if resp.status != 206:
+            raise RuntimeError(f"Server không hỗ trợ Range (HTTP {resp.status})")
+        return resp.read()
+
+
+def remote_zip_entries(url: str, size: int) -> list[dict]:
     """
-    Tải/cập nhật ffmpeg (và ffprobe/ffplay nếu có), lưu thẳng tại thư mục HERE.
+    Đọc central directory của zip trên server bằng 1-2 request Range.
+    Trả về [{name, method, csize, usize, crc, offset}]
     """
-    log("🔧 Cập nhật ffmpeg...")
+    tail_start = max(0, size - ZIP_TAIL_SIZE)
+    tail = read_range(url, tail_start, size - 1)
+    pos = tail.rfind(ZIP_EOCD_SIG)
+    if pos < 0 or len(tail) - pos < 22:
+        raise RuntimeError("Không tìm thấy End of Central Directory")
+    _, _, _, _, count, cd_size, cd_offset, _ = struct.unpack("<4s4H2LH", tail[pos:pos + 22])
+
+    if cd_offset == 0xFFFFFFFF or cd_size == 0xFFFFFFFF or count == 0xFFFF:
+        # Zip64: locator nằm ngay trước EOCD, trỏ tới bản ghi EOCD64
+        loc = pos - 20
+        if loc < 0 or tail[loc:loc + 4] != ZIP64_LOCATOR_SIG:
+            raise RuntimeError("Zip64 thiếu locator")
+        eocd64_offset = struct.unpack("<Q", tail[loc + 8:loc + 16])[0]
+        rec = read_range(url, eocd64_offset, eocd64_offset + 55)
+        count, cd_size, cd_offset = struct.unpack("<3Q", rec[32:56])
+
+    if tail_start <= cd_offset:
+        cd = tail[cd_offset - tail_start:cd_offset - tail_start + cd_size]
+    else:
+        cd = read_range(url, cd_offset, cd_offset + cd_size - 1)
+
+    entries = []
+    i = 0
+    while i + 46 <= len(cd) and cd[i:i + 4] == ZIP_CENTRAL_SIG:
+        (_, _, _, flags, method, _, _, crc, csize, usize,
+         n, m, k, _, _, _, offset) = struct.unpack("<4s6H3L5H2L", cd[i:i + 46])
+        name_bytes = cd[i + 46:i + 46 + n]
+        name = name_bytes.decode("utf-8" if flags & 0x800 else "cp437")
+        extra = cd[i + 46 + n:i + 46 + n + m]
+        # Trường zip64 (id 0x0001) chỉ chứa các giá trị bị đặt 0xFFFFFFFF, theo đúng thứ tự
+        j = 0
+        while j + 4 <= len(extra):
+            tag, length = struct.unpack("<2H", extra[j:j + 4])
+            if tag == 0x0001:
+                values = iter(struct.unpack(f"<{length // 8}Q", extra[j + 4:j + 4 + length // 8 * 8]))
+                if usize == 0xFFFFFFFF:
+                    usize = next(values)
+                if csize == 0xFFFFFFFF:
+                    csize = next(values)
+                if offset == 0xFFFFFFFF:
+                    offset = next(values)
+            j += 4 + length
+        entries.append({"name": name, "method": method, "csize": csize, "usize": usize,
+                        "crc": crc, "offset": offset})
+        i += 46 + n + m + k
+    return entries
+
+
+def extract_remote_member(url: str, entry: dict, dest: str) -> None:
+    """Tải đúng đoạn dữ liệu nén của một member, giải nén dạng stream vào dest (qua file .new)"""
+    header = read_range(url, entry["offset"], entry["offset"] + 29)
+    if header[:4] != ZIP_LOCAL_SIG:
+        raise RuntimeError(f"Local header sai cho {entry['name']}")
+    n, m = struct.unpack("<2H", header[26:30])
+    data_start = entry["offset"] + 30 + n + m
+    if entry["method"] == zipfile.ZIP_DEFLATED:
+        inflater = zlib.decompressobj(-15)
+    elif entry["method"] != zipfile.ZIP_STORED:
+        raise RuntimeError(f"Không hỗ trợ kiểu nén {entry['method']} ({entry['name']})")
+    else:
+        inflater = None
+
+    tmp = dest + ".new"
+    safe_remove(tmp)
+    crc = 0
+    written = 0
+    with http_open(url, data_start, data_start + entry["csize"] - 1) as resp, open(tmp, "wb") as out:
+        if resp.status != 206:
+            raise RuntimeError(f"Server không hỗ trợ Range (HTTP {resp.status})")
+        while True:
+            chunk = resp.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data = inflater.decompress(chunk) if inflater else chunk
+            out.write(data)
+            crc = zlib.crc32(data, crc)
+            written += len(data)
+        if inflater:
+            data = inflater.flush()
+            out.write(data)
+            crc = zlib.crc32(data, crc)
+            written += len(data)
+    if written != entry["usize"] or crc != entry["crc"]:
+        safe_remove(tmp)
+        raise RuntimeError(f"{entry['name']}: sai CRC/kích thước sau khi giải nén")
+    safe_remove(dest)
+    os.replace(tmp, dest)
+
+
+def extract_exes_from_remote_zip(url: str, target_dir: str) -> dict | None:
+    """
+    Chế độ zip từ xa: đọc central directory bằng Range rồi chỉ tải + giải nén ffmpeg/ffprobe/ffplay.
+    Trả về None nếu server không hỗ trợ Range (khi đó tải cả gói như cũ).
+    CRC32 của từng member thay cho kiểm tra digest của cả gói.
+    """
+    info, resp = probe_download(url)
+    if resp is not None:
+        resp.close()
+    if not info["ranges"] or not info["size"]:
+        return None
+
+    wanted = [(wanted_exe(e["name"]), e) for e in remote_zip_entries(url, info["size"])]
+    wanted = [(base, e) for base, e in wanted if base]
+    if not any(base == FFMPEG_EXE for base, _ in wanted):
+        raise RuntimeError("Không thấy ffmpeg.exe trong gói zip (cấu trúc gói có thể đã thay đổi).")
+
+    total = sum(e["csize"] for _, e in wanted)
+    log(f"⬇️  Zip từ xa: chỉ tải {len(wanted)} file ({total/1024/1024:.2f} MB / {info['size']/1024/1024:.2f} MB)")
+    extracted = {}
+    with ThreadPoolExecutor(max_workers=len(wanted)) as executor:
+        jobs = {base: executor.submit(extract_remote_member, url, e, os.path.join(target_dir, base))
+                for base, e in wanted}
+        for base, job in jobs.items():
+            job.result()
+            extracted[base] = os.path.join(target_dir, base)
+    return extracted
 
-    zip_tmp = os.path.join(HERE, "_ffmpeg_update.zip")
-    safe_remove(zip_tmp)
 
-    # 1) Thử tải từ BtbN (GitHub)
+def ensure_ffmpeg(state: dict) -> dict:
+    """
+    Tải/cập nhật ffmpeg (và ffprobe/ffplay nếu có), lưu thẳng tại thư mục HERE.
+    Bỏ qua khi gói nguồn (asset id BtbN hoặc ETag gyan) không đổi so với lần cài trước.
+    """
+    log("🔧 Kiểm tra ffmpeg...")
+    entry = state.setdefault("ffmpeg", {})
+    ffmpeg_path = os.path.join(HERE, FFMPEG_EXE)
+
+    # 1) Xác định gói mới nhất: BtbN (GitHub), lỗi thì gyan.dev
     try:
-        url, name = github_latest_ffmpeg_zip_url()
-        log(f"📌 Nguồn: BtbN (GitHub) | Gói: {name}")
-        download_file(url, zip_tmp, desc=name)
+        asset = pick_ffmpeg_asset(github_latest_release(BTBN_LATEST_API, state))
+        url, name = asset["browser_download_url"], asset["name"]
+        source_key = f"btbn:{asset['id']}:{asset.get('updated_at')}"
+        source = "BtbN (GitHub)"
+        expected = {"expected_size": asset.get("size"), "expected_digest": asset.get("digest")}
     except Exception as e:
-        log("⚠️  Không tải được từ BtbN (GitHub). Chuyển sang nguồn dự phòng.")
+        log("⚠️  Không hỏi được BtbN (GitHub). Chuyển sang nguồn dự phòng.")
         log(f"   Chi tiết: {e}")
-        log("📌 Nguồn dự phòng: gyan.dev | Gói: essentials")
-        download_file(GYAN_ESSENTIALS_ZIP, zip_tmp, desc="ffmpeg-release-essentials.zip")
+        url, name = GYAN_ESSENTIALS_ZIP, "ffmpeg-release-essentials.zip"
+        cache = state.setdefault("http", {}).setdefault(GYAN_ESSENTIALS_ZIP, {})
+        status, _, headers = conditional_request(GYAN_ESSENTIALS_ZIP, cache, method="HEAD")
+        headers = {k.lower(): v for k, v in headers.items()}
+        if status != 304:
+            # Server bỏ header ở lần này thì không dùng lại ETag/Last-Modified cũ trong cache
+            cache["etag"], cache["last_modified"] = headers.get("etag"), headers.get("last-modified")
+        stamp = cache.get("etag") or cache.get("last_modified")
+        if not stamp and headers.get("content-length"):
+            stamp = f"{headers['content-length']}:{url}"
+        # Không có gì để so sánh -> source_key None: luôn cài lại, không bỏ qua
+        source_key = f"gyan:{stamp}" if stamp else None
+        source = "gyan.dev"
+        expected = {}
+
+    if source_key and entry.get("source_key") == source_key and entry.get("signature") == file_signature(ffmpeg_path):
+        log(f"✅ ffmpeg đã mới nhất: {entry.get('version') or name}")
+        return {}
+
+    log(f"📌 Nguồn: {source} | Gói: {name}")
+
+    # 2) Ưu tiên zip từ xa: chỉ tải các exe cần (Range)
+    extracted = None
+    try:
+        extracted = extract_exes_from_remote_zip(url, HERE)
+    except Exception as e:
+        log(f"⚠️  Không đọc được zip từ xa, tải cả gói. Chi tiết: {e}")
+
+    if extracted is None:
+        zip_tmp = os.path.join(HERE, "_ffmpeg_update.zip")
+        safe_remove(zip_tmp)
+        download_file(url, zip_tmp, desc=name, **expected)
 
-    # 2) Giải nén đúng exe, chép thẳng vào HERE
-    extracted = extract_exes_from_zip(zip_tmp, HERE)
+        # Giải nén đúng exe, chép thẳng vào HERE
+        extracted = extract_exes_from_zip(zip_tmp, HERE)
 
-    # 3) Dọn file zip tạm
-    safe_remove(zip_tmp)
+        # Dọn file zip tạm
+        safe_remove(zip_tmp)
 
-    # 4) In phiên bản
-    ffmpeg_path = extracted.get(FFMPEG_EXE) or os.path.join(HERE, FFMPEG_EXE)
-    code, out = run_cmd([ffmpeg_path, "-version"], cwd=HERE)
-    if code == 0 and out:
-        first_line = out.splitlines()[0].strip()
-        log(f"✅ ffmpeg: {first_line}")
+    # 3) In phiên bản (ghi vào state để lần sau không phải chạy lại)
+    ffmpeg_path = extracted.get(FFMPEG_EXE) or ffmpeg_path
+    entry.pop("version_signature", None)
+    version = cached_version(entry, ffmpeg_path, [ffmpeg_path, "-version"])
+    if version:
+        log(f"✅ ffmpeg: {version}")
     else:
         log("⚠️  Đã chép ffmpeg.exe nhưng không chạy được để đọc phiên bản. Hãy thử chạy bằng tay.")
-        if out:
-            log(out)
 
+    entry.update({"source_key": source_key, "signature": file_signature(ffmpeg_path)})
     return extracted
 
 
@@ -287,17 +802,31 @@ def main() -> int:
     # Nhắc người dùng đóng chương trình đang dùng ffmpeg/yt-dlp để tránh bị khoá file
     log("📌 Lưu ý: nếu đang có chương trình dùng ffmpeg/yt-dlp, hãy đóng trước để tránh lỗi ghi đè.")
 
-    try:
-        ytdlp_path = ensure_ytdlp()
-    except Exception as e:
-        log(f"❌ Lỗi khi cập nhật yt-dlp: {e}")
-        ytdlp_path = None
+    started = time.time()
+    # --force: bỏ qua state đã lưu, kiểm tra và tải lại như lần đầu
+    state = {} if "--force" in sys.argv[1:] else load_state()
+
+    # yt-dlp và ffmpeg độc lập nhau: kiểm tra/cập nhật song song
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        ytdlp_future = executor.submit(ensure_ytdlp, state)
+        ffmpeg_future = executor.submit(ensure_ffmpeg, state)
+
+        try:
+            ytdlp_path = ytdlp_future.result()
+        except Exception as e:
+            log(f"❌ Lỗi khi cập nhật yt-dlp: {e}")
+            ytdlp_path = None
+
+        try:
+            extracted = ffmpeg_future.result()
+        except Exception as e:
+            log(f"❌ Lỗi khi cập nhật ffmpeg: {e}")
+            extracted = {}
 
     try:
-        extracted = ensure_ffmpeg()
+        save_state(state)
     except Exception as e:
-        log(f"❌ Lỗi khi cập nhật ffmpeg: {e}")
-        extracted = {}
+        log(f"⚠️  Không lưu được state: {e}")
 
     log("======================================")
     log("KẾT QUẢ")
@@ -317,7 +846,7 @@ def main() -> int:
         if extra:
             log("➕ Có thêm: " + ", ".join(extra))
 
-    log("Done.")
+    log(f"Done. ({time.time() - started:.2f}s)")
     return 0
 
 
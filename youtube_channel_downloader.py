@@ -7,9 +7,13 @@ Version: 2.2
 
 import os
 import sys
+import time
 import subprocess
 import json
 
+# Mốc thời gian để đo thời gian khởi động (xem STARTUP_BUDGET_SECONDS)
+STARTUP_STARTED = time.perf_counter()
+
 # ==================== Xác định đường dẫn cho PyInstaller ====================
 def get_base_path():
     """Lấy đường dẫn gốc, hỗ trợ cả khi chạy từ .py và .exe"""
@@ -23,72 +27,1749 @@ def get_base_path():
 BASE_PATH = get_base_path()
 
 # ==================== Tự động cài đặt thư viện ====================
+# Tên package pip -> tên module để kiểm tra
+REQUIREMENTS = {'Pillow': 'PIL', 'requests': 'requests'}
+
 def install_requirements():
-    """Tự động cài đặt các thư viện cần thiết (chỉ khi chạy từ .py)"""
+    """Cài các thư viện còn thiếu (chỉ khi chạy từ .py)
+
+    Không còn chạy lúc import: gọi khi chạy với --install-deps hoặc ở lần chạy đầu
+    (chưa có settings.json). Kiểm tra bằng find_spec nên không import thư viện nặng.
+    """
     if getattr(sys, 'frozen', False):
         return  # Không cần cài đặt khi chạy từ .exe
         
-    required = ['Pillow', 'requests']
+    import importlib.util
     
-    for package in required:
-        try:
-            if package == 'Pillow':
-                __import__('PIL')
-            else:
-                __import__(package)
-        except ImportError:
+    for package, module in REQUIREMENTS.items():
+        if importlib.util.find_spec(module) is None:
             print(f"Đang cài đặt {package}...")
             subprocess.check_call([sys.executable, "-m", "pip", "install", package],
                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             print(f"✅ Đã cài đặt {package}")
 
-install_requirements()
-
 # ==================== Import thư viện ====================
 import io
+import csv
+import socket
+import contextlib
+import heapq
+import random
+import hashlib
+import shutil
+import tempfile
 import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from queue import SimpleQueue, Empty
 import re
-import requests
-from PIL import Image
+
+
+class LazyModule:
+    """Import module ở lần dùng đầu tiên (requests, PIL, concurrent.futures, sqlite3)
+
+    Giúp cửa sổ hiện nhanh khi chỉ mở app để chỉnh settings.
+    PyInstaller không thấy các import này, xem --hidden-import trong file build.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            import importlib
+            try:
+                self._module = importlib.import_module(self._name)
+            except ImportError as e:
+                raise ImportError(f"Thiếu thư viện {self._name}: chạy lại với --install-deps") from e
+        return getattr(self._module, attr)
+
+
+requests = LazyModule("requests")
+Image = LazyModule("PIL.Image")
+concurrent_futures = LazyModule("concurrent.futures")
+sqlite3 = LazyModule("sqlite3")
+
+# Ngân sách thời gian khởi động (tới khi cửa sổ sẵn sàng), chỉnh bằng NTB_STARTUP_BUDGET
+try:
+    STARTUP_BUDGET_SECONDS = float(os.environ.get("NTB_STARTUP_BUDGET", "1.0"))
+except ValueError:
+    STARTUP_BUDGET_SECONDS = 1.0
+
+# Cho phép trỏ sang server giả lập (benchmark) thay vì API thật
+YOUTUBE_API_BASE = os.environ.get("NTB_YOUTUBE_API_BASE", "https://www.googleapis.com/youtube/v3").rstrip("/")
+# Số request videos API chạy song song khi lấy chi tiết/thống kê
+API_WORKERS = 8
+# ffprobe chỉ đọc header: quá thời gian này (vd. ổ mạng chập chờn) thì kill, coi như kiểm tra không đạt
+FFPROBE_TIMEOUT_SECONDS = 60
+
+
+# ==================== Ngân sách kết nối ====================
+class ConnectionBudget:
+    """Chia tổng số kết nối cho các job yt-dlp đang chạy (--concurrent-fragments)
+
+    Mỗi lệnh yt-dlp (không phải cả job) nhận phần chia đều của ngân sách theo số job có thể
+    chạy cùng lúc: lúc đầu nhiều job -> ít fragment mỗi lệnh, cuối batch còn ít job -> nhiều hơn.
+    Lệnh xong trả kết nối ngay, nên lệnh tiếp theo của job đang chạy (audio sau video, lần
+    tải lại) được cấp lại theo số job còn lại lúc đó.
+    """
+
+    def __init__(self, total, workers, max_per_job=16):
+        self.total = max(1, total)
+        self.workers = max(1, workers)
+        self.max_per_job = max(1, max_per_job)
+        self.remaining = 0
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+    def set_remaining(self, remaining):
+        """Cập nhật số job chưa xong (đang chạy + đang chờ)"""
+        with self.lock:
+            self.remaining = max(0, remaining)
+
+    def acquire(self):
+        """Cấp số kết nối cho một lệnh, luôn ít nhất 1"""
+        with self.lock:
+            active = max(1, min(self.workers, self.remaining))
+            share = self.total // active
+            grant = max(1, min(share, self.max_per_job, self.total - self.in_use))
+            self.in_use += grant
+            return grant
+
+    def release(self, grant):
+        """Trả lại kết nối khi lệnh kết thúc"""
+        with self.lock:
+            self.in_use = max(0, self.in_use - grant)
+
+
+# ==================== Pool API key ====================
+class ApiQuotaExhausted(RuntimeError):
+    """Mọi API key đều đã hết quota trong ngày"""
+
+
+class ApiKeyPool:
+    """Chia request YouTube Data API cho nhiều key theo quota còn lại ước tính
+
+    Mỗi key có quota ước tính (mặc định 10.000 đơn vị/ngày, reset lúc 0h giờ Thái Bình Dương)
+    và thời điểm hết cooldown. Request lấy key còn nhiều quota nhất; quotaExceeded khoá key
+    tới lần reset, rateLimitExceeded khoá ngắn rồi thử lại. Ước tính được lưu ra file
+    (theo hash của key, không lưu key) để mở lại app không bị tính lại từ đầu.
+    """
+
+    # Lỗi trong error.errors[].reason của API
+    QUOTA_REASONS = ('quotaExceeded', 'dailyLimitExceeded')
+    RATE_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+    RATE_COOLDOWN = 30.0
+    MAX_WAIT = 120.0
+    # Quota reset theo giờ Thái Bình Dương (xấp xỉ UTC-8, không tính giờ mùa hè)
+    PACIFIC = timezone(timedelta(hours=-8))
+
+    def __init__(self, keys, state_file=None, daily_quota=10000):
+        self.keys = list(dict.fromkeys(keys))
+        self.state_file = state_file
+        self.daily_quota = daily_quota
+        self.lock = threading.Lock()
+        self.state = {key: {'remaining': daily_quota, 'cooldown_until': 0.0, 'day': self.quota_day()}
+                      for key in self.keys}
+        self.load()
+
+    @staticmethod
+    def parse_keys(text):
+        """Nhiều key phân tách bằng dấu phẩy, chấm phẩy, khoảng trắng hoặc xuống dòng"""
+        return [key for key in re.split(r'[\s,;]+', text or '') if key]
+
+    @staticmethod
+    def key_id(key):
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def quota_day(cls):
+        return datetime.now(cls.PACIFIC).strftime("%Y-%m-%d")
+
+    @classmethod
+    def next_reset(cls):
+        now = datetime.now(cls.PACIFIC)
+        return (now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp()
+
+    def load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        today = self.quota_day()
+        for key, entry in self.state.items():
+            stored = saved.get(self.key_id(key))
+            if stored and stored.get('day') == today:
+                entry.update(stored)
+
+    def save(self):
+        if not self.state_file:
+            return
+        with self.lock:
+            saved = {self.key_id(key): dict(entry) for key, entry in self.state.items()}
+        RunMetrics.write_atomic(self.state_file, json.dumps(saved, indent=2))
+
+    def acquire(self, cost=1):
+        """Chọn key còn nhiều quota nhất và trừ trước cost; chờ nếu mọi key đang bị rate limit"""
+        deadline = time.time() + self.MAX_WAIT
+        while True:
+            with self.lock:
+                now = time.time()
+                today = self.quota_day()
+                for entry in self.state.values():
+                    if entry['day'] != today:
+                        entry.update(remaining=self.daily_quota, cooldown_until=0.0, day=today)
+                usable = [k for k, e in self.state.items() if e['remaining'] >= cost]
+                ready = [k for k in usable if self.state[k]['cooldown_until'] <= now]
+                if ready:
+                    key = max(ready, key=lambda k: self.state[k]['remaining'])
+                    self.state[key]['remaining'] -= cost
+                    return key
+                if not usable:
+                    raise ApiQuotaExhausted(f"Cả {len(self.keys)} API key đã hết quota hôm nay")
+                wait = min(self.state[k]['cooldown_until'] for k in usable) - now
+            if time.time() + wait > deadline:
+                raise ApiQuotaExhausted("Mọi API key đang bị giới hạn tốc độ")
+            time.sleep(max(0.05, wait))
+
+    def report_error(self, key, reason):
+        """Ghi nhận lỗi quota/rate limit của key"""
+        with self.lock:
+            entry = self.state[key]
+            if reason in self.QUOTA_REASONS:
+                entry['remaining'] = 0
+                entry['cooldown_until'] = self.next_reset()
+            else:
+                entry['cooldown_until'] = time.time() + self.RATE_COOLDOWN
+
+    def summary(self):
+        with self.lock:
+            return [(key[:6] + '…', entry['remaining']) for key, entry in self.state.items()]
+
+
+# ==================== Cache phản hồi API ====================
+class ApiResponseCache:
+    """Cache phản hồi YouTube Data API trên đĩa, mỗi request một file JSON
+
+    Khoá là endpoint + params (không gồm API key) nên đổi key vẫn dùng lại được.
+    Hạn dùng tính theo endpoint lúc đọc (đổi thiết lập có hiệu lực ngay); prune()
+    xoá entry hết hạn rồi xoá file cũ nhất cho tới khi tổng dung lượng <= max_bytes.
+    """
+
+    DAY = 24 * 3600
+    # Handle -> channel và channel -> uploads playlist gần như không đổi
+    DEFAULT_TTLS = {'search': 7 * DAY, 'channels': 7 * DAY, 'playlistItems': 15 * 60, 'videos': 3600}
+
+    def __init__(self, directory, ttls=None, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def path(self, endpoint, params):
+        raw = json.dumps([endpoint, {k: v for k, v in params.items() if k != 'key'}], sort_keys=True)
+        digest = hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f"{endpoint}_{digest}.json")
+
+    def ttl(self, endpoint):
+        return self.ttls.get(endpoint, 0)
+
+    def get(self, endpoint, params):
+        """Phản hồi còn hạn hoặc None"""
+        path = self.path(endpoint, params)
+        data = None
+        try:
+            if time.time() - os.path.getmtime(path) <= self.ttl(endpoint):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        with self.lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, endpoint, params, data):
+        if self.ttl(endpoint) <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(endpoint, params)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def prune(self):
+        """Xoá entry hết hạn, rồi entry cũ nhất khi vượt max_bytes; trả về số file đã xoá"""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.is_file()]
+        except OSError:
+            return 0
+        now = time.time()
+        kept = []
+        removed = 0
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            endpoint = entry.name.rsplit('_', 1)[0]
+            expired = now - stat.st_mtime > self.ttl(endpoint)
+            if expired or entry.name.endswith('.tmp'):
+                removed += self.remove(entry.path)
+            else:
+                kept.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in kept)
+        for _, size, path in sorted(kept):
+            if total <= self.max_bytes:
+                break
+            removed += self.remove(path)
+            total -= size
+        return removed
+
+    def clear(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        return sum(self.remove(os.path.join(self.directory, name)) for name in names)
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+
+# ==================== Đo thời gian & metrics ====================
+class StageTimer:
+    """Context manager đo một lần chạy của một giai đoạn, có thể gán thêm số byte"""
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.bytes = 0
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        self.metrics.record(self.stage, elapsed, self.bytes, failed=exc_type is not None)
+        return False
+
+
+class RunMetrics:
+    """Gom thời gian wall-clock và số byte theo giai đoạn cho một lần quét/tải"""
+
+    def __init__(self, run_name):
+        self.run_name = run_name
+        self.started_at = time.time()
+        self.samples = {}
+        self.bytes = {}
+        self.errors = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.last_export = 0.0
+
+    def stage(self, name):
+        return StageTimer(self, name)
+
+    def count(self, name, n=1):
+        """Đếm sự kiện không có thời gian (lỗi tạm thời, lần thử lại...)"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, stage, seconds, nbytes=0, failed=False):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+            self.bytes[stage] = self.bytes.get(stage, 0) + (nbytes or 0)
+            if failed:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        """Percentile kiểu nearest-rank trên list đã sắp xếp"""
+        if not sorted_values:
+            return 0.0
+        rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+        return sorted_values[min(rank, len(sorted_values)) - 1]
+
+    def summary(self):
+        """Tổng hợp count, p50/p95, tổng thời gian, byte và byte/s theo giai đoạn"""
+        with self.lock:
+            snapshot = {k: sorted(v) for k, v in self.samples.items()}
+            byte_counts = dict(self.bytes)
+            errors = dict(self.errors)
+            counters = dict(self.counters)
+        stages = {}
+        for stage, values in sorted(snapshot.items()):
+            total = sum(values)
+            nbytes = byte_counts.get(stage, 0)
+            stages[stage] = {
+                'count': len(values),
+                'errors': errors.get(stage, 0),
+                'total_seconds': round(total, 4),
+                'p50_seconds': round(self.percentile(values, 50), 4),
+                'p95_seconds': round(self.percentile(values, 95), 4),
+                'max_seconds': round(values[-1], 4),
+                'bytes': nbytes,
+                'bytes_per_second': round(nbytes / total, 1) if total > 0 else 0.0,
+            }
+        return {
+            'run': self.run_name,
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+            'elapsed_seconds': round(time.time() - self.started_at, 3),
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def to_prometheus(self):
+        """Xuất summary ở định dạng text của Prometheus"""
+        summary = self.summary()
+        run = summary['run']
+        lines = [
+            '# HELP ntb_stage_seconds Thời gian wall-clock của từng giai đoạn',
+            '# TYPE ntb_stage_seconds summary',
+        ]
+        for stage, s in summary['stages'].items():
+            labels = f'run="{run}",stage="{stage}"'
+            lines.append(f'ntb_stage_seconds{{{labels},quantile="0.5"}} {s["p50_seconds"]}')
+            lines.append(f'ntb_stage_seconds{{{labels},quantile="0.95"}} {s["p95_seconds"]}')
+            lines.append(f'ntb_stage_seconds_sum{{{labels}}} {s["total_seconds"]}')
+            lines.append(f'ntb_stage_seconds_count{{{labels}}} {s["count"]}')
+        lines += ['# HELP ntb_stage_bytes_total Số byte xử lý theo giai đoạn',
+                  '# TYPE ntb_stage_bytes_total counter']
+        for stage, s in summary['stages'].items():
+            lines.append(f'ntb_stage_bytes_total{{run="{run}",stage="{stage}"}} {s["bytes"]}')
+        lines += ['# HELP ntb_stage_errors_total Số lần giai đoạn bị lỗi',
+                  '# TYPE ntb_stage_errors_total counter']
+        for stage, s in summary['stages'].items():
+            lines.append(f'ntb_stage_errors_total{{run="{run}",stage="{stage}"}} {s["errors"]}')
+        lines += ['# HELP ntb_events_total Số sự kiện đếm được trong run',
+                  '# TYPE ntb_events_total counter']
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f'ntb_events_total{{run="{run}",event="{name}"}} {value}')
+        lines += ['# HELP ntb_run_elapsed_seconds Thời gian từ lúc bắt đầu run',
+                  '# TYPE ntb_run_elapsed_seconds gauge',
+                  f'ntb_run_elapsed_seconds{{run="{run}"}} {summary["elapsed_seconds"]}']
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def write_atomic(path, text):
+        """Ghi file tạm rồi os.replace để người đọc không thấy file dở dang"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def export_prometheus(self, metrics_dir, min_interval=5.0):
+        """Ghi metrics.prom, tối đa một lần mỗi min_interval giây"""
+        now = time.time()
+        if now - self.last_export < min_interval:
+            return
+        self.last_export = now
+        os.makedirs(metrics_dir, exist_ok=True)
+        self.write_atomic(os.path.join(metrics_dir, "metrics.prom"), self.to_prometheus())
+
+    def export_summary(self, metrics_dir):
+        """Ghi summary JSON của run và cập nhật metrics.prom lần cuối"""
+        os.makedirs(metrics_dir, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started_at).strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(metrics_dir, f"{self.run_name}_{stamp}.json")
+        self.write_atomic(path, json.dumps(self.summary(), ensure_ascii=False, indent=2))
+        self.export_prometheus(metrics_dir, min_interval=0)
+        return path
+
+
+class StallWatchdog:
+    """Kill process khi không còn tiến triển, thay cho timeout cố định
+
+    Tiến triển = dòng output mới khác dòng trước (touch) hoặc tổng kích thước các file/thư mục
+    bắt đầu bằng watch_prefix trong watch_dir thay đổi (.part đang tải, file ffmpeg đang ghi).
+    watch_dir nên là thư mục riêng của job (make_work_dir): mỗi lần kiểm tra liệt kê toàn bộ thư mục.
+    Không có tiến triển trong stall_seconds, chạy quá max_seconds, hoặc cancelled() trả True
+    -> kill, reason cho biết lý do.
+    """
+
+    def __init__(self, process, stall_seconds, max_seconds=None, watch=None, interval=None, cancelled=None):
+        self.process = process
+        self.stall_seconds = stall_seconds
+        self.max_seconds = max_seconds
+        self.watch = watch
+        self.cancelled = cancelled
+        self.interval = interval or min(5.0, max(0.2, stall_seconds / 6))
+        self.started = self.last_progress = time.monotonic()
+        self.last_line = None
+        self.last_size = None
+        self.reason = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def touch(self, line=None):
+        if line is not None:
+            if line == self.last_line:
+                return
+            self.last_line = line
+        self.last_progress = time.monotonic()
+
+    def disk_bytes(self):
+        """Tổng kích thước các file (và file trong thư mục con một cấp) khớp watch_prefix"""
+        directory, prefix = self.watch
+        total = 0
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.name.startswith(prefix):
+                        continue
+                    if entry.is_dir():
+                        with os.scandir(entry.path) as children:
+                            total += sum(c.stat().st_size for c in children if c.is_file())
+                    else:
+                        total += entry.stat().st_size
+        except OSError:
+            pass
+        return total
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.watch:
+                size = self.disk_bytes()
+                if size != self.last_size:
+                    self.last_size = size
+                    self.touch()
+            now = time.monotonic()
+            if now - self.last_progress > self.stall_seconds:
+                self.reason = f"đứng yên quá {self.stall_seconds:.0f}s"
+            elif self.max_seconds and now - self.started > self.max_seconds:
+                self.reason = f"quá giới hạn {self.max_seconds:.0f}s"
+            elif self.cancelled and self.cancelled():
+                self.reason = "đã dừng tải"
+            if self.reason:
+                self.process.kill()
+                return
+
+
+class YtdlpStageTracker:
+    """Tách thời gian extraction / download / merge-transcode từ output --newline của yt-dlp"""
+
+    POSTPROCESS_PREFIXES = ('[Merger]', '[VideoConvertor]', '[VideoRemuxer]', '[ExtractAudio]',
+                            '[Fixup', '[ffmpeg]', '[EmbedThumbnail]', '[Metadata]')
+    SIZE_PATTERN = re.compile(r'of\s+~?\s*([\d.]+)\s*([KMGT]?i?B)')
+    SIZE_UNITS = {'B': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4,
+                  'KB': 1000, 'MB': 1000 ** 2, 'GB': 1000 ** 3, 'TB': 1000 ** 4}
+
+    def __init__(self, metrics, prefix):
+        self.metrics = metrics
+        self.prefix = prefix
+        self.stage = 'extract'
+        self.started = time.perf_counter()
+        self.stage_bytes = 0
+        self.current_size = 0
+
+    def feed(self, line):
+        if line.startswith('[download]'):
+            self._switch('download')
+            if 'Destination:' in line:
+                self.stage_bytes += self.current_size
+                self.current_size = 0
+            else:
+                match = self.SIZE_PATTERN.search(line)
+                if match:
+                    unit = self.SIZE_UNITS.get(match.group(2), 1)
+                    self.current_size = int(float(match.group(1)) * unit)
+        elif line.startswith(self.POSTPROCESS_PREFIXES):
+            self._switch('postprocess')
+
+    def _switch(self, stage):
+        if stage != self.stage:
+            self._close()
+            self.stage = stage
+            self.started = time.perf_counter()
+
+    def _close(self):
+        nbytes = 0
+        if self.stage == 'download':
+            nbytes = self.stage_bytes + self.current_size
+            self.stage_bytes = self.current_size = 0
+        self.metrics.record(f"{self.prefix}_{self.stage}", time.perf_counter() - self.started, nbytes)
+
+    def finish(self):
+        self._close()
+
+
+# ==================== Profiling ====================
+class RunProfiler:
+    """Profiling tùy chọn cho một lần quét/tải
+
+    - cProfile cho thread điều phối (_scan_channel_thread / _download_thread)
+    - sampling profiler đọc stack của mọi thread (kể cả worker của ThreadPoolExecutor)
+      để thấy thời gian nằm ở Pillow, requests, chờ subprocess hay chờ lock
+    - tracemalloc: so sánh snapshot đầu/cuối để tìm chỗ cấp phát nhiều nhất
+    """
+
+    def __init__(self, run_name, interval=0.01, top_n=30):
+        self.run_name = run_name
+        self.interval = interval
+        self.top_n = top_n
+        self.started_at = time.time()
+        self.profile = None
+        self.snapshot_start = None
+        self.snapshot_end = None
+        self.self_samples = {}
+        self.total_samples = {}
+        self.stacks = {}
+        self.sample_count = 0
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.started_tracemalloc = False
+
+    def __enter__(self):
+        import cProfile
+        import tracemalloc
+        
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self.started_tracemalloc = True
+        self.snapshot_start = tracemalloc.take_snapshot()
+        self.sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+        self.sampler.start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        import tracemalloc
+        
+        self.profile.disable()
+        self.stop_event.set()
+        self.sampler.join()
+        self.snapshot_end = tracemalloc.take_snapshot()
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._frame_label(frame))
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                self.sample_count += 1
+                leaf = stack[0]
+                self.self_samples[leaf] = self.self_samples.get(leaf, 0) + 1
+                for label in set(stack):
+                    self.total_samples[label] = self.total_samples.get(label, 0) + 1
+                # Định dạng "collapsed stack" (dùng được với flamegraph.pl / speedscope)
+                thread_name = re.sub(r'_\d+$', '', names.get(ident, str(ident)))
+                key = ';'.join([thread_name] + stack[::-1])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def write_reports(self, profile_dir):
+        """Ghi file .prof, collapsed stacks và báo cáo top-N; trả về đường dẫn báo cáo"""
+        import pstats
+        
+        os.makedirs(profile_dir, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started_at).strftime("%Y%m%d_%H%M%S")
+        prefix = os.path.join(profile_dir, f"{self.run_name}_{stamp}")
+        
+        self.profile.dump_stats(prefix + ".prof")
+        with open(prefix + "_stacks.txt", 'w', encoding='utf-8') as f:
+            for key, count in sorted(self.stacks.items(), key=lambda kv: -kv[1]):
+                f.write(f"{key} {count}\n")
+        
+        lines = [f"Profile: {self.run_name} | bắt đầu {stamp} | "
+                 f"{round(time.time() - self.started_at, 1)}s | {self.sample_count} mẫu", ""]
+        
+        lines.append(f"== Top {self.top_n} hàm theo sampling (mọi thread, self / cumulative) ==")
+        total = max(1, self.sample_count)
+        for label, count in sorted(self.self_samples.items(), key=lambda kv: -kv[1])[:self.top_n]:
+            cumulative = self.total_samples.get(label, 0)
+            lines.append(f"{count * 100.0 / total:6.1f}% self {cumulative * 100.0 / total:6.1f}% cum  {label}")
+        lines.append("")
+        
+        lines.append(f"== Top {self.top_n} hàm theo cProfile (thread điều phối, cumulative) ==")
+        buf = io.StringIO()
+        pstats.Stats(self.profile, stream=buf).sort_stats('cumulative').print_stats(self.top_n)
+        lines.append(buf.getvalue().strip())
+        lines.append("")
+        
+        lines.append(f"== Top {self.top_n} vị trí cấp phát bộ nhớ (tracemalloc, cuối - đầu) ==")
+        for stat in self.snapshot_end.compare_to(self.snapshot_start, 'lineno')[:self.top_n]:
+            lines.append(str(stat))
+        
+        report_path = prefix + "_report.txt"
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return report_path
+
+
+# ==================== Nhật ký job (khôi phục sau crash) ====================
+class JobJournal:
+    """Nhật ký append-only (JSONL) ghi lại trạng thái từng job tải
+
+    Mỗi dòng là một sự kiện: queued (kèm video + danh sách nội dung cần tải),
+    running, artifact (một loại nội dung đã xong), rejected (file không qua kiểm tra,
+    cần tải lại), done, failed, dropped (lỗi vĩnh viễn, không tải tiếp).
+    Ghi xong là flush ngay (app chết vẫn còn trong cache của OS), còn fsync gom lại
+    tối đa mỗi fsync_interval giây để máy tắt đột ngột chỉ mất vài sự kiện cuối.
+    Khi chạy lại, replay() dựng lại đúng hàng đợi còn lại mà không cần quét kênh.
+    """
+
+    def __init__(self, path, fsync_interval=1.0):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.file = None
+        self.last_fsync = 0.0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def replay(path):
+        """Đọc nhật ký, trả về [(video, [nội dung còn thiếu])] theo thứ tự queue; [] nếu không còn gì"""
+        jobs = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        continue  # dòng cuối bị cắt ngang khi crash
+                    kind = event.get('event')
+                    video_id = event.get('id')
+                    if kind == 'queued':
+                        jobs[video_id] = (event['video'], list(event['artifacts']))
+                    elif video_id not in jobs:
+                        continue
+                    elif kind == 'artifact':
+                        missing = jobs[video_id][1]
+                        if event['artifact'] in missing:
+                            missing.remove(event['artifact'])
+                    elif kind == 'rejected':
+                        missing = jobs[video_id][1]
+                        if event['artifact'] not in missing:
+                            missing.append(event['artifact'])
+                    elif kind in ('done', 'dropped'):
+                        del jobs[video_id]
+        except OSError:
+            return []
+        return [(video, missing) for video, missing in jobs.values() if missing]
+
+    def begin(self, jobs):
+        """Bắt đầu nhật ký mới với danh sách [(video, artifacts)] (ghi file tạm rồi thay thế)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for video, artifacts in jobs:
+                f.write(json.dumps({'event': 'queued', 'id': video['id'], 'video': video,
+                                    'artifacts': list(artifacts)}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.last_fsync = time.monotonic()
+
+    def record(self, event, video_id, **fields):
+        fields.update(event=event, id=video_id, t=round(time.time(), 3))
+        line = json.dumps(fields, ensure_ascii=False) + '\n'
+        with self.lock:
+            if not self.file:
+                return
+            self.file.write(line)
+            self.file.flush()
+            now = time.monotonic()
+            if now - self.last_fsync >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.last_fsync = now
+
+    def close(self, remove=False):
+        """Đóng nhật ký; remove=True khi không còn job nào dở dang"""
+        with self.lock:
+            if self.file:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.file = None
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+# ==================== Hàng đợi job dùng chung (coordinator/worker) ====================
+class JobQueue:
+    """Hàng đợi job trong một file SQLite đặt ở thư mục dùng chung
+
+    Coordinator quét kênh rồi enqueue; worker (cùng máy hoặc máy khác) lease từng job
+    trong lease_ttl giây, heartbeat để gia hạn và báo kết quả bằng complete().
+    Lease hết hạn (worker chết, mất mạng) được trả lại hàng đợi ở lần lease kế tiếp.
+    Job lỗi quá max_attempts lần thì chuyển sang failed.
+    Mỗi thao tác dùng connection riêng và BEGIN IMMEDIATE nên an toàn giữa thread/process.
+    """
+
+    def __init__(self, path, lease_ttl=60.0, max_attempts=3):
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                       "id TEXT PRIMARY KEY, video TEXT NOT NULL, artifacts TEXT NOT NULL, "
+                       "status TEXT NOT NULL, worker TEXT, lease_until REAL, "
+                       "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, updated_at REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def connect(self):
+        # Không dùng WAL: WAL cần shared memory, không chạy được trên share mạng
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA busy_timeout = 30000")
+        return db
+
+    @contextlib.contextmanager
+    def transaction(self):
+        db = self.connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def enqueue(self, jobs):
+        """Thêm [(video, artifacts)]; job failed được xếp lại, job đang chạy/đã xong giữ nguyên"""
+        now = time.time()
+        with self.transaction() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT INTO jobs (id, video, artifacts, status, updated_at) VALUES (?, ?, ?, 'queued', ?) "
+                "ON CONFLICT(id) DO UPDATE SET video = excluded.video, artifacts = excluded.artifacts, "
+                "status = 'queued', worker = NULL, attempts = 0, error = NULL, updated_at = excluded.updated_at "
+                "WHERE jobs.status = 'failed'",
+                [(video['id'], json.dumps(video, ensure_ascii=False), json.dumps(list(artifacts)), now)
+                 for video, artifacts in jobs])
+            return db.total_changes - before
+
+    def requeue_expired(self, db=None):
+        """Trả lại hàng đợi các lease đã hết hạn; trả về số job"""
+        if db is None:
+            with self.transaction() as db:
+                return self.requeue_expired(db)
+        now = time.time()
+        return db.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "worker = NULL, error = 'lease hết hạn', updated_at = ? "
+            "WHERE status = 'leased' AND lease_until < ?", (self.max_attempts, now, now)).rowcount
+
+    def lease(self, worker):
+        """Nhận job kế tiếp: (video, artifacts) hoặc None nếu hàng đợi trống"""
+        with self.transaction() as db:
+            self.requeue_expired(db)
+            row = db.execute("SELECT id, video, artifacts FROM jobs WHERE status = 'queued' "
+                             "ORDER BY rowid LIMIT 1").fetchone()
+            if not row:
+                return None
+            now = time.time()
+            db.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, "
+                       "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                       (worker, now + self.lease_ttl, now, row[0]))
+        return json.loads(row[1]), json.loads(row[2])
+
+    def heartbeat(self, worker, video_ids):
+        """Gia hạn lease các job worker đang chạy; trả về số lease còn giữ"""
+        if not video_ids:
+            return 0
+        video_ids = list(video_ids)
+        with self.transaction() as db:
+            return db.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE worker = ? AND status = 'leased' "
+                f"AND id IN ({','.join('?' * len(video_ids))})",
+                [time.time() + self.lease_ttl, worker] + video_ids).rowcount
+
+    def complete(self, worker, video_id, missing=(), error=None, permanent=False):
+        """Báo kết quả: missing rỗng -> done, còn thiếu -> xếp lại (chỉ phần thiếu) hoặc failed
+
+        permanent: lỗi vĩnh viễn (video riêng tư/đã xoá...) -> failed ngay, không xếp lại.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            # Lease đã bị worker khác nhận lại thì kết quả của worker này không ghi đè
+            condition = "id = ? AND (worker = ? OR status = 'queued')"
+            if not missing:
+                db.execute(f"UPDATE jobs SET status = 'done', worker = ?, error = NULL, updated_at = ? "
+                           f"WHERE {condition}", (worker, now, video_id, worker))
+                return
+            db.execute(f"UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                       f"artifacts = ?, worker = NULL, error = ?, updated_at = ? WHERE {condition}",
+                       (1 if permanent else self.max_attempts, json.dumps(list(missing)), (error or '')[:500],
+                        now, video_id, worker))
+
+    def counts(self):
+        """Số job theo trạng thái: queued, leased, done, failed"""
+        db = self.connect()
+        try:
+            counts = dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            db.close()
+        return {status: counts.get(status, 0) for status in ('queued', 'leased', 'done', 'failed')}
+
+    def set_meta(self, key, value):
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_meta(self, key, default=None):
+        db = self.connect()
+        try:
+            row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        finally:
+            db.close()
+        return json.loads(row[0]) if row else default
+
+
+# ==================== Archive video đã tải ====================
+class DownloadArchive:
+    """Danh sách id video đã tải, dùng chung cho mọi kênh và thư mục lưu
+
+    File cùng định dạng --download-archive của yt-dlp (mỗi dòng "youtube <id>")
+    nên dùng lẫn được với yt-dlp chạy tay. Toàn bộ id nằm trong một set để kiểm tra
+    O(1) trước khi đưa job vào executor.
+    """
+
+    EXTRACTOR = "youtube"
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = set()
+        self.signature = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Nạp file (chỉ đọc lại khi kích thước/mtime đổi), trả về số id"""
+        with self.lock:
+            try:
+                st = os.stat(self.path)
+            except OSError:
+                self.ids, self.signature = set(), None
+                return 0
+            signature = (st.st_size, st.st_mtime_ns)
+            if signature != self.signature:
+                ids = set()
+                with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        parts = line.split(None, 2)
+                        if len(parts) >= 2 and parts[0] == self.EXTRACTOR:
+                            ids.add(parts[1])
+                self.ids, self.signature = ids, signature
+            return len(self.ids)
+
+    def __contains__(self, video_id):
+        return video_id in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, video_id, note=None):
+        """Ghi thêm một id (bỏ qua nếu đã có); note ghi sau id trên cùng dòng"""
+        with self.lock:
+            if video_id in self.ids:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                suffix = f"\t{' '.join(note.split())}" if note else ""
+                f.write(f"{self.EXTRACTOR} {video_id}{suffix}\n")
+            self.ids.add(video_id)
+            st = os.stat(self.path)
+            self.signature = (st.st_size, st.st_mtime_ns)
+
+
+# ==================== Phân loại lỗi ====================
+class FailureClassifier:
+    """Phân loại lỗi yt-dlp/ffmpeg theo output và exit code
+
+    permanent: video riêng tư/đã xoá/chỉ cho hội viên/bị chặn theo vùng... chạy lại cũng vậy.
+    transient: 403 fragment, 429, timeout, mất kết nối, "unable to extract"... nên thử lại sau.
+    unknown: không nhận ra, xử lý như transient (có giới hạn số lần thử).
+    """
+
+    PERMANENT = re.compile(
+        r"private video|video is private|video unavailable|has been removed|no longer available"
+        r"|account associated with this video has been terminated|members[- ]only|join this channel"
+        r"|available to this channel's members|copyright|not available in your country"
+        r"|blocked it in your country|confirm your age|inappropriate for some users", re.I)
+    TRANSIENT = re.compile(
+        r"http error (403|429|5\d\d)|too many requests|timed? ?out|connection (reset|refused|aborted)"
+        r"|temporary failure|name resolution|unable to (extract|download)|incompleteread"
+        r"|remote end closed|giving up after|fragment \d+ not found|confirm you.re not a bot|rate.limit", re.I)
+
+    @classmethod
+    def classify(cls, output, returncode=1, timed_out=False):
+        if timed_out or (returncode is not None and returncode < 0):
+            return 'transient'
+        if cls.PERMANENT.search(output or ''):
+            return 'permanent'
+        if cls.TRANSIENT.search(output or ''):
+            return 'transient'
+        return 'unknown'
+
+    @staticmethod
+    def summarize(output, limit=200):
+        """Dòng ERROR cuối (hoặc đoạn cuối) của output để log/ghi lại"""
+        lines = [line.strip() for line in (output or '').splitlines() if line.strip()]
+        errors = [line for line in lines if line.startswith('ERROR')]
+        return (errors or lines or ["Unknown error"])[-1][:limit]
+
+
+# ==================== Chỉ mục file đã tải ====================
+class OutputIndex:
+    """Chỉ mục append-only: mỗi video tải xong một bản ghi (JSONL hoặc CSV)
+
+    Công cụ phía sau chỉ cần đọc tiếp (tail) một file thay vì liệt kê cả thư mục lưu
+    và mở từng file .txt. Đường dẫn artifact tương đối theo thư mục lưu. Mỗi bản ghi
+    được flush ngay nên người đọc không thấy dòng dở (trừ khi máy tắt giữa lúc ghi).
+    """
+
+    ARTIFACTS = ('video', 'audio', 'thumbnail', 'title')
+    CSV_FIELDS = ['id', 'published_at', 'title', 'duration', 'views',
+                  'video', 'video_bytes', 'video_codec', 'video_fps',
+                  'audio', 'audio_bytes', 'audio_codec',
+                  'thumbnail', 'thumbnail_bytes', 'title_file', 'title_bytes',
+                  'missing', 'elapsed_seconds', 'finished_at']
+
+    def __init__(self, path, fmt='jsonl'):
+        self.path = path
+        self.fmt = fmt
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', encoding='utf-8', newline='')
+        self.writer = None
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(self.file, fieldnames=self.CSV_FIELDS)
+            if new_file:
+                self.writer.writeheader()
+
+    def write(self, record):
+        with self.lock:
+            if self.file is None:
+                return
+            if self.writer:
+                self.writer.writerow(self.flatten(record))
+            else:
+                self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+            self.file.flush()
+
+    @classmethod
+    def flatten(cls, record):
+        """Bản ghi JSON -> một dòng CSV"""
+        row = {k: record.get(k) for k in ('id', 'published_at', 'title', 'duration', 'views',
+                                          'elapsed_seconds', 'finished_at')}
+        row['missing'] = ' '.join(record.get('missing', []))
+        for artifact, info in record.get('artifacts', {}).items():
+            column = 'title_file' if artifact == 'title' else artifact
+            row[column] = info.get('path')
+            row[f'{artifact}_bytes'] = info.get('bytes')
+            for extra in ('codec', 'fps'):
+                if f'{artifact}_{extra}' in cls.CSV_FIELDS:
+                    row[f'{artifact}_{extra}'] = info.get(extra)
+        return row
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+# ==================== Ước tính dung lượng & chỗ trống ổ đĩa ====================
+class SizeEstimator:
+    """Ước tính số byte mỗi loại nội dung của một video
+
+    Có metadata định dạng (yt-dlp -j) thì chọn định dạng giống format_str khi tải,
+    không có thì tính theo thời lượng (API) x bitrate trung bình của chất lượng đã chọn.
+    """
+
+    # Bitrate trung bình (bit/s) của video + audio khi không có metadata định dạng
+    VIDEO_BITRATE = {'360p': 700_000, '480p': 1_200_000, '720p': 2_500_000,
+                     '1080p': 4_500_000, 'best': 12_000_000}
+    LOSSLESS_AUDIO_BITRATE = {'wav': 1_411_000, 'flac': 900_000}
+    THUMBNAIL_BYTES = 300 * 1024
+    TITLE_BYTES = 200
+
+    def __init__(self, quality, audio_format, audio_bitrate):
+        self.quality = quality
+        self.max_height = int(quality[:-1]) if quality[:-1].isdigit() else None
+        self.audio_format = audio_format
+        self.audio_bitrate = self.LOSSLESS_AUDIO_BITRATE.get(audio_format, self.parse_bitrate(audio_bitrate))
+
+    @staticmethod
+    def parse_bitrate(text):
+        """'320k' -> 320000 bit/s"""
+        text = str(text).strip().lower()
+        try:
+            return int(float(text[:-1]) * 1000) if text.endswith('k') else int(text)
+        except ValueError:
+            return 192_000
+
+    @staticmethod
+    def format_bytes(fmt, duration):
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        if size:
+            return int(size)
+        return int((fmt.get('tbr') or 0) * 1000 / 8 * (duration or 0))
+
+    def pick_video_bytes(self, info):
+        """Giống format_str: ưu tiên avc1 video-only <= chiều cao + audio m4a, không có thì định dạng gộp"""
+        duration = info.get('duration') or 0
+        formats = info.get('formats') or []
+        fits = [f for f in formats if f.get('vcodec') not in (None, 'none')
+                and (self.max_height is None or (f.get('height') or 0) <= self.max_height)]
+        video_only = [f for f in fits if f.get('acodec') in (None, 'none')]
+        audio_only = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')]
+        if video_only and audio_only:
+            rank = lambda f: (str(f.get('vcodec', '')).startswith('avc1'), f.get('height') or 0, f.get('tbr') or 0)
+            audio_rank = lambda f: (f.get('ext') == 'm4a', f.get('abr') or 0)
+            return (self.format_bytes(max(video_only, key=rank), duration)
+                    + self.format_bytes(max(audio_only, key=audio_rank), duration))
+        if fits:
+            return self.format_bytes(max(fits, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0)), duration)
+        return 0
+
+    def estimate(self, video, artifacts, info=None):
+        """{loại nội dung: số byte ước tính}"""
+        duration = (info or {}).get('duration') or video.get('duration') or 0
+        result = {}
+        if 'video' in artifacts:
+            size = self.pick_video_bytes(info) if info else 0
+            result['video'] = size or int(self.VIDEO_BITRATE.get(self.quality, 4_500_000) / 8 * duration)
+        if 'audio' in artifacts:
+            result['audio'] = int(self.audio_bitrate / 8 * duration)
+        if 'thumbnail' in artifacts:
+            result['thumbnail'] = self.THUMBNAIL_BYTES
+        if 'title' in artifacts:
+            result['title'] = self.TITLE_BYTES
+        return result
+
+
+class DiskSpaceTooSmall(RuntimeError):
+    """Job không vừa ổ đĩa kể cả khi không còn job nào khác giữ chỗ (chờ cũng vô ích)"""
+
+
+class DiskReservation:
+    """Phần chỗ trống một job đang giữ
+
+    written: hàm trả về số byte job đã thực sự ghi ra đĩa; phần đó đã nằm trong số đo
+    chỗ trống nên được trừ khỏi phần giữ chỗ (không tính hai lần).
+    """
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+        self.written = None
+
+    def outstanding(self, factor):
+        written = self.written() if self.written else 0
+        return max(0, self.nbytes * factor - written)
+
+
+class DiskSpaceGuard:
+    """Admission control theo chỗ trống ổ đĩa
+
+    Job mới chỉ được chạy khi chỗ trống còn lại (đã trừ phần các job đang chạy còn sẽ ghi)
+    sau khi trừ tiếp phần của job này vẫn trên ngưỡng min_free_bytes; nếu không thì chờ.
+    Không còn job nào giữ chỗ mà vẫn không vừa thì raise DiskSpaceTooSmall thay vì chờ mãi.
+    paths: {thư mục: hệ số} - hệ số là số lần dung lượng job chiếm ở thư mục đó lúc đỉnh
+    (file tải về + file sau khi ghép/chuyển mã). Thư mục cùng ổ đĩa được cộng dồn.
+    Byte đã ghi của job được trừ chung, không phân theo ổ (xấp xỉ khi dùng thư mục tạm ổ khác).
+    """
+
+    def __init__(self, paths, min_free_bytes, poll_interval=5.0):
+        self.devices = {}
+        for path, factor in paths.items():
+            os.makedirs(path, exist_ok=True)
+            device = os.stat(path).st_dev
+            probe, total = self.devices.get(device, (path, 0))
+            self.devices[device] = (probe, total + factor)
+        self.min_free_bytes = min_free_bytes
+        self.poll_interval = poll_interval
+        self.reservations = set()
+        self.cond = threading.Condition()
+
+    def shortfall(self, nbytes):
+        """None nếu job vừa; nếu không: (thư mục, số byte cần, chỗ trống còn lại sau phần đã giữ)"""
+        for path, factor in self.devices.values():
+            free = shutil.disk_usage(path).free - sum(r.outstanding(factor) for r in self.reservations)
+            if free - nbytes * factor < self.min_free_bytes:
+                return path, nbytes * factor + self.min_free_bytes, free
+        return None
+
+    def admit(self, nbytes, should_continue, on_wait=None):
+        """Chờ tới khi đủ chỗ rồi giữ nbytes; trả về DiskReservation, None nếu bị dừng trong lúc chờ"""
+        waited = False
+        with self.cond:
+            while True:
+                missing = self.shortfall(nbytes)
+                if not missing:
+                    break
+                if not self.reservations:
+                    path, need, free = missing
+                    raise DiskSpaceTooSmall(f"cần ~{need / 1024 ** 3:.1f} GB (kể cả phần dự phòng) ở {path}, "
+                                            f"ổ chỉ còn {free / 1024 ** 3:.1f} GB")
+                if not should_continue():
+                    return None
+                if on_wait and not waited:
+                    on_wait()
+                waited = True
+                self.cond.wait(self.poll_interval)
+            reservation = DiskReservation(nbytes)
+            self.reservations.add(reservation)
+            return reservation
+
+    def release(self, reservation):
+        with self.cond:
+            self.reservations.discard(reservation)
+            self.cond.notify_all()
+
+
+# ==================== Metadata video (info-json) ====================
+class InfoJsonCache:
+    """Cache info-json đầy đủ của yt-dlp trên đĩa, mỗi video một file <id>.info.json
+
+    Link stream trong info của YouTube hết hạn sau vài giờ nên entry quá ttl giây bị bỏ.
+    File được ghi tạm rồi os.replace, đọc song song từ nhiều worker vẫn an toàn.
+    """
+
+    def __init__(self, directory, ttl=3 * 3600):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.info.json")
+
+    def get_path(self, video_id):
+        """Đường dẫn info-json còn hạn, hoặc None (entry hết hạn bị xoá)"""
+        path = self.path(video_id)
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            return None
+        if age <= self.ttl:
+            return path
+        self.discard(video_id)
+        return None
+
+    def load(self, video_id):
+        path = self.get_path(video_id)
+        if not path:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, video_id, line):
+        """Ghi nguyên dòng JSON yt-dlp -j trả về (không parse lại)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(video_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(line)
+        os.replace(tmp_path, path)
+        return path
+
+    def discard(self, video_id):
+        try:
+            os.remove(self.path(video_id))
+        except OSError:
+            pass
+
+    def prune(self):
+        """Xoá entry hết hạn và file tạm sót lại (worker chết giữa lúc ghi); trả về số file đã xoá"""
+        removed = 0
+        now = time.time()
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return 0
+        for entry in entries:
+            try:
+                if entry.name.endswith(".tmp") or now - entry.stat().st_mtime > self.ttl:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+class InfoPrefetcher:
+    """Chạy extraction (yt-dlp -j) trước các worker tải, theo thứ tự hàng đợi
+
+    Tối đa `workers` lô chạy cùng lúc và không chạy trước quá `lookahead` video so với
+    số video worker đã lấy, để info không hết hạn trước khi được dùng.
+    """
+
+    def __init__(self, extract_batch, video_ids, workers, batch_size=10, lookahead=100):
+        self.extract_batch = extract_batch
+        # Lô đầu nhỏ (1, 2, 4, ...) để worker đầu tiên không phải chờ cả lô lớn
+        self.batches = []
+        start, size = 0, 1
+        while start < len(video_ids):
+            self.batches.append(video_ids[start:start + size])
+            start += size
+            size = min(batch_size, size * 2)
+        self.events = {video_id: threading.Event() for video_id in video_ids}
+        self.workers = max(1, workers)
+        self.lookahead = max(batch_size, lookahead)
+        self.submitted = 0
+        self.consumed = 0
+        self.waited = set()
+        self.stopped = False
+        self.cond = threading.Condition()
+        self.executor = None
+
+    def start(self):
+        self.executor = concurrent_futures.ThreadPoolExecutor(max_workers=self.workers)
+        threading.Thread(target=self._feed, daemon=True).start()
+        return self
+
+    def _feed(self):
+        for batch in self.batches:
+            with self.cond:
+                while self.submitted - self.consumed >= self.lookahead and not self.stopped:
+                    self.cond.wait()
+                if self.stopped:
+                    return
+                self.submitted += len(batch)
+            self.executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            if not self.stopped:
+                self.extract_batch(batch)
+        finally:
+            for video_id in batch:
+                self.events[video_id].set()
+
+    def wait(self, video_id, timeout=300):
+        """Worker gọi trước khi tải: chờ lô chứa video này xong (True nếu đã chạy xong)"""
+        with self.cond:
+            # Job thử lại gọi wait lần nữa cho cùng id: chỉ đếm một lần để cửa sổ lookahead không trôi
+            if video_id in self.events and video_id not in self.waited:
+                self.waited.add(video_id)
+                self.consumed += 1
+                self.cond.notify_all()
+        event = self.events.get(video_id)
+        return bool(event and event.wait(timeout))
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# ==================== Danh sách video (ảo hoá) ====================
+class VirtualVideoList:
+    """Treeview chỉ giữ một số dòng cố định, cuộn bằng cách đổi nội dung các dòng đó
+
+    Kênh 100k video không tạo 100k item Tk: `items` là danh sách video (đã lọc,
+    đã sắp xếp), scrollbar/con lăn chỉ đổi `offset` rồi vẽ lại các dòng đang hiện.
+    Trạng thái tải gửi từ thread worker được gom lại và áp dụng theo lô trên thread Tk.
+    """
+    
+    COLUMNS = (('pick', '✔', 30), ('date', 'Ngày', 90), ('id', 'ID', 110), ('title', 'Tiêu đề', 330),
+               ('duration', 'Thời lượng', 80), ('views', 'Lượt xem', 100), ('status', 'Trạng thái', 110))
+    SORT_KEYS = {
+        'date': lambda v: v['published_at'],
+        'id': lambda v: v['id'],
+        'title': lambda v: v['title'].lower(),
+        'duration': lambda v: v.get('duration', 0),
+        'views': lambda v: v.get('views', 0),
+    }
+    STATUS_TEXT = {
+        'queued': '⏳ Chờ tải',
+        'downloading': '⬇️ Đang tải',
+        'retry': '🔁 Chờ thử lại',
+        'verifying': '🔍 Đang kiểm tra',
+        'done': '✅ Xong',
+        'failed': '❌ Lỗi',
+        'permanent': '⛔ Lỗi vĩnh viễn',
+    }
+    FLUSH_MS = 250
+    
+    def __init__(self, parent, rows=15, on_pick=None):
+        self.frame = ttk.Frame(parent)
+        self.on_pick = on_pick
+        self.tree = ttk.Treeview(self.frame, columns=[c[0] for c in self.COLUMNS], show='headings',
+                                 height=rows, selectmode='none')
+        for key, text, width in self.COLUMNS:
+            command = (lambda k=key: self.sort_by(k)) if key in self.SORT_KEYS else ''
+            self.tree.heading(key, text=text, command=command)
+            self.tree.column(key, width=width, stretch=(key == 'title'),
+                             anchor=tk.W if key in ('title', 'id') else tk.CENTER)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        self.rows = [self.tree.insert('', tk.END, iid=f"row{i}") for i in range(rows)]
+        self.items = []
+        self.offset = 0
+        self.sort_key = None
+        self.sort_reverse = False
+        self.picked = set()
+        self.status = {}
+        # Trạng thái từ worker chờ áp dụng: chỉ dict + lock, không gọi Tk ngoài thread chính
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.flush_scheduled = False
+        
+        for sequence, step in (("<MouseWheel>", None), ("<Button-4>", -3), ("<Button-5>", 3)):
+            self.tree.bind(sequence, lambda e, s=step: self.on_wheel(e, s))
+        self.tree.bind("<Prior>", lambda e: self.scroll(-len(self.rows)))
+        self.tree.bind("<Next>", lambda e: self.scroll(len(self.rows)))
+        self.tree.bind("<Button-1>", self.on_click)
+        
+    def set_items(self, videos):
+        """Thay danh sách hiển thị (giữ cách sắp xếp hiện tại)"""
+        self.items = list(videos)
+        if self.sort_key:
+            self.items.sort(key=self.SORT_KEYS[self.sort_key], reverse=self.sort_reverse)
+        self.offset = min(self.offset, max(0, len(self.items) - len(self.rows)))
+        self.render()
+        
+    def sort_by(self, key):
+        """Bấm tiêu đề cột: sắp xếp theo cột đó, bấm lần nữa để đảo chiều"""
+        self.sort_reverse = not self.sort_reverse if self.sort_key == key else key in ('date', 'views')
+        if self.sort_key and self.sort_key != key:
+            self.tree.heading(self.sort_key, text=dict((k, t) for k, t, _ in self.COLUMNS)[self.sort_key])
+        self.sort_key = key
+        text = dict((k, t) for k, t, _ in self.COLUMNS)[key]
+        self.tree.heading(key, text=f"{text} {'▼' if self.sort_reverse else '▲'}")
+        self.items.sort(key=self.SORT_KEYS[key], reverse=self.sort_reverse)
+        self.offset = 0
+        self.render()
+        
+    def scroll(self, delta):
+        offset = max(0, min(self.offset + delta, len(self.items) - len(self.rows)))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        return "break"
+        
+    def on_wheel(self, event, step):
+        # "break" để con lăn không cuộn luôn canvas chính (bind_all)
+        return self.scroll(step if step is not None else -3 * int(event.delta / 120))
+        
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.scroll(int(float(amount) * len(self.items)) - self.offset)
+        elif unit == 'pages':
+            self.scroll(int(amount) * len(self.rows))
+        else:
+            self.scroll(int(amount))
+            
+    def on_click(self, event):
+        """Bấm vào một dòng để chọn/bỏ chọn video đó"""
+        if self.tree.identify_region(event.x, event.y) != 'cell':
+            return None
+        row = self.tree.identify_row(event.y)
+        index = self.offset + self.rows.index(row) if row in self.rows else len(self.items)
+        if index >= len(self.items):
+            return "break"
+        video_id = self.items[index]['id']
+        if video_id in self.picked:
+            self.picked.discard(video_id)
+        else:
+            self.picked.add(video_id)
+        self.render()
+        if self.on_pick:
+            self.on_pick(len(self.picked))
+        return "break"
+        
+    def set_picked(self, video_ids):
+        self.picked = set(video_ids)
+        self.render()
+        if self.on_pick:
+            self.on_pick(len(self.picked))
+            
+    def row_values(self, video):
+        duration = video.get('duration')
+        if duration is None:
+            duration_text = ''
+        else:
+            minutes, seconds = divmod(int(duration), 60)
+            hours, minutes = divmod(minutes, 60)
+            duration_text = f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+        views = video.get('views')
+        return ('✔' if video['id'] in self.picked else '',
+                video['published_at'][:10],
+                video['id'],
+                video['title'],
+                duration_text,
+                f"{views:,}" if views is not None else '',
+                self.STATUS_TEXT.get(self.status.get(video['id']), ''))
+        
+    def render(self):
+        """Vẽ lại các dòng đang hiện (chỉ len(rows) item Tk, không phụ thuộc số video)"""
+        for i, row in enumerate(self.rows):
+            index = self.offset + i
+            values = self.row_values(self.items[index]) if index < len(self.items) else ()
+            self.tree.item(row, values=values)
+        total = len(self.items)
+        if total > len(self.rows):
+            self.scrollbar.set(self.offset / total, (self.offset + len(self.rows)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+            
+    def set_status(self, video_id, status):
+        """Gọi được từ mọi thread: gom trạng thái, một lần after() cho mỗi lô"""
+        with self.pending_lock:
+            self.pending[video_id] = status
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.tree.after(self.FLUSH_MS, self.flush)
+        
+    def flush(self):
+        """Áp dụng các trạng thái đã gom; chỉ vẽ lại nếu có video đang hiện bị đổi"""
+        with self.pending_lock:
+            pending, self.pending = self.pending, {}
+            self.flush_scheduled = False
+        self.status.update(pending)
+        visible = {video['id'] for video in self.items[self.offset:self.offset + len(self.rows)]}
+        if not visible.isdisjoint(pending):
+            self.render()
+            
+    def clear_status(self):
+        with self.pending_lock:
+            self.pending = {}
+        self.status = {}
+        self.render()
+        
+    def retain(self, video_ids):
+        """Danh sách video vừa được thay (quét kênh khác, cập nhật lượt xem):
+        bỏ lựa chọn và trạng thái của các video không còn trong danh sách"""
+        with self.pending_lock:
+            self.pending = {k: s for k, s in self.pending.items() if k in video_ids}
+        self.status = {k: s for k, s in self.status.items() if k in video_ids}
+        self.picked = self.picked & video_ids
+        if self.on_pick:
+            self.on_pick(len(self.picked))
+
+
+# ==================== Chế độ headless ====================
+class SettingVar:
+    """Thay thế tk.Variable (get/set) khi chạy không có giao diện"""
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
 
 
 class YouTubeChannelDownloader:
-    def __init__(self, root):
+    # Khóa trong settings.json -> tên biến UI tương ứng
+    SETTING_VARS = {
+        'api_key': 'api_key_var',
+        'cookie_file': 'cookie_var',
+        'channel_url': 'channel_url_var',
+        'download_video': 'download_video_var',
+        'download_audio': 'download_audio_var',
+        'download_thumbnail': 'download_thumbnail_var',
+        'download_title': 'download_title_var',
+        'video_quality': 'video_quality_var',
+        'video_fps': 'video_fps_var',
+        'audio_format': 'audio_format_var',
+        'audio_bitrate': 'audio_bitrate_var',
+        'thumb_size': 'thumb_size_var',
+        'thumb_width': 'thumb_width_var',
+        'thumb_height': 'thumb_height_var',
+        'use_date_filter': 'use_date_filter',
+        'date_from': 'date_from_var',
+        'date_to': 'date_to_var',
+        'use_duration_filter': 'use_duration_filter',
+        'duration_min': 'duration_min_var',
+        'duration_max': 'duration_max_var',
+        'use_view_filter': 'use_view_filter',
+        'view_min': 'view_min_var',
+        'view_max': 'view_max_var',
+        'thread_count': 'thread_count_var',
+        'concurrent_fragments': 'concurrent_fragments_var',
+        'connection_budget': 'connection_budget_var',
+        'profiling': 'profiling_var',
+        'use_download_archive': 'use_download_archive_var',
+        'download_archive': 'download_archive_var',
+        'scratch_dir': 'scratch_dir_var',
+        'preflight': 'preflight_var',
+        'prefetch_info': 'prefetch_info_var',
+        'segment_transcode': 'segment_transcode_var',
+        'segment_min_minutes': 'segment_min_minutes_var',
+        'transcode_cpus': 'transcode_cpus_var',
+        'min_free_gb': 'min_free_gb_var',
+        'api_cache': 'api_cache_var',
+        'api_cache_stats_minutes': 'api_cache_stats_minutes_var',
+        'refresh_details': 'refresh_details_var',
+        'output_index': 'output_index_var',
+        'max_retries': 'max_retries_var',
+        'stall_seconds': 'stall_seconds_var',
+        'skip_permanent_failures': 'skip_permanent_failures_var',
+        'verify_downloads': 'verify_downloads_var',
+        'output_dir': 'output_dir_var',
+    }
+    
+    # Settings theo từng máy: worker giữ giá trị của mình, phần còn lại lấy từ coordinator
+    MACHINE_SETTINGS = ('api_key', 'cookie_file', 'thread_count', 'concurrent_fragments', 'connection_budget',
+                        'profiling', 'download_archive', 'scratch_dir', 'min_free_gb', 'transcode_cpus',
+                        'output_dir')
+    
+    def __init__(self, root, settings=None):
+        """root=None: chạy headless (benchmark, dòng lệnh), settings lấy từ dict truyền vào"""
         self.root = root
-        self.root.title("YouTube Channel Downloader v2.2")
-        self.root.geometry("950x850")
-        self.root.resizable(True, True)
+        self.headless = root is None
         
-        # Đường dẫn tools
+        # Đường dẫn tools (tìm ở lần dùng đầu tiên, xem find_tool)
         self.base_path = BASE_PATH
-        self.ytdlp_path = os.path.join(self.base_path, "yt-dlp.exe")
-        self.ffmpeg_path = os.path.join(self.base_path, "ffmpeg.exe")
+        self._ytdlp_path = None
+        self._ffmpeg_path = None
         self.settings_file = os.path.join(self.base_path, "settings.json")
         self.icon_path = os.path.join(self.base_path, "icon.ico")
         
-        # Set icon cho window
-        self.set_window_icon()
-        
-        # Kiểm tra nếu không có .exe thì dùng command line (Linux/Mac)
-        if not os.path.exists(self.ytdlp_path):
-            self.ytdlp_path = "yt-dlp"
-        if not os.path.exists(self.ffmpeg_path):
-            self.ffmpeg_path = "ffmpeg"
+        if not self.headless:
+            self.root.title("YouTube Channel Downloader v2.2")
+            self.root.geometry("950x850")
+            self.root.resizable(True, True)
+            
+            # Set icon cho window
+            self.set_window_icon()
         
         self.videos = []
         self.is_downloading = False
         self.download_executor = None
+        self.connection_budget = None
+        self.metrics = RunMetrics("idle")
+        self.journal = None
+        self.resume_jobs = None
+        self.download_archive = None
+        self.active_archive = None
+        self.size_estimates = {}
+        self.disk_guard = None
+        self.info_cache = None
+        self.prefetcher = None
+        self.transcode_slots = None
+        self.transcode_threads_per_job = None
+        self.key_pool = None
+        self.api_quota_file = os.path.join(self.base_path, "api_quota.json")
+        self.api_cache_dir = os.path.join(self.base_path, "_api_cache")
+        # Cache info-json khi không có thư mục tạm: ổ cục bộ cạnh tool, không phải thư mục lưu (NAS)
+        self.info_cache_dir = os.path.join(self.base_path, "_info_cache")
+        self.output_index = None
+        self.http = None
+        self.permanent_failures = None
+        self.active_failures = None
+        # Lỗi của các lệnh trong job đang chạy ở mỗi thread (xem run_download_job)
+        self.job_failures = threading.local()
+        # Thời gian tải của video đang chờ kiểm tra (chỉ mục ghi sau khi verify_download đạt)
+        self.download_elapsed = {}
+        self.quarantined = set()
+        self.retry_base_seconds = 10.0
+        # Chế độ service: nhận (đã xong, tổng) sau mỗi video
+        self.progress_hook = None
+        self.api_cache = None
+        self.api_refresh = False
+        self.video_list = None
         
+        if self.headless:
+            for attr in self.SETTING_VARS.values():
+                setattr(self, attr, SettingVar())
+            self.apply_settings(settings or {})
+            return
+            
         self.setup_ui()
         self.load_settings()
         
         # Lưu settings khi đóng app
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
+        # Lần trước bị tắt giữa chừng: đề nghị tải tiếp từ nhật ký
+        self.root.after_idle(self.offer_resume)
+        
+    def find_tool(self, name):
+        """Ưu tiên <name>.exe cạnh tool, nếu không có thì dùng command line (Linux/Mac)"""
+        exe_path = os.path.join(self.base_path, f"{name}.exe")
+        return exe_path if os.path.exists(exe_path) else name
+        
+    @property
+    def ytdlp_path(self):
+        if self._ytdlp_path is None:
+            self._ytdlp_path = self.find_tool("yt-dlp")
+        return self._ytdlp_path
+        
+    @ytdlp_path.setter
+    def ytdlp_path(self, path):
+        self._ytdlp_path = path
+        
+    @property
+    def ffmpeg_path(self):
+        if self._ffmpeg_path is None:
+            self._ffmpeg_path = self.find_tool("ffmpeg")
+        return self._ffmpeg_path
+        
+    @ffmpeg_path.setter
+    def ffmpeg_path(self, path):
+        self._ffmpeg_path = path
+        
+    def report_startup_time(self):
+        """Ghi thời gian khởi động và cảnh báo nếu vượt ngân sách"""
+        elapsed = time.perf_counter() - STARTUP_STARTED
+        if elapsed > STARTUP_BUDGET_SECONDS:
+            self.log(f"⚠️ Khởi động chậm: {elapsed:.2f}s (ngân sách {STARTUP_BUDGET_SECONDS:.2f}s)")
+        else:
+            self.log(f"⏱️ Khởi động: {elapsed:.2f}s")
+        return elapsed
+        
     def set_window_icon(self):
         """Set icon cho cửa sổ"""
         try:
@@ -124,6 +1805,26 @@ class YouTubeChannelDownloader:
             'view_min': '0',
             'view_max': '999999999',
             'thread_count': '3',
+            'concurrent_fragments': 'auto',
+            'connection_budget': '16',
+            'profiling': False,
+            'use_download_archive': True,
+            'download_archive': os.path.join(self.base_path, "download_archive.txt"),
+            'scratch_dir': '',
+            'preflight': False,
+            'prefetch_info': True,
+            'segment_transcode': True,
+            'segment_min_minutes': '20',
+            'transcode_cpus': str(os.cpu_count() or 2),
+            'min_free_gb': '2',
+            'api_cache': True,
+            'api_cache_stats_minutes': '60',
+            'refresh_details': False,
+            'output_index': 'jsonl',
+            'max_retries': '3',
+            'stall_seconds': '45',
+            'skip_permanent_failures': True,
+            'verify_downloads': True,
             'output_dir': os.path.join(self.base_path, "downloads")
         }
         
@@ -135,43 +1836,11 @@ class YouTubeChannelDownloader:
                     settings = json.load(f)
                     
                 # Apply settings
-                defaults = self.get_default_settings()
-                
-                self.api_key_var.set(settings.get('api_key', defaults['api_key']))
-                self.cookie_var.set(settings.get('cookie_file', defaults['cookie_file']))
-                self.channel_url_var.set(settings.get('channel_url', defaults['channel_url']))
-                
-                self.download_video_var.set(settings.get('download_video', defaults['download_video']))
-                self.download_audio_var.set(settings.get('download_audio', defaults['download_audio']))
-                self.download_thumbnail_var.set(settings.get('download_thumbnail', defaults['download_thumbnail']))
-                self.download_title_var.set(settings.get('download_title', defaults['download_title']))
-                
-                self.video_quality_var.set(settings.get('video_quality', defaults['video_quality']))
-                self.video_fps_var.set(settings.get('video_fps', defaults['video_fps']))
-                self.audio_format_var.set(settings.get('audio_format', defaults['audio_format']))
-                self.audio_bitrate_var.set(settings.get('audio_bitrate', defaults['audio_bitrate']))
-                
-                self.thumb_size_var.set(settings.get('thumb_size', defaults['thumb_size']))
-                self.thumb_width_var.set(settings.get('thumb_width', defaults['thumb_width']))
-                self.thumb_height_var.set(settings.get('thumb_height', defaults['thumb_height']))
-                
-                self.use_date_filter.set(settings.get('use_date_filter', defaults['use_date_filter']))
-                self.date_from_var.set(settings.get('date_from', defaults['date_from']))
-                self.date_to_var.set(settings.get('date_to', defaults['date_to']))
-                
-                self.use_duration_filter.set(settings.get('use_duration_filter', defaults['use_duration_filter']))
-                self.duration_min_var.set(settings.get('duration_min', defaults['duration_min']))
-                self.duration_max_var.set(settings.get('duration_max', defaults['duration_max']))
-                
-                self.use_view_filter.set(settings.get('use_view_filter', defaults['use_view_filter']))
-                self.view_min_var.set(settings.get('view_min', defaults['view_min']))
-                self.view_max_var.set(settings.get('view_max', defaults['view_max']))
-                
-                self.thread_count_var.set(settings.get('thread_count', defaults['thread_count']))
-                self.output_dir_var.set(settings.get('output_dir', defaults['output_dir']))
+                self.apply_settings(settings)
                 
                 # Update custom thumbnail UI if needed
-                self.on_thumb_size_change()
+                if not self.headless:
+                    self.on_thumb_size_change()
                 
                 self.log("✅ Đã load settings từ lần sử dụng trước")
         except Exception as e:
@@ -180,33 +1849,7 @@ class YouTubeChannelDownloader:
     def save_settings(self):
         """Lưu settings vào file"""
         try:
-            settings = {
-                'api_key': self.api_key_var.get(),
-                'cookie_file': self.cookie_var.get(),
-                'channel_url': self.channel_url_var.get(),
-                'download_video': self.download_video_var.get(),
-                'download_audio': self.download_audio_var.get(),
-                'download_thumbnail': self.download_thumbnail_var.get(),
-                'download_title': self.download_title_var.get(),
-                'video_quality': self.video_quality_var.get(),
-                'video_fps': self.video_fps_var.get(),
-                'audio_format': self.audio_format_var.get(),
-                'audio_bitrate': self.audio_bitrate_var.get(),
-                'thumb_size': self.thumb_size_var.get(),
-                'thumb_width': self.thumb_width_var.get(),
-                'thumb_height': self.thumb_height_var.get(),
-                'use_date_filter': self.use_date_filter.get(),
-                'date_from': self.date_from_var.get(),
-                'date_to': self.date_to_var.get(),
-                'use_duration_filter': self.use_duration_filter.get(),
-                'duration_min': self.duration_min_var.get(),
-                'duration_max': self.duration_max_var.get(),
-                'use_view_filter': self.use_view_filter.get(),
-                'view_min': self.view_min_var.get(),
-                'view_max': self.view_max_var.get(),
-                'thread_count': self.thread_count_var.get(),
-                'output_dir': self.output_dir_var.get()
-            }
+            settings = self.collect_settings()
             
             with open(self.settings_file, 'w', encoding='utf-8') as f:
                 json.dump(settings, f, ensure_ascii=False, indent=2)
@@ -214,6 +1857,16 @@ class YouTubeChannelDownloader:
         except Exception as e:
             print(f"Không thể lưu settings: {str(e)}")
             
+    def apply_settings(self, settings, defaults=None):
+        """Gán giá trị settings (dict) vào các biến UI/headless"""
+        defaults = defaults or self.get_default_settings()
+        for key, attr in self.SETTING_VARS.items():
+            getattr(self, attr).set(settings.get(key, defaults[key]))
+            
+    def collect_settings(self):
+        """Đọc settings hiện tại từ các biến UI/headless"""
+        return {key: getattr(self, attr).get() for key, attr in self.SETTING_VARS.items()}
+        
     def on_closing(self):
         """Xử lý khi đóng app"""
         self.save_settings()
@@ -254,6 +1907,8 @@ class YouTubeChannelDownloader:
         self.show_api_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(api_row, text="Hiện", variable=self.show_api_var, 
                        command=self.toggle_api_visibility).pack(side=tk.LEFT)
+        ttk.Label(api_row, text="(nhiều key: cách nhau bởi dấu phẩy)",
+                 foreground="gray").pack(side=tk.LEFT, padx=5)
         
         # Cookie file
         cookie_row = ttk.Frame(settings_frame)
@@ -273,6 +1928,8 @@ class YouTubeChannelDownloader:
         self.channel_url_var = tk.StringVar()
         ttk.Entry(channel_row, textvariable=self.channel_url_var, width=55).pack(side=tk.LEFT, padx=5)
         ttk.Button(channel_row, text="🔍 Quét Video", command=self.scan_channel).pack(side=tk.LEFT, padx=5)
+        ttk.Button(channel_row, text="♻️ Làm mới",
+                  command=lambda: self.scan_channel(force_refresh=True)).pack(side=tk.LEFT)
         
         # ==================== Download Options ====================
         options_frame = ttk.LabelFrame(main_frame, text="📥 Tùy chọn tải", padding="10")
@@ -421,6 +2078,12 @@ class YouTubeChannelDownloader:
         self.view_max_var = tk.StringVar(value="999999999")
         ttk.Entry(view_frame, textvariable=self.view_max_var, width=12).pack(side=tk.LEFT)
         
+        ttk.Button(view_frame, text="📈 Cập nhật lượt xem",
+                  command=self.refresh_stats).pack(side=tk.LEFT, padx=10)
+        self.refresh_details_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(view_frame, text="Kèm thời lượng",
+                       variable=self.refresh_details_var).pack(side=tk.LEFT)
+        
         # ==================== Thread & Output Settings ====================
         output_frame = ttk.LabelFrame(main_frame, text="📁 Cài đặt xuất", padding="10")
         output_frame.pack(fill=tk.X, pady=5)
@@ -437,6 +2100,71 @@ class YouTubeChannelDownloader:
         ttk.Label(thread_row, text="(1-10 luồng song song)", 
                  foreground="gray").pack(side=tk.LEFT, padx=10)
         
+        # Fragment concurrency & connection budget
+        fragment_row = ttk.Frame(output_frame)
+        fragment_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(fragment_row, text="Fragment song song:", width=18).pack(side=tk.LEFT)
+        self.concurrent_fragments_var = tk.StringVar(value="auto")
+        ttk.Combobox(fragment_row, textvariable=self.concurrent_fragments_var,
+                     values=["auto", "1", "2", "4", "8", "16"], width=6, state="readonly").pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(fragment_row, text="Tổng kết nối:", width=12).pack(side=tk.LEFT, padx=10)
+        self.connection_budget_var = tk.StringVar(value="16")
+        ttk.Spinbox(fragment_row, from_=1, to=64,
+                    textvariable=self.connection_budget_var, width=5).pack(side=tk.LEFT, padx=5)
+        ttk.Label(fragment_row, text="(auto: chia đều cho các video đang tải)",
+                 foreground="gray").pack(side=tk.LEFT, padx=10)
+        
+        # Profiling
+        profiling_row = ttk.Frame(output_frame)
+        profiling_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(profiling_row, text="Chẩn đoán:", width=18).pack(side=tk.LEFT)
+        self.profiling_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(profiling_row, text="Bật profiling (cProfile + sampling + tracemalloc)",
+                       variable=self.profiling_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(profiling_row, text="(lưu vào thư mục _profiles)",
+                 foreground="gray").pack(side=tk.LEFT, padx=10)
+        
+        # Global download archive
+        archive_row = ttk.Frame(output_frame)
+        archive_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(archive_row, text="Archive:", width=18).pack(side=tk.LEFT)
+        self.use_download_archive_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(archive_row, text="Bỏ qua video đã tải",
+                       variable=self.use_download_archive_var).pack(side=tk.LEFT, padx=5)
+        self.download_archive_var = tk.StringVar(value=os.path.join(self.base_path, "download_archive.txt"))
+        ttk.Entry(archive_row, textvariable=self.download_archive_var, width=40).pack(side=tk.LEFT, padx=5)
+        ttk.Label(archive_row, text="(định dạng --download-archive)",
+                 foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        # Retries & permanent failures
+        retry_row = ttk.Frame(output_frame)
+        retry_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(retry_row, text="Thử lại khi lỗi:", width=18).pack(side=tk.LEFT)
+        self.max_retries_var = tk.StringVar(value="3")
+        ttk.Spinbox(retry_row, from_=0, to=10, textvariable=self.max_retries_var, width=5).pack(side=tk.LEFT, padx=5)
+        ttk.Label(retry_row, text="lần (lỗi tạm thời, chờ tăng dần)").pack(side=tk.LEFT)
+        ttk.Label(retry_row, text="Treo quá (giây):").pack(side=tk.LEFT, padx=10)
+        self.stall_seconds_var = tk.StringVar(value="45")
+        ttk.Spinbox(retry_row, from_=10, to=3600, textvariable=self.stall_seconds_var, width=6).pack(side=tk.LEFT)
+        self.skip_permanent_failures_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(retry_row, text="Bỏ qua video lỗi vĩnh viễn (private/đã xoá/hội viên)",
+                       variable=self.skip_permanent_failures_var).pack(side=tk.LEFT, padx=10)
+        
+        # Kiểm tra file sau khi tải
+        verify_row = ttk.Frame(output_frame)
+        verify_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(verify_row, text="Kiểm tra file:", width=18).pack(side=tk.LEFT)
+        self.verify_downloads_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(verify_row, text="ffprobe từng file vừa tải (container, codec, FPS, thời lượng, "
+                                         "kích thước thumbnail), sai thì tự tải lại",
+                       variable=self.verify_downloads_var).pack(side=tk.LEFT, padx=5)
+        
         # Output directory
         output_row = ttk.Frame(output_frame)
         output_row.pack(fill=tk.X, pady=3)
@@ -446,6 +2174,85 @@ class YouTubeChannelDownloader:
         ttk.Entry(output_row, textvariable=self.output_dir_var, width=50).pack(side=tk.LEFT, padx=5)
         ttk.Button(output_row, text="Browse", command=self.browse_output).pack(side=tk.LEFT, padx=5)
         
+        # Scratch directory (SSD/tmpfs) cho file trung gian
+        scratch_row = ttk.Frame(output_frame)
+        scratch_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(scratch_row, text="Thư mục tạm:", width=18).pack(side=tk.LEFT)
+        self.scratch_dir_var = tk.StringVar(value="")
+        ttk.Entry(scratch_row, textvariable=self.scratch_dir_var, width=50).pack(side=tk.LEFT, padx=5)
+        ttk.Button(scratch_row, text="Browse", command=self.browse_scratch).pack(side=tk.LEFT, padx=5)
+        ttk.Label(scratch_row, text="(trống = thư mục _work trong thư mục lưu)",
+                 foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        # Pre-flight size estimation & disk space admission
+        space_row = ttk.Frame(output_frame)
+        space_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(space_row, text="Dung lượng:", width=18).pack(side=tk.LEFT)
+        self.preflight_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(space_row, text="Ước tính trước bằng yt-dlp -j",
+                       variable=self.preflight_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(space_row, text="Chừa trống tối thiểu (GB):").pack(side=tk.LEFT, padx=10)
+        self.min_free_gb_var = tk.StringVar(value="2")
+        ttk.Spinbox(space_row, from_=0, to=1000,
+                    textvariable=self.min_free_gb_var, width=5).pack(side=tk.LEFT, padx=5)
+        ttk.Label(space_row, text="(chờ khi ổ sắp đầy)",
+                 foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        # Metadata prefetch
+        prefetch_row = ttk.Frame(output_frame)
+        prefetch_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(prefetch_row, text="Metadata:", width=18).pack(side=tk.LEFT)
+        self.prefetch_info_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(prefetch_row, text="Lấy trước info-json và dùng lại khi tải (--load-info-json)",
+                       variable=self.prefetch_info_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(prefetch_row, text="(cache trong thư mục tạm, không có thì cạnh tool)",
+                 foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        # Output index
+        index_row = ttk.Frame(output_frame)
+        index_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(index_row, text="Chỉ mục:", width=18).pack(side=tk.LEFT)
+        self.output_index_var = tk.StringVar(value="jsonl")
+        ttk.Combobox(index_row, textvariable=self.output_index_var,
+                     values=["jsonl", "csv", "off"], width=8, state="readonly").pack(side=tk.LEFT, padx=5)
+        ttk.Label(index_row, text="(_index/videos.jsonl|csv: mỗi video tải xong một dòng)",
+                 foreground="gray").pack(side=tk.LEFT, padx=5)
+        
+        # API response cache
+        api_cache_row = ttk.Frame(output_frame)
+        api_cache_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(api_cache_row, text="Cache API:", width=18).pack(side=tk.LEFT)
+        self.api_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(api_cache_row, text="Lưu phản hồi API (kênh: 7 ngày, danh sách: 15 phút)",
+                       variable=self.api_cache_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(api_cache_row, text="Lượt xem/thời lượng (phút):").pack(side=tk.LEFT, padx=5)
+        self.api_cache_stats_minutes_var = tk.StringVar(value="60")
+        ttk.Spinbox(api_cache_row, from_=0, to=10080,
+                    textvariable=self.api_cache_stats_minutes_var, width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Button(api_cache_row, text="Xoá cache", command=self.clear_api_cache).pack(side=tk.LEFT, padx=5)
+        
+        # Segment-parallel transcoding
+        segment_row = ttk.Frame(output_frame)
+        segment_row.pack(fill=tk.X, pady=3)
+        
+        ttk.Label(segment_row, text="Chuyển mã:", width=18).pack(side=tk.LEFT)
+        self.segment_transcode_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(segment_row, text="Chia đoạn video dài, mã hoá song song",
+                       variable=self.segment_transcode_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(segment_row, text="Từ (phút):").pack(side=tk.LEFT, padx=5)
+        self.segment_min_minutes_var = tk.StringVar(value="20")
+        ttk.Spinbox(segment_row, from_=1, to=600,
+                    textvariable=self.segment_min_minutes_var, width=5).pack(side=tk.LEFT, padx=5)
+        ttk.Label(segment_row, text="CPU mã hoá:").pack(side=tk.LEFT, padx=5)
+        self.transcode_cpus_var = tk.StringVar(value=str(os.cpu_count() or 2))
+        ttk.Spinbox(segment_row, from_=1, to=128,
+                    textvariable=self.transcode_cpus_var, width=5).pack(side=tk.LEFT, padx=5)
+        
         # Filename format info
         format_row = ttk.Frame(output_frame)
         format_row.pack(fill=tk.X, pady=3)
@@ -453,6 +2260,35 @@ class YouTubeChannelDownloader:
         ttk.Label(format_row, text="YYYYMMDD_videoID (VD: 20251227_cpnTKFEHa74.mp4)", 
                  foreground="blue").pack(side=tk.LEFT)
         
+        # ==================== Video List ====================
+        list_frame = ttk.LabelFrame(main_frame, text="🎞️ Danh sách video", padding="5")
+        list_frame.pack(fill=tk.BOTH, pady=5)
+        
+        list_tools = ttk.Frame(list_frame)
+        list_tools.pack(fill=tk.X, pady=3)
+        ttk.Label(list_tools, text="Tìm (tiêu đề/ID):").pack(side=tk.LEFT)
+        self.list_search_var = tk.StringVar(value="")
+        ttk.Entry(list_tools, textvariable=self.list_search_var, width=30).pack(side=tk.LEFT, padx=5)
+        ttk.Button(list_tools, text="Chọn tất cả (sau lọc)",
+                  command=lambda: self.video_list.set_picked(v['id'] for v in self.video_list.items)
+                  ).pack(side=tk.LEFT, padx=5)
+        ttk.Button(list_tools, text="Bỏ chọn",
+                  command=lambda: self.video_list.set_picked(())).pack(side=tk.LEFT, padx=5)
+        self.pick_label = ttk.Label(list_tools, text="Chưa chọn: tải mọi video sau lọc", foreground="gray")
+        self.pick_label.pack(side=tk.LEFT, padx=10)
+        
+        self.video_list = VirtualVideoList(list_frame, rows=12, on_pick=self.on_video_pick)
+        self.video_list.frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Lọc lại danh sách khi sửa bộ lọc / ô tìm (gom các lần gõ phím liên tiếp)
+        self.list_filter_job = None
+        self.list_filter_cache = (None, None, [])
+        self.list_search_cache = ("", [])
+        for var in (self.use_date_filter, self.date_from_var, self.date_to_var,
+                    self.use_duration_filter, self.duration_min_var, self.duration_max_var,
+                    self.use_view_filter, self.view_min_var, self.view_max_var, self.list_search_var):
+            var.trace_add('write', self.schedule_list_filter)
+        
         # ==================== Control Buttons ====================
         control_frame = ttk.Frame(main_frame)
         control_frame.pack(fill=tk.X, pady=10)
@@ -535,6 +2371,12 @@ class YouTubeChannelDownloader:
         if directory:
             self.output_dir_var.set(directory)
             
+    def browse_scratch(self):
+        """Chọn thư mục tạm (nên là ổ SSD/tmpfs cục bộ)"""
+        directory = filedialog.askdirectory()
+        if directory:
+            self.scratch_dir_var.set(directory)
+            
     def open_output_folder(self):
         """Mở thư mục xuất"""
         output_dir = self.output_dir_var.get()
@@ -571,6 +2413,10 @@ class YouTubeChannelDownloader:
         
     def log(self, message):
         """Ghi log"""
+        if self.headless:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+            return
+            
         def _log():
             self.log_text.config(state=tk.NORMAL)
             timestamp = datetime.now().strftime("%H:%M:%S")
@@ -579,6 +2425,11 @@ class YouTubeChannelDownloader:
             self.log_text.config(state=tk.DISABLED)
         self.root.after(0, _log)
         
+    def ui_call(self, func):
+        """Đưa cập nhật giao diện về thread Tk (bỏ qua khi headless)"""
+        if not self.headless:
+            self.root.after(0, func)
+        
     def clear_log(self):
         """Xóa log"""
         self.log_text.config(state=tk.NORMAL)
@@ -602,41 +2453,134 @@ class YouTubeChannelDownloader:
                 return match.group(1), pattern
         return None, None
         
-    def get_channel_id_from_handle(self, handle, api_key):
+    def get_key_pool(self):
+        """Pool key theo ô API Key (tạo lại khi danh sách key thay đổi)"""
+        keys = ApiKeyPool.parse_keys(self.api_key_var.get())
+        if self.key_pool is None or self.key_pool.keys != list(dict.fromkeys(keys)):
+            self.key_pool = ApiKeyPool(keys, self.api_quota_file)
+        return self.key_pool
+        
+    def save_key_pool(self):
+        """Lưu quota ước tính của các key và ghi vào log"""
+        if not self.key_pool:
+            return
+        try:
+            self.key_pool.save()
+            if len(self.key_pool.keys) > 1:
+                quotas = ", ".join(f"{key} {remaining}" for key, remaining in self.key_pool.summary())
+                self.log(f"🔑 Quota còn lại ước tính: {quotas}")
+        except Exception as e:
+            self.log(f"⚠️ Không thể lưu quota API key: {str(e)}")
+            
+    @staticmethod
+    def api_error_reason(data):
+        """reason đầu tiên trong phản hồi lỗi của API ('' nếu không có)"""
+        errors = data.get('error', {}).get('errors') or [{}]
+        return errors[0].get('reason', '')
+        
+    def get_http(self):
+        """requests.Session dùng chung (giữ kết nối keep-alive tới API và máy chủ thumbnail)"""
+        if self.http is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(API_WORKERS, 16))
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self.http = session
+        return self.http
+        
+    def get_api_cache(self):
+        """Cache phản hồi API theo thiết lập hiện tại (None nếu tắt)"""
+        if not self.api_cache_var.get():
+            return None
+        try:
+            stats_ttl = max(0.0, float(self.api_cache_stats_minutes_var.get()) * 60)
+        except ValueError:
+            stats_ttl = ApiResponseCache.DEFAULT_TTLS['videos']
+        if self.api_cache is None or self.api_cache.directory != self.api_cache_dir:
+            self.api_cache = ApiResponseCache(self.api_cache_dir)
+        self.api_cache.ttls['videos'] = stats_ttl
+        return self.api_cache
+        
+    def clear_api_cache(self):
+        """Xoá toàn bộ cache phản hồi API"""
+        removed = ApiResponseCache(self.api_cache_dir).clear()
+        self.log(f"🗑️ Đã xoá {removed} phản hồi API trong cache")
+        
+    def finish_api_cache(self):
+        """Log tỉ lệ hit và dọn cache sau một lần quét"""
+        cache = self.api_cache
+        if not cache or not (cache.hits or cache.misses):
+            return
+        self.log(f"🗄️ Cache API: {cache.hits} hit / {cache.misses} request mạng")
+        cache.hits = cache.misses = 0
+        try:
+            cache.prune()
+        except Exception as e:
+            self.log(f"⚠️ Không thể dọn cache API: {str(e)}")
+            
+    def api_get(self, endpoint, params, stage, cost=1, fresh=False):
+        """GET YouTube Data API qua cache và pool key
+
+        Phản hồi còn hạn trong cache được trả về luôn (trừ khi đang làm mới hoặc fresh);
+        lỗi quota/rate limit thì tự thử lại bằng key khác.
+        """
+        cache = self.get_api_cache()
+        if cache and not (fresh or self.api_refresh):
+            with self.metrics.stage(f"{stage}_cached"):
+                data = cache.get(endpoint, params)
+            if data is not None:
+                return data
+        data = self.api_request(endpoint, params, stage, cost)
+        if cache and 'error' not in data:
+            cache.put(endpoint, params, data)
+        return data
+        
+    def api_request(self, endpoint, params, stage, cost=1):
+        """Gửi request thật qua pool key"""
+        url = f"{YOUTUBE_API_BASE}/{endpoint}"
+        pool = self.get_key_pool()
+        while True:
+            key = pool.acquire(cost)
+            with self.metrics.stage(stage) as timer:
+                response = self.get_http().get(url, params={**params, 'key': key}, timeout=30)
+                timer.bytes = len(response.content)
+            data = response.json()
+            reason = self.api_error_reason(data) if 'error' in data else ''
+            if reason in ApiKeyPool.QUOTA_REASONS + ApiKeyPool.RATE_REASONS:
+                pool.report_error(key, reason)
+                self.log(f"🔑 Key {key[:6]}… bị {reason}, chuyển sang key khác")
+                continue
+            return data
+            
+    def get_channel_id_from_handle(self, handle):
         """Lấy Channel ID từ handle (@username)"""
-        url = "https://www.googleapis.com/youtube/v3/search"
         params = {
             'part': 'snippet',
             'q': handle,
             'type': 'channel',
-            'key': api_key
         }
-        response = requests.get(url, params=params)
-        data = response.json()
+        # search tốn 100 đơn vị quota
+        data = self.api_get('search', params, 'resolve_handle', cost=100)
         
         if 'items' in data and len(data['items']) > 0:
             return data['items'][0]['snippet']['channelId']
         return None
         
-    def get_channel_uploads_playlist(self, channel_id, api_key):
+    def get_channel_uploads_playlist(self, channel_id):
         """Lấy playlist ID chứa tất cả video của kênh"""
-        url = "https://www.googleapis.com/youtube/v3/channels"
         params = {
             'part': 'contentDetails',
             'id': channel_id,
-            'key': api_key
         }
-        response = requests.get(url, params=params)
-        data = response.json()
+        data = self.api_get('channels', params, 'api_channels')
         
         if 'items' in data and len(data['items']) > 0:
             return data['items'][0]['contentDetails']['relatedPlaylists']['uploads']
         return None
         
-    def get_all_videos(self, playlist_id, api_key):
+    def get_all_videos(self, playlist_id):
         """Lấy tất cả video từ playlist"""
         videos = []
-        url = "https://www.googleapis.com/youtube/v3/playlistItems"
         next_page_token = None
         
         while True:
@@ -644,62 +2588,113 @@ class YouTubeChannelDownloader:
                 'part': 'snippet,contentDetails',
                 'playlistId': playlist_id,
                 'maxResults': 50,
-                'key': api_key
             }
             if next_page_token:
                 params['pageToken'] = next_page_token
                 
-            response = requests.get(url, params=params)
-            data = response.json()
+            data = self.api_get('playlistItems', params, 'api_playlist_page')
             
             if 'error' in data:
                 self.log(f"❌ API Error: {data['error']['message']}")
                 break
                 
             if 'items' in data:
-                for item in data['items']:
-                    video_id = item['contentDetails']['videoId']
-                    thumbnails = item['snippet'].get('thumbnails', {})
-                    videos.append({
-                        'id': video_id,
-                        'title': item['snippet']['title'],
-                        'published_at': item['snippet']['publishedAt'],
-                        'thumbnails': thumbnails
-                    })
+                videos.extend(self.playlist_item_to_video(item) for item in data['items'])
                     
             next_page_token = data.get('nextPageToken')
             if not next_page_token:
                 break
                 
             self.log(f"📊 Đã quét {len(videos)} video...")
+            self.metrics.export_prometheus(self.get_metrics_dir())
             
         return videos
         
-    def get_video_details(self, video_ids, api_key):
-        """Lấy thông tin chi tiết video (duration, views)"""
-        details = {}
-        for i in range(0, len(video_ids), 50):
-            batch = video_ids[i:i+50]
-            url = "https://www.googleapis.com/youtube/v3/videos"
+    def get_video_details(self, video_ids, part='contentDetails,statistics', fresh=False, strict=False):
+        """Lấy thông tin chi tiết video (duration, views), API_WORKERS lô 50 id chạy song song
+
+        strict: lô bị API trả lỗi thì raise thay vì bỏ qua (để không nhầm là video đã bị xoá).
+        """
+        batches = [video_ids[i:i+50] for i in range(0, len(video_ids), 50)]
+        
+        def fetch(batch):
             params = {
-                'part': 'contentDetails,statistics',
+                'part': part,
                 'id': ','.join(batch),
-                'key': api_key
             }
-            response = requests.get(url, params=params)
-            data = response.json()
+            data = self.api_get('videos', params, 'api_videos_batch', fresh=fresh)
+            if strict and 'error' in data:
+                raise RuntimeError(f"API Error: {data['error'].get('message', '')}")
+            return data
             
-            if 'items' in data:
-                for item in data['items']:
-                    duration_str = item['contentDetails']['duration']
-                    duration_seconds = self.parse_duration(duration_str)
-                    view_count = int(item['statistics'].get('viewCount', 0))
-                    details[item['id']] = {
-                        'duration': duration_seconds,
-                        'views': view_count
-                    }
+        details = {}
+        workers = min(API_WORKERS, len(batches)) or 1
+        with concurrent_futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for data in executor.map(fetch, batches):
+                if 'items' in data:
+                    self.collect_video_details(data['items'], details)
         return details
         
+    def get_videos_by_id(self, video_ids):
+        """Dựng dict video (như sau khi quét) cho danh sách id bằng videos API, không cần playlist"""
+        videos = []
+        for i in range(0, len(video_ids), 50):
+            params = {
+                'part': 'snippet,contentDetails,statistics',
+                'id': ','.join(video_ids[i:i+50]),
+            }
+            data = self.api_get('videos', params, 'api_videos_batch')
+            if 'error' in data:
+                raise RuntimeError(f"API Error: {data['error'].get('message', '')}")
+            items = data.get('items', [])
+            details = self.collect_video_details(items, {})
+            for item in items:
+                snippet = item['snippet']
+                video = {
+                    'id': item['id'],
+                    'title': snippet['title'],
+                    'published_at': snippet['publishedAt'],
+                    'thumbnails': snippet.get('thumbnails', {}),
+                }
+                video.update(details[item['id']])
+                videos.append(video)
+        return videos
+        
+    def playlist_item_to_video(self, item):
+        """Chuyển một playlistItem của API thành dict video dùng trong self.videos"""
+        snippet = item['snippet']
+        return {
+            'id': item['contentDetails']['videoId'],
+            'title': snippet['title'],
+            'published_at': snippet['publishedAt'],
+            'thumbnails': snippet.get('thumbnails', {})
+        }
+        
+    def collect_video_details(self, items, details):
+        """Đọc duration/views từ các item của videos API vào dict details"""
+        for item in items:
+            view_count = int(item['statistics'].get('viewCount', 0))
+            content = item.get('contentDetails')
+            if content is None:
+                # part=statistics (cập nhật lượt xem): giữ nguyên duration đã có
+                details[item['id']] = {'views': view_count}
+                continue
+            details[item['id']] = {
+                'duration': self.parse_duration(content['duration']),
+                'views': view_count
+            }
+        return details
+        
+    def merge_video_details(self, videos, details):
+        """Gán duration/views vào danh sách video (0 nếu API không trả về)"""
+        for video in videos:
+            if video['id'] in details:
+                video.update(details[video['id']])
+            else:
+                video['duration'] = 0
+                video['views'] = 0
+        return videos
+        
     def parse_duration(self, duration_str):
         """Parse ISO 8601 duration to seconds"""
         match = re.match(r'PT(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?', duration_str)
@@ -710,8 +2705,8 @@ class YouTubeChannelDownloader:
         seconds = int(match.group(3) or 0)
         return hours * 3600 + minutes * 60 + seconds
         
-    def scan_channel(self):
-        """Quét tất cả video từ kênh"""
+    def scan_channel(self, force_refresh=False):
+        """Quét tất cả video từ kênh (force_refresh: bỏ qua cache API, gọi lại toàn bộ)"""
         api_key = self.api_key_var.get().strip()
         channel_url = self.channel_url_var.get().strip()
         
@@ -723,12 +2718,14 @@ class YouTubeChannelDownloader:
             messagebox.showerror("Lỗi", "Vui lòng nhập URL kênh YouTube!")
             return
             
-        threading.Thread(target=self._scan_channel_thread, daemon=True).start()
+        self.api_refresh = force_refresh
+        threading.Thread(target=self.run_with_profiling, args=("scan", self._scan_channel_thread),
+                         daemon=True).start()
         
     def _scan_channel_thread(self):
         """Thread quét kênh"""
+        self.metrics = RunMetrics("scan")
         try:
-            api_key = self.api_key_var.get().strip()
             channel_url = self.channel_url_var.get().strip()
             
             self.log("🔍 Đang phân tích URL kênh...")
@@ -742,7 +2739,7 @@ class YouTubeChannelDownloader:
                 channel_id = identifier
             else:
                 self.log(f"🔎 Đang tìm Channel ID cho: {identifier}")
-                channel_id = self.get_channel_id_from_handle(identifier, api_key)
+                channel_id = self.get_channel_id_from_handle(identifier)
                 
             if not channel_id:
                 self.log("❌ Không tìm thấy Channel ID!")
@@ -750,7 +2747,7 @@ class YouTubeChannelDownloader:
                 
             self.log(f"✅ Channel ID: {channel_id}")
             
-            playlist_id = self.get_channel_uploads_playlist(channel_id, api_key)
+            playlist_id = self.get_channel_uploads_playlist(channel_id)
             if not playlist_id:
                 self.log("❌ Không tìm thấy playlist uploads!")
                 return
@@ -758,7 +2755,7 @@ class YouTubeChannelDownloader:
             self.log(f"📁 Uploads Playlist: {playlist_id}")
             self.log("📥 Đang quét video từ kênh...")
             
-            videos = self.get_all_videos(playlist_id, api_key)
+            videos = self.get_all_videos(playlist_id)
             
             if not videos:
                 self.log("❌ Không tìm thấy video nào!")
@@ -766,42 +2763,82 @@ class YouTubeChannelDownloader:
                 
             self.log("📊 Đang lấy thông tin chi tiết video...")
             video_ids = [v['id'] for v in videos]
-            details = self.get_video_details(video_ids, api_key)
+            details = self.get_video_details(video_ids)
             
-            for video in videos:
-                if video['id'] in details:
-                    video.update(details[video['id']])
-                else:
-                    video['duration'] = 0
-                    video['views'] = 0
-                    
-            self.videos = videos
-            filtered_count = len(self.filter_videos())
+            self.merge_video_details(videos, details)
             
-            self.root.after(0, lambda: self.video_count_label.config(
-                text=f"Video: {len(videos)} | Sau lọc: {filtered_count}"
-            ))
+            self.videos = videos
+            self.ui_call(self.refresh_video_list)
             self.log(f"✅ Hoàn tất! Tìm thấy {len(videos)} video.")
             
         except Exception as e:
             self.log(f"❌ Lỗi: {str(e)}")
+        finally:
+            self.save_key_pool()
+            self.finish_api_cache()
+            self.api_refresh = False
+            self.finish_metrics()
+            
+    def refresh_stats(self):
+        """Cập nhật lượt xem cho danh sách đã quét, không quét lại playlist"""
+        if not self.videos:
+            messagebox.showwarning("Cảnh báo", "Chưa có video nào! Vui lòng quét kênh trước.")
+            return
+        if not self.api_key_var.get().strip():
+            messagebox.showerror("Lỗi", "Vui lòng nhập YouTube API Key!")
+            return
+            
+        threading.Thread(target=self.run_with_profiling, args=("refresh_stats", self._refresh_stats_thread),
+                         daemon=True).start()
+        
+    def _refresh_stats_thread(self):
+        """Thread cập nhật thống kê: chỉ gọi videos API (1 đơn vị quota / 50 video)"""
+        self.metrics = RunMetrics("refresh_stats")
+        try:
+            videos = self.videos
+            part = 'contentDetails,statistics' if self.refresh_details_var.get() else 'statistics'
+            self.log(f"📈 Đang cập nhật {part} cho {len(videos)} video...")
+            details = self.get_video_details([v['id'] for v in videos], part=part, fresh=True, strict=True)
+            
+            available = []
+            for video in videos:
+                entry = details.get(video['id'])
+                if entry is not None:
+                    video.update(entry)
+                    available.append(video)
+            removed = len(videos) - len(available)
+            if removed:
+                self.log(f"🚫 Bỏ {removed} video đã bị xoá hoặc chuyển riêng tư")
+            self.videos = available
+            filtered_count = len(self.filter_videos())
+            self.ui_call(self.refresh_video_list)
+            self.log(f"✅ Đã cập nhật {len(available)} video. Sau lọc: {filtered_count}")
+            
+        except Exception as e:
+            self.log(f"❌ Lỗi: {str(e)}")
+        finally:
+            self.save_key_pool()
+            self.finish_api_cache()
+            self.finish_metrics()
             
     # ==================== Filter Methods ====================
     
-    def filter_videos(self):
-        """Lọc video theo các tiêu chí"""
+    def filter_videos(self, quiet=False):
+        """Lọc video theo các tiêu chí (quiet: không log lỗi định dạng, dùng khi đang gõ)"""
         filtered = self.videos.copy()
         
         if self.use_date_filter.get():
             try:
-                date_from = datetime.strptime(self.date_from_var.get(), "%Y-%m-%d")
-                date_to = datetime.strptime(self.date_to_var.get(), "%Y-%m-%d")
+                # published_at là ISO 8601 nên so sánh chuỗi YYYY-MM-DD đã chuẩn hoá là đủ
+                date_from = datetime.strptime(self.date_from_var.get(), "%Y-%m-%d").strftime("%Y-%m-%d")
+                date_to = datetime.strptime(self.date_to_var.get(), "%Y-%m-%d").strftime("%Y-%m-%d")
                 filtered = [
                     v for v in filtered 
-                    if date_from <= datetime.strptime(v['published_at'][:10], "%Y-%m-%d") <= date_to
+                    if date_from <= v['published_at'][:10] <= date_to
                 ]
             except ValueError:
-                self.log("⚠️ Lỗi định dạng ngày! Sử dụng YYYY-MM-DD")
+                if not quiet:
+                    self.log("⚠️ Lỗi định dạng ngày! Sử dụng YYYY-MM-DD")
                 
         if self.use_duration_filter.get():
             try:
@@ -812,7 +2849,8 @@ class YouTubeChannelDownloader:
                     if min_duration <= v.get('duration', 0) <= max_duration
                 ]
             except ValueError:
-                self.log("⚠️ Lỗi định dạng thời lượng!")
+                if not quiet:
+                    self.log("⚠️ Lỗi định dạng thời lượng!")
                 
         if self.use_view_filter.get():
             try:
@@ -823,10 +2861,64 @@ class YouTubeChannelDownloader:
                     if min_views <= v.get('views', 0) <= max_views
                 ]
             except ValueError:
-                self.log("⚠️ Lỗi định dạng lượt xem!")
+                if not quiet:
+                    self.log("⚠️ Lỗi định dạng lượt xem!")
                 
         return filtered
         
+    def videos_to_download(self):
+        """Video đã chọn trong danh sách (nếu có chọn), nếu không thì mọi video sau lọc"""
+        picked = self.video_list.picked if self.video_list else None
+        if picked:
+            return [v for v in self.videos if v['id'] in picked]
+        return self.filter_videos()
+        
+    # ==================== Video List Methods ====================
+    
+    def schedule_list_filter(self, *args):
+        """Lọc lại danh sách 300 ms sau lần sửa cuối cùng"""
+        if self.list_filter_job:
+            self.root.after_cancel(self.list_filter_job)
+        self.list_filter_job = self.root.after(300, self.refresh_video_list)
+        
+    def refresh_video_list(self):
+        """Áp bộ lọc và ô tìm lên danh sách video (chạy trên thread Tk)
+        
+        Kết quả lọc được giữ lại khi bộ lọc không đổi; gõ thêm ký tự vào ô tìm
+        chỉ lọc tiếp trong kết quả của lần tìm trước.
+        """
+        self.list_filter_job = None
+        state = tuple(var.get() for var in (self.use_date_filter, self.date_from_var, self.date_to_var,
+                                            self.use_duration_filter, self.duration_min_var, self.duration_max_var,
+                                            self.use_view_filter, self.view_min_var, self.view_max_var))
+        cached_videos, cached_state, filtered = self.list_filter_cache
+        if cached_videos is not self.videos:
+            # Quét lại / cập nhật lượt xem thay cả list: bỏ lựa chọn, trạng thái của video không còn
+            self.video_list.retain({v['id'] for v in self.videos})
+        if cached_videos is not self.videos or cached_state != state:
+            filtered = self.filter_videos(quiet=True)
+            self.list_filter_cache = (self.videos, state, filtered)
+            self.list_search_cache = ("", filtered)
+            
+        query = self.list_search_var.get().strip().lower()
+        cached_query, found = self.list_search_cache
+        if query != cached_query:
+            source = found if query.startswith(cached_query) else filtered
+            found = [v for v in source if query in v['title'].lower() or query in v['id'].lower()]
+            self.list_search_cache = (query, found)
+            
+        self.video_list.set_items(found)
+        self.video_count_label.config(text=f"Video: {len(self.videos)} | Sau lọc: {len(filtered)}")
+        
+    def on_video_pick(self, count):
+        self.pick_label.config(text=f"Đã chọn: {count} video (chỉ tải các video này)" if count
+                               else "Chưa chọn: tải mọi video sau lọc")
+        
+    def set_video_status(self, video_id, status):
+        """Trạng thái tải của một video trên danh sách (gọi được từ thread worker)"""
+        if self.video_list:
+            self.video_list.set_status(video_id, status)
+            
     # ==================== Download Methods ====================
     
     def get_filename_base(self, video):
@@ -875,31 +2967,38 @@ class YouTubeChannelDownloader:
                 self.log(f"⚠️ Không tìm thấy thumbnail cho {filename_base}")
                 return False
                 
-            response = requests.get(thumb_url, timeout=30)
+            with self.metrics.stage('thumb_fetch') as timer:
+                response = self.get_http().get(thumb_url, timeout=30)
+                timer.bytes = len(response.content)
             if response.status_code != 200:
                 self.log(f"⚠️ Không thể tải thumbnail: HTTP {response.status_code}")
                 return False
                 
-            img = Image.open(io.BytesIO(response.content))
-            
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                if img.mode == 'RGBA':
-                    background.paste(img, mask=img.split()[3])
-                else:
-                    background.paste(img)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
+            with self.metrics.stage('thumb_decode') as timer:
+                img = Image.open(io.BytesIO(response.content))
+                
+                if img.mode in ('RGBA', 'LA', 'P'):
+                    background = Image.new('RGB', img.size, (255, 255, 255))
+                    if img.mode == 'P':
+                        img = img.convert('RGBA')
+                    if img.mode == 'RGBA':
+                        background.paste(img, mask=img.split()[3])
+                    else:
+                        background.paste(img)
+                    img = background
+                elif img.mode != 'RGB':
+                    img = img.convert('RGB')
+                timer.bytes = len(response.content)
                 
             target_size = self.get_target_thumbnail_size()
             if img.size != target_size:
-                img = img.resize(target_size, Image.Resampling.LANCZOS)
+                with self.metrics.stage('thumb_resize'):
+                    img = img.resize(target_size, Image.Resampling.LANCZOS)
                 
             output_path = os.path.join(output_dir, f"{filename_base}.jpg")
-            img.save(output_path, 'JPEG', quality=95)
+            with self.metrics.stage('thumb_save') as timer:
+                img.save(output_path, 'JPEG', quality=95)
+                timer.bytes = os.path.getsize(output_path)
             
             return True
             
@@ -918,11 +3017,76 @@ class YouTubeChannelDownloader:
             messagebox.showerror("Lỗi", "Vui lòng chọn ít nhất một loại nội dung để tải!")
             return
             
-        self.is_downloading = True
-        self.download_btn.config(state=tk.DISABLED)
-        self.stop_btn.config(state=tk.NORMAL)
+        self.launch_download()
+        
+    def launch_download(self):
+        """Chạy thread tải (dùng chung cho tải mới và tải tiếp từ nhật ký)"""
+        self.is_downloading = True
+        self.download_btn.config(state=tk.DISABLED)
+        self.stop_btn.config(state=tk.NORMAL)
+        
+        threading.Thread(target=self.run_with_profiling, args=("download", self._download_thread),
+                         daemon=True).start()
+        
+    def offer_resume(self):
+        """Hỏi người dùng có tải tiếp hàng đợi còn dở của lần trước không"""
+        jobs = self.load_unfinished_jobs()
+        if not jobs:
+            return
+        self.log(f"🗒️ Còn {len(jobs)} video chưa tải xong từ lần trước")
+        if messagebox.askyesno("Tải tiếp", f"Lần trước còn {len(jobs)} video chưa tải xong.\n"
+                                           "Tải tiếp ngay (không cần quét lại kênh)?"):
+            self.resume_jobs = jobs
+            self.launch_download()
+            
+    def get_journal_path(self):
+        """Nhật ký job nằm trong thư mục lưu (cạnh _metrics)"""
+        return os.path.join(self.output_dir_var.get(), "_journal", "download.jsonl")
+        
+    def load_unfinished_jobs(self):
+        """[(video, [nội dung còn thiếu])] của lần tải trước chưa xong"""
+        return JobJournal.replay(self.get_journal_path())
         
-        threading.Thread(target=self._download_thread, daemon=True).start()
+    def get_download_archive(self):
+        """Archive dùng chung (nạp lại khi đổi đường dẫn hoặc file bị sửa bên ngoài)"""
+        path = self.download_archive_var.get().strip() or os.path.join(self.base_path, "download_archive.txt")
+        if self.download_archive is None or self.download_archive.path != path:
+            self.download_archive = DownloadArchive(path)
+        self.download_archive.load()
+        return self.download_archive
+        
+    def get_permanent_failures(self):
+        """Danh sách video lỗi vĩnh viễn, nằm cạnh archive (cùng định dạng, kèm lý do)"""
+        archive_path = self.download_archive_var.get().strip() or os.path.join(self.base_path, "download_archive.txt")
+        path = os.path.join(os.path.dirname(os.path.abspath(archive_path)), "permanent_failures.txt")
+        if self.permanent_failures is None or self.permanent_failures.path != path:
+            self.permanent_failures = DownloadArchive(path)
+        self.permanent_failures.load()
+        return self.permanent_failures
+        
+    def skip_archived(self, jobs):
+        """Bỏ các video đã có trong archive (và video lỗi vĩnh viễn) trước khi đưa vào executor"""
+        self.active_archive = self.get_download_archive() if self.use_download_archive_var.get() else None
+        self.active_failures = self.get_permanent_failures()
+        if self.active_archive:
+            remaining = [job for job in jobs if job[0]['id'] not in self.active_archive]
+            skipped = len(jobs) - len(remaining)
+            if skipped:
+                self.log(f"⏭️ Bỏ qua {skipped} video đã có trong archive ({len(self.active_archive)} id)")
+            jobs = remaining
+        if self.skip_permanent_failures_var.get() and len(self.active_failures):
+            remaining = [job for job in jobs if job[0]['id'] not in self.active_failures]
+            skipped = len(jobs) - len(remaining)
+            if skipped:
+                self.log(f"⛔ Bỏ qua {skipped} video lỗi vĩnh viễn ở lần trước ({self.active_failures.path})")
+            jobs = remaining
+        return jobs
+        
+    def selected_artifacts(self):
+        """Các loại nội dung đang được chọn để tải"""
+        choices = [('video', self.download_video_var), ('audio', self.download_audio_var),
+                   ('thumbnail', self.download_thumbnail_var), ('title', self.download_title_var)]
+        return [name for name, var in choices if var.get()]
         
     def stop_download(self):
         """Dừng tải"""
@@ -933,44 +3097,130 @@ class YouTubeChannelDownloader:
         
     def _download_thread(self):
         """Thread tải xuống"""
+        self.metrics = RunMetrics("download")
+        jobs, self.resume_jobs = self.resume_jobs, None
         try:
-            filtered_videos = self.filter_videos()
-            self.log(f"📊 Số video cần tải: {len(filtered_videos)}")
-            
-            if not filtered_videos:
-                self.log("❌ Không có video nào phù hợp với bộ lọc!")
+            if jobs:
+                self.log(f"🗒️ Tải tiếp {len(jobs)} video từ nhật ký (không quét lại)")
+            else:
+                filtered_videos = self.videos_to_download()
+                picked = " (đã chọn trong danh sách)" if self.video_list and self.video_list.picked else ""
+                self.log(f"📊 Số video cần tải: {len(filtered_videos)}{picked}")
+                
+                if not filtered_videos:
+                    self.log("❌ Không có video nào phù hợp với bộ lọc!")
+                    return
+                artifacts = self.selected_artifacts()
+                jobs = [(video, artifacts) for video in filtered_videos]
+                
+            jobs = self.skip_archived(jobs)
+            if not jobs:
+                self.log("✅ Mọi video đã được tải trước đó (archive)")
+                JobJournal(self.get_journal_path()).close(remove=True)
                 return
                 
             output_dir = self.output_dir_var.get()
             os.makedirs(output_dir, exist_ok=True)
             
+            self.journal = JobJournal(self.get_journal_path())
+            self.journal.begin(jobs)
+            for video, _ in jobs:
+                self.set_video_status(video['id'], 'queued')
+            
             thread_count = int(self.thread_count_var.get())
-            total = len(filtered_videos)
+            self.prepare_download_run(output_dir, thread_count)
+            self.size_estimates = self.plan_downloads(jobs, output_dir, thread_count)
+            if self.prefetch_info_var.get():
+                self.prefetcher = self.start_prefetch(jobs, thread_count)
+            total = len(jobs)
             completed = 0
+            self.connection_budget.set_remaining(total)
+            if self.progress_hook:
+                self.progress_hook(0, total)
             
-            with ThreadPoolExecutor(max_workers=thread_count) as executor:
+            max_retries = self.get_max_retries()
+            verify = self.verify_downloads_var.get()
+            attempts = {}
+            retries = []  # heap (thời điểm được chạy lại, thứ tự, video, nội dung còn thiếu)
+            finished = SimpleQueue()
+            running = 0
+            
+            # Kiểm tra ffprobe chạy ở pool riêng: luồng tải nhận video tiếp theo ngay, không chờ kiểm tra
+            with concurrent_futures.ThreadPoolExecutor(max_workers=thread_count) as executor, \
+                    concurrent_futures.ThreadPoolExecutor(max_workers=min(4, thread_count)) as verifier:
                 self.download_executor = executor
-                futures = {
-                    executor.submit(self.download_single_video, video, output_dir): video 
-                    for video in filtered_videos
-                }
                 
-                for future in as_completed(futures):
+                def submit(video, artifacts):
+                    future = executor.submit(self.run_download_job, video, output_dir, artifacts)
+                    future.add_done_callback(lambda f, v=video, a=artifacts: finished.put((f, v, a, False)))
+                    
+                def submit_verify(video, artifacts):
+                    future = verifier.submit(self.verify_download, video, output_dir, artifacts)
+                    future.add_done_callback(lambda f, v=video, a=artifacts: finished.put((f, v, a, True)))
+                    
+                for video, artifacts in jobs:
+                    submit(video, artifacts)
+                running = len(jobs)
+                
+                while running or retries:
                     if not self.is_downloading:
                         break
-                        
-                    video = futures[future]
+                    # Job thử lại được submit sau mọi job đang chờ trong executor -> ưu tiên thấp hơn
+                    now = time.time()
+                    while retries and retries[0][0] <= now:
+                        _, _, video, artifacts = heapq.heappop(retries)
+                        submit(video, artifacts)
+                        running += 1
                     try:
-                        future.result()
+                        future, video, artifacts, verified = finished.get(
+                            timeout=max(0.05, retries[0][0] - now) if retries else None)
+                    except Empty:
+                        continue
+                    running -= 1
+                    try:
+                        kind, missing, message = future.result()
                     except Exception as e:
-                        self.log(f"❌ Lỗi tải {video['id']}: {str(e)}")
+                        kind, missing, message = 'unknown', artifacts, str(e)
+                        self.log(f"❌ Lỗi tải {video['id']}: {message}")
+                        
+                    if verify and not verified and not kind and not missing:
+                        submit_verify(video, artifacts)
+                        running += 1
+                        continue
+                    if kind == 'permanent':
+                        self.drop_permanent(video, message)
+                        self.set_video_status(video['id'], 'permanent')
+                    elif kind and self.is_downloading:
+                        self.metrics.count(f"{kind}_failures")
+                        attempt = attempts[video['id']] = attempts.get(video['id'], 0) + 1
+                        if attempt <= max_retries:
+                            delay = self.retry_delay(attempt)
+                            self.metrics.count('retries')
+                            self.log(f"🔁 {video['id']}: lỗi tạm thời, thử lại lần {attempt}/{max_retries} "
+                                     f"sau {delay:.0f}s ({message})")
+                            heapq.heappush(retries, (time.time() + delay, id(video), video, missing))
+                            self.set_video_status(video['id'], 'retry')
+                            continue
+                        self.log(f"❌ {video['id']}: vẫn lỗi sau {max_retries} lần thử lại")
+                        self.set_video_status(video['id'], 'failed')
+                    else:
+                        self.set_video_status(video['id'], None if missing else 'done')
                         
                     completed += 1
+                    self.connection_budget.set_remaining(total - completed)
+                    if self.progress_hook:
+                        self.progress_hook(completed, total)
                     progress = (completed / total) * 100
-                    self.root.after(0, lambda p=progress: self.progress_var.set(p))
-                    self.root.after(0, lambda c=completed, t=total: 
-                                   self.progress_label.config(text=f"Đã tải: {c}/{t}"))
+                    self.ui_call(lambda p=progress: self.progress_var.set(p))
+                    self.ui_call(lambda c=completed, t=total: 
+                                 self.progress_label.config(text=f"Đã tải: {c}/{t}"))
+                    self.metrics.export_prometheus(self.get_metrics_dir())
                     
+            counters = self.metrics.summary()['counters']
+            if counters:
+                self.log(f"🔁 Lỗi tạm thời: {counters.get('transient_failures', 0) + counters.get('unknown_failures', 0)} "
+                         f"(thử lại {counters.get('retries', 0)} lần) | "
+                         f"⛔ Lỗi vĩnh viễn: {counters.get('permanent_failures', 0)}")
             if self.is_downloading:
                 self.log("✅ Hoàn tất tải xuống!")
             else:
@@ -979,22 +3229,258 @@ class YouTubeChannelDownloader:
         except Exception as e:
             self.log(f"❌ Lỗi: {str(e)}")
         finally:
+            self.close_journal()
+            self.cleanup_download_run()
+            self.finish_metrics()
             self.is_downloading = False
-            self.root.after(0, lambda: self.download_btn.config(state=tk.NORMAL))
-            self.root.after(0, lambda: self.stop_btn.config(state=tk.DISABLED))
+            self.ui_call(lambda: self.download_btn.config(state=tk.NORMAL))
+            self.ui_call(lambda: self.stop_btn.config(state=tk.DISABLED))
             
-    def download_single_video(self, video, output_dir):
-        """Tải một video với các tùy chọn đã chọn"""
+    def get_max_retries(self):
+        try:
+            return max(0, int(self.max_retries_var.get()))
+        except ValueError:
+            return 3
+            
+    def retry_delay(self, attempt):
+        """Chờ trước lần thử lại thứ attempt: tăng gấp đôi mỗi lần (tối đa 5 phút), ±20% ngẫu nhiên"""
+        return min(300.0, self.retry_base_seconds * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+        
+    def missing_artifacts(self, video, output_dir, artifacts):
+        """Các loại nội dung chưa có file trong thư mục lưu"""
+        filename_base = self.get_filename_base(video)
+        return [a for a in artifacts
+                if not os.path.exists(os.path.join(output_dir, self.artifact_filename(filename_base, a)))]
+        
+    def run_download_job(self, video, output_dir, artifacts):
+        """download_single_video và phân loại kết quả
+        
+        Trả về (kind, missing, message): kind None nếu đủ nội dung (hoặc đã dừng tải),
+        'permanent' / 'transient' / 'unknown' theo lỗi của các lệnh trong job.
+        """
+        self.job_failures.items = failures = []
+        self.set_video_status(video['id'], 'downloading')
+        try:
+            if self.download_single_video(video, output_dir, artifacts):
+                return None, [], None
+        except Exception as e:
+            self.log(f"❌ Lỗi tải {video['id']}: {str(e)}")
+            failures.append(('unknown', str(e)))
+        finally:
+            self.job_failures.items = None
         if not self.is_downloading:
+            return None, list(artifacts), None
+        missing = self.missing_artifacts(video, output_dir, artifacts) or list(artifacts)
+        kinds = [kind for kind, _ in failures]
+        kind = next((k for k in ('permanent', 'transient') if k in kinds), 'unknown')
+        message = next((m for k, m in failures if k == kind), failures[-1][1] if failures else None)
+        return kind, missing, message
+        
+    def drop_permanent(self, video, message):
+        """Ghi video lỗi vĩnh viễn để lần sau bỏ qua ngay từ đầu"""
+        self.metrics.count('permanent_failures')
+        self.log(f"⛔ {video['id']}: lỗi vĩnh viễn, không thử lại ({message})")
+        if self.journal:
+            self.journal.record('dropped', video['id'], error=(message or '')[:200])
+        if self.active_failures is not None:
+            try:
+                self.active_failures.add(video['id'], message)
+            except OSError as e:
+                self.log(f"⚠️ Không thể ghi danh sách lỗi vĩnh viễn: {str(e)}")
+                
+    def prepare_download_run(self, output_dir, thread_count):
+        """Tài nguyên dùng chung của một lần tải: cache info, ngân sách kết nối/CPU, chỉ mục"""
+        scratch_dir = self.scratch_dir_var.get().strip()
+        self.info_cache = InfoJsonCache(os.path.join(scratch_dir, "_info_cache") if scratch_dir
+                                        else self.info_cache_dir)
+        self.disk_guard = self.make_disk_guard(output_dir)
+        try:
+            budget_total = int(self.connection_budget_var.get())
+        except ValueError:
+            budget_total = 16
+        self.connection_budget = ConnectionBudget(budget_total, thread_count)
+        cpus = self.get_transcode_cpus()
+        self.transcode_slots = threading.BoundedSemaphore(cpus)
+        # Chuyển mã trong yt-dlp (video ngắn) không chờ slot được: chia sẵn CPU cho từng luồng tải
+        self.transcode_threads_per_job = max(1, cpus // max(1, thread_count))
+        self.output_index = self.open_output_index(output_dir)
+        
+    def cleanup_download_run(self):
+        """Đóng/bỏ các tài nguyên tạo bởi prepare_download_run và prefetch"""
+        if self.output_index:
+            self.output_index.close()
+        self.output_index = None
+        if self.prefetcher:
+            self.prefetcher.stop()
+        self.prefetcher = None
+        if self.info_cache:
+            self.info_cache.prune()
+        self.info_cache = None
+        self.size_estimates = {}
+        self.download_elapsed = {}
+        self.disk_guard = None
+        try:
+            os.rmdir(os.path.join(self.output_dir_var.get(), "_work"))  # chỉ xoá khi trống
+        except OSError:
+            pass
+        
+    def close_journal(self):
+        """Đóng nhật ký; xoá luôn nếu mọi job đã xong, còn dở thì giữ để lần sau tải tiếp"""
+        journal, self.journal = self.journal, None
+        if not journal:
             return
+        try:
+            journal.close()
+            remaining = JobJournal.replay(journal.path)
+            if not remaining:
+                journal.close(remove=True)
+            else:
+                self.log(f"🗒️ Còn {len(remaining)} video chưa xong, đã lưu trong nhật ký để tải tiếp")
+        except Exception as e:
+            self.log(f"⚠️ Không thể đóng nhật ký: {str(e)}")
+            
+    def open_output_index(self, output_dir):
+        """Mở chỉ mục theo thiết lập (None nếu tắt)"""
+        fmt = self.output_index_var.get()
+        if fmt not in ('jsonl', 'csv'):
+            return None
+        try:
+            return OutputIndex(os.path.join(output_dir, "_index", f"videos.{fmt}"), fmt)
+        except OSError as e:
+            self.log(f"⚠️ Không thể mở chỉ mục: {str(e)}")
+            return None
+            
+    def artifact_filename(self, filename_base, artifact):
+        """Tên file cuối cùng của một loại nội dung"""
+        ext = {'video': 'mp4', 'audio': self.audio_format_var.get(),
+               'thumbnail': 'jpg', 'title': 'txt'}[artifact]
+        return f"{filename_base}.{ext}"
+        
+    def index_video(self, video, output_dir, filename_base, artifacts, done, elapsed, probes=None):
+        """Ghi bản ghi của video vào chỉ mục: metadata, file đã tạo, kích thước, codec/fps thực tế
+        
+        probes: kết quả ffprobe đã có (từ verify_download) theo loại nội dung, để không probe lại.
+        """
+        produced = {}
+        for artifact in OutputIndex.ARTIFACTS:
+            if artifact not in done:
+                continue
+            name = self.artifact_filename(filename_base, artifact)
+            try:
+                info = {'path': name, 'bytes': os.path.getsize(os.path.join(output_dir, name))}
+            except OSError:
+                continue
+            if artifact == 'video':
+                media = (probes or {}).get('video') or self.probe_media(os.path.join(output_dir, name))
+                if media:
+                    info['codec'] = media['codec']
+                    info['fps'] = round(media['fps'], 3)
+            elif artifact == 'audio':
+                info['codec'] = self.audio_format_var.get()
+            produced[artifact] = info
+        self.output_index.write({
+            'id': video['id'],
+            'published_at': video.get('published_at', '')[:10],
+            'title': video.get('title', ''),
+            'duration': video.get('duration'),
+            'views': video.get('views'),
+            'artifacts': produced,
+            'missing': [a for a in artifacts if a not in done],
+            'elapsed_seconds': round(elapsed, 3),
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        
+    def download_single_video(self, video, output_dir, artifacts=None):
+        """Tải một video với các tùy chọn đã chọn; trả về True nếu đủ mọi nội dung"""
+        if not self.is_downloading:
+            return False
+        started = time.perf_counter()
+        if artifacts is None:
+            artifacts = self.selected_artifacts()
             
         video_id = video['id']
         video_url = f"https://www.youtube.com/watch?v={video_id}"
         filename_base = self.get_filename_base(video)
         
+        # Giữ job lại khi ổ đĩa sắp hết chỗ (theo dung lượng ước tính)
+        need = sum(self.size_estimates.get(video_id, {}).values())
+        guard = self.disk_guard
+        reservation = None
+        if guard:
+            try:
+                reservation = guard.admit(need, lambda: self.is_downloading,
+                                          lambda: self.log(f"💾 Ổ đĩa sắp đầy, chờ chỗ trống để tải {filename_base}"))
+            except DiskSpaceTooSmall as e:
+                # Không job nào giữ chỗ mà vẫn không vừa: báo lỗi để vòng tải thử lại sau / bỏ qua
+                self.log(f"💾 Không đủ chỗ cho {filename_base}: {str(e)}")
+                self.record_failure('transient', f"Không đủ chỗ trống: {str(e)}")
+                return False
+            if reservation is None:
+                return False
+            
+        # Info-json lấy trước (nếu có) để yt-dlp không phải extract lại trang
+        info_path = None
+        if self.info_cache and ('video' in artifacts or 'audio' in artifacts):
+            if self.prefetcher:
+                self.prefetcher.wait(video_id)
+            info_path = self.info_cache.get_path(video_id)
+            
         self.log(f"📥 Đang tải: {filename_base}")
         
         # Build yt-dlp command base
+        base_cmd = self.build_ytdlp_base_cmd()
+            
+        # Fragment song song: cố định theo setting, hoặc "auto" = cấp từ ngân sách chung cho từng lệnh
+        setting = self.concurrent_fragments_var.get()
+        budget = self.connection_budget if setting == "auto" else None
+        if not budget:
+            try:
+                fragments = max(1, int(setting))
+            except ValueError:
+                fragments = 1
+            base_cmd.extend(['--concurrent-fragments', str(fragments)])
+        base_cmd.append('--newline')
+        
+        journal = self.journal
+        if journal:
+            journal.record('running', video_id)
+        done = []
+        work_dir = None
+        try:
+            work_dir = self.make_work_dir(filename_base, output_dir)
+            if reservation:
+                reservation.written = lambda: self.job_disk_bytes(work_dir, output_dir, filename_base, done)
+            with self.metrics.stage('job_total'):
+                self._download_video_assets(video, output_dir, filename_base, video_url, base_cmd,
+                                            artifacts, done, work_dir, info_path, budget)
+        except Exception as e:
+            if journal:
+                journal.record('failed', video_id, missing=[a for a in artifacts if a not in done],
+                               error=str(e)[:200])
+            raise
+        finally:
+            if reservation:
+                guard.release(reservation)
+            if work_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                
+        missing = [a for a in artifacts if a not in done]
+        elapsed = time.perf_counter() - started
+        if not missing and self.info_cache:
+            # Info đã dùng xong (lần thử lại sẽ extract lại vì link stream có hạn)
+            self.info_cache.discard(video_id)
+        if missing:
+            if journal:
+                journal.record('failed', video_id, missing=missing)
+        elif self.verify_downloads_var.get():
+            # Chỉ mục, 'done' và archive được ghi sau khi verify_download đạt
+            self.download_elapsed[video_id] = elapsed
+        else:
+            self.record_finished(video, output_dir, artifacts, elapsed)
+        return not missing
+                
+    def build_ytdlp_base_cmd(self):
+        """yt-dlp + cookie + vị trí ffmpeg (dùng chung cho tải và lấy metadata)"""
         base_cmd = [self.ytdlp_path]
         
         # Add cookie if specified
@@ -1006,9 +3492,104 @@ class YouTubeChannelDownloader:
         ffmpeg_dir = os.path.dirname(self.ffmpeg_path) if os.path.exists(self.ffmpeg_path) else None
         if ffmpeg_dir:
             base_cmd.extend(['--ffmpeg-location', ffmpeg_dir])
-            
+        return base_cmd
+        
+    def job_disk_bytes(self, work_dir, output_dir, filename_base, done):
+        """Số byte job đã ghi ra đĩa: thư mục riêng của job + các file đã publish sang thư mục lưu"""
+        total = 0
+        for artifact in done:
+            try:
+                total += os.path.getsize(os.path.join(output_dir, self.artifact_filename(filename_base, artifact)))
+            except OSError:
+                pass
+        for root, _, files in os.walk(work_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+        
+    def make_work_dir(self, filename_base, output_dir):
+        """Thư mục riêng của job: trong thư mục tạm, hoặc output_dir/_work khi không dùng thư mục tạm
+        
+        Mọi file trung gian của job nằm trong đó nên watchdog chỉ cần liệt kê thư mục nhỏ này,
+        không phải thư mục lưu (có thể tới hàng trăm nghìn file trên NAS).
+        Cùng ổ với output_dir nên publish_artifact chỉ là os.replace.
+        """
+        scratch_dir = self.scratch_dir_var.get().strip() or os.path.join(output_dir, "_work")
+        os.makedirs(scratch_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix=f"{filename_base}_", dir=scratch_dir)
+        
+    def publish_artifact(self, staged_path, output_dir):
+        """Đưa file hoàn chỉnh từ thư mục tạm sang thư mục lưu
+        
+        Cùng ổ đĩa: os.replace (atomic). Khác ổ/share mạng: chép tuần tự sang file
+        .partial cạnh đích rồi os.replace, người xem thư mục lưu không bao giờ thấy file dở.
+        """
+        dest = os.path.join(output_dir, os.path.basename(staged_path))
+        with self.metrics.stage('publish') as timer:
+            timer.bytes = os.path.getsize(staged_path)
+            try:
+                os.replace(staged_path, dest)
+                return dest
+            except OSError:
+                pass  # khác filesystem (EXDEV) hoặc share không hỗ trợ rename chéo
+            partial = dest + ".partial"
+            try:
+                with open(staged_path, 'rb') as src, open(partial, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 4 * 1024 * 1024)
+                os.replace(partial, dest)
+            except Exception:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise
+            os.remove(staged_path)
+        return dest
+        
+    def _download_video_assets(self, video, output_dir, filename_base, video_url, base_cmd,
+                               artifacts, done, work_dir=None, info_path=None, budget=None):
+        """Tải các loại nội dung trong artifacts cho một video, thêm tên từng loại xong vào done
+        
+        work_dir: thư mục tạm của job; file trung gian nằm ở đó, chỉ file hoàn chỉnh được đưa sang output_dir.
+        info_path: info-json đã lấy trước, dùng với --load-info-json thay cho URL.
+        budget: ConnectionBudget khi concurrent_fragments = "auto" (base_cmd chưa có --concurrent-fragments).
+        """
+        target_dir = work_dir or output_dir
+        
+        # Watchdog: file trong thư mục riêng của job phải lớn dần (tải .part, ffmpeg ghi ra).
+        # Không có thư mục riêng thì chỉ theo dõi output, không liệt kê cả thư mục lưu
+        watch = (work_dir, "") if work_dir else None
+        time_limit = self.command_time_limit(video)
+        
+        def run_ytdlp(args, description, stage_prefix):
+            # Cấp kết nối cho từng lệnh (video, audio là các lệnh riêng): lệnh bắt đầu sau
+            # nhận thêm phần mà các job đã xong trả lại, nhất là ở cuối hàng đợi
+            grant = budget.acquire() if budget else None
+            cmd = base_cmd + ['--concurrent-fragments', str(grant)] if grant else base_cmd
+            try:
+                if info_path:
+                    if self._run_command(cmd + args + ['--load-info-json', info_path], description, stage_prefix,
+                                         watch=watch, time_limit=time_limit):
+                        return True
+                    # Link stream trong info có thể đã hết hạn: bỏ cache, tải lại từ URL
+                    self.info_cache.discard(video['id'])
+                    self.log(f"↩️ {description}: không dùng được info-json, thử lại từ URL")
+                return self._run_command(cmd + args + [video_url], description, stage_prefix,
+                                         watch=watch, time_limit=time_limit)
+            finally:
+                if grant:
+                    budget.release(grant)
+        
+        def mark_done(artifact, path=None):
+            if work_dir and path:
+                self.publish_artifact(path, output_dir)
+            done.append(artifact)
+            if self.journal:
+                self.journal.record('artifact', video['id'], artifact=artifact)
+                
         # ========== Download Video (MP4/H264 với FPS tùy chọn) ==========
-        if self.download_video_var.get():
+        if 'video' in artifacts:
             quality = self.video_quality_var.get()
             fps = self.video_fps_var.get()
             
@@ -1018,56 +3599,88 @@ class YouTubeChannelDownloader:
                 height = quality.replace('p', '')
                 format_str = f"bestvideo[height<={height}][vcodec^=avc1]+bestaudio[ext=m4a]/bestvideo[height<={height}][ext=mp4]+bestaudio[ext=m4a]/best[height<={height}][ext=mp4]/best"
             
-            output_file = os.path.join(output_dir, f'{filename_base}.mp4')
+            output_file = os.path.join(target_dir, f'{filename_base}.mp4')
             
-            # Build ffmpeg postprocessor args với FPS
-            if fps == "original":
-                ffmpeg_args = '-c:v libx264 -c:a aac'
+            if self.use_segmented_transcode(video):
+                # Video dài: tải nguyên bản rồi chia đoạn, mã hoá song song
+                success = self.download_video_segmented(format_str, fps, output_file, filename_base, run_ytdlp)
             else:
-                ffmpeg_args = f'-c:v libx264 -r {fps} -c:a aac'
-            
-            cmd = base_cmd + [
-                '-f', format_str,
-                '-o', output_file,
-                '--merge-output-format', 'mp4',
-                '--postprocessor-args', f'ffmpeg:{ffmpeg_args}',
-                '--no-playlist',
-                video_url
-            ]
-            self._run_command(cmd, f"Video {filename_base}")
+                # Build ffmpeg postprocessor args với FPS
+                if fps == "original":
+                    ffmpeg_args = '-c:v libx264 -c:a aac'
+                else:
+                    ffmpeg_args = f'-c:v libx264 -r {fps} -c:a aac'
+                # Giới hạn luồng x264 theo phần CPU của job: cả batch không vượt ngân sách CPU
+                if self.transcode_threads_per_job:
+                    ffmpeg_args += f' -threads {self.transcode_threads_per_job}'
+                
+                args = [
+                    '-f', format_str,
+                    '-o', output_file,
+                    '--merge-output-format', 'mp4',
+                    '--postprocessor-args', f'ffmpeg:{ffmpeg_args}',
+                    '--no-playlist',
+                ]
+                success = run_ytdlp(args, f"Video {filename_base}", stage_prefix='video')
+            if success:
+                mark_done('video', output_file)
             
         # ========== Download Audio ==========
-        if self.download_audio_var.get():
+        if 'audio' in artifacts:
             audio_format = self.audio_format_var.get()
             audio_bitrate = self.audio_bitrate_var.get()
             
-            output_file = os.path.join(output_dir, f'{filename_base}.{audio_format}')
+            output_file = os.path.join(target_dir, f'{filename_base}.{audio_format}')
             
-            cmd = base_cmd + [
+            args = [
                 '-x',
                 '--audio-format', audio_format,
                 '--audio-quality', audio_bitrate,
                 '-o', output_file,
                 '--no-playlist',
-                video_url
             ]
-            self._run_command(cmd, f"Audio {filename_base}")
+            if run_ytdlp(args, f"Audio {filename_base}", stage_prefix='audio'):
+                mark_done('audio', output_file)
             
         # ========== Download Thumbnail (JPG với kích thước tùy chọn) ==========
-        if self.download_thumbnail_var.get():
-            success = self.download_and_convert_thumbnail(video, output_dir, filename_base)
+        if 'thumbnail' in artifacts:
+            success = self.download_and_convert_thumbnail(video, target_dir, filename_base)
             if success:
+                mark_done('thumbnail', os.path.join(target_dir, f'{filename_base}.jpg'))
                 self.log(f"🖼️ Đã tải thumbnail: {filename_base}.jpg")
                     
         # ========== Save Title (TXT - chỉ chứa tiêu đề) ==========
-        if self.download_title_var.get():
-            title_path = os.path.join(output_dir, f'{filename_base}.txt')
-            with open(title_path, 'w', encoding='utf-8') as f:
-                f.write(video['title'])
+        if 'title' in artifacts:
+            title_path = os.path.join(target_dir, f'{filename_base}.txt')
+            with self.metrics.stage('title_write') as timer:
+                with open(title_path, 'w', encoding='utf-8') as f:
+                    f.write(video['title'])
+                timer.bytes = len(video['title'].encode('utf-8'))
+            mark_done('title', title_path)
             self.log(f"📝 Đã lưu tiêu đề: {filename_base}.txt")
                 
-    def _run_command(self, cmd, description=""):
-        """Chạy command và capture output"""
+    def get_stall_seconds(self):
+        try:
+            return max(5.0, float(self.stall_seconds_var.get()))
+        except ValueError:
+            return 45.0
+            
+    def command_time_limit(self, video):
+        """Giới hạn tổng cho một lệnh của video, tăng theo thời lượng và dung lượng ước tính
+        
+        Chỉ là lưới an toàn: job treo đã bị watchdog kill sau stall_seconds.
+        Tính rộng cho máy chậm: mã hoá ~4 lần thời lượng, tải tối thiểu 128 KB/s.
+        """
+        duration = video.get('duration') or 0
+        size = sum(self.size_estimates.get(video['id'], {}).values()) or duration * 500 * 1024
+        return 600 + duration * 4 + size / (128 * 1024)
+        
+    def _run_command(self, cmd, description="", stage_prefix=None, watch=None, time_limit=None):
+        """Chạy command, đọc output từng dòng để đo thời gian từng giai đoạn; trả về True nếu thành công
+        
+        Watchdog kill lệnh khi không có tiến triển (output hoặc file trong watch=(thư mục, tiền tố))
+        trong stall_seconds, hoặc khi chạy quá time_limit giây.
+        """
         try:
             creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
             
@@ -1076,26 +3689,997 @@ class YouTubeChannelDownloader:
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
+                encoding='utf-8',
+                errors='replace',
                 creationflags=creationflags
             )
-            stdout, stderr = process.communicate(timeout=600)
             
-            if process.returncode == 0:
+            # Đọc stderr ở thread riêng để pipe không bị đầy khi đang đọc stdout
+            stderr_chunks = []
+            def _read_stderr():
+                stderr_chunks.append(process.stderr.read())
+            stderr_thread = threading.Thread(target=_read_stderr, daemon=True)
+            stderr_thread.start()
+            
+            watchdog = StallWatchdog(process, self.get_stall_seconds(), time_limit, watch).start()
+            
+            tracker = YtdlpStageTracker(self.metrics, stage_prefix) if stage_prefix else None
+            try:
+                for line in process.stdout:
+                    watchdog.touch(line)
+                    if tracker:
+                        tracker.feed(line)
+                process.wait()
+            finally:
+                watchdog.stop()
+                stderr_thread.join()
+                if tracker:
+                    tracker.finish()
+            stderr = ''.join(stderr_chunks)
+            timed_out = watchdog.reason is not None and process.returncode != 0
+            
+            if process.returncode == 0 and not timed_out:
                 self.log(f"✅ {description} - Thành công")
-            else:
-                error_msg = stderr[:200] if stderr else "Unknown error"
-                self.log(f"⚠️ {description} - Lỗi: {error_msg}")
+                return True
+            kind = FailureClassifier.classify(stderr, process.returncode, timed_out)
+            if timed_out:
+                self.metrics.count('watchdog_kills')
+            error_msg = f"Watchdog: {watchdog.reason}" if timed_out else FailureClassifier.summarize(stderr)
+            self.log(f"⚠️ {description} - Lỗi ({kind}): {error_msg}")
+            self.record_failure(kind, error_msg)
                 
-        except subprocess.TimeoutExpired:
-            process.kill()
-            self.log(f"⚠️ {description} - Timeout")
         except Exception as e:
             self.log(f"❌ {description} - Command error: {str(e)}")
+            self.record_failure('unknown', str(e))
+        return False
+        
+    def record_failure(self, kind, message):
+        """Ghi lỗi vào job đang chạy ở thread hiện tại (nếu có, xem run_download_job)"""
+        failures = getattr(self.job_failures, 'items', None)
+        if failures is not None:
+            failures.append((kind, message))
+            
+    # ==================== Chuyển mã chia đoạn ====================
+    
+    def get_transcode_cpus(self):
+        try:
+            return max(1, int(self.transcode_cpus_var.get()))
+        except ValueError:
+            return os.cpu_count() or 2
+            
+    def use_segmented_transcode(self, video):
+        """Chỉ chia đoạn khi bật và video dài hơn ngưỡng (phút)"""
+        if not self.segment_transcode_var.get():
+            return False
+        try:
+            threshold = float(self.segment_min_minutes_var.get()) * 60
+        except ValueError:
+            return False
+        return video.get('duration', 0) >= threshold
+        
+    def _run_ffmpeg(self, cmd, stage, watch=None, time_limit=None, stop_with_run=False):
+        """Chạy ffmpeg/ffprobe (không cần đọc progress), trả về (thành công, stdout)
+        
+        Có StallWatchdog như _run_command: kill khi file trong watch=(thư mục, tiền tố) đứng yên
+        quá stall_seconds (không có watch thì chỉ tính time_limit), khi quá time_limit giây,
+        hoặc khi dừng tải nếu stop_with_run.
+        """
+        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        stall = self.get_stall_seconds() if watch else (time_limit or float('inf'))
+        cancelled = (lambda: not self.is_downloading) if stop_with_run else None
+        with self.metrics.stage(stage):
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                       encoding='utf-8', errors='replace', creationflags=creationflags)
+            watchdog = StallWatchdog(process, stall, time_limit, watch, cancelled=cancelled).start()
+            try:
+                stdout, stderr = process.communicate()
+            finally:
+                watchdog.stop()
+        if process.returncode != 0 and watchdog.reason:
+            self.metrics.count('watchdog_kills')
+            self.log(f"⚠️ {stage} lỗi: Watchdog: {watchdog.reason}")
+            self.record_failure('transient', f"{stage}: Watchdog: {watchdog.reason}")
+        elif process.returncode != 0:
+            self.log(f"⚠️ {stage} lỗi: {(stderr or '').strip()[-200:]}")
+        return process.returncode == 0, stdout
+        
+    def probe_media(self, path, stage='ffprobe'):
+        """Container, stream video/audio đầu tiên và thời lượng (ffprobe chỉ đọc header, không giải mã)
+        
+        codec/fps/width/height là của stream video đầu tiên (ảnh JPG cũng là một stream video).
+        Trả về None nếu ffprobe không đọc được file hoặc chạy quá FFPROBE_TIMEOUT_SECONDS.
+        """
+        ffmpeg_dir = os.path.dirname(self.ffmpeg_path)
+        if ffmpeg_dir:
+            name = "ffprobe.exe" if self.ffmpeg_path.lower().endswith(".exe") else "ffprobe"
+            ffprobe = os.path.join(ffmpeg_dir, name)
+        else:
+            ffprobe = self.find_tool("ffprobe")
+        ok, out = self._run_ffmpeg([ffprobe, '-v', 'error',
+                                    '-show_entries', 'stream=codec_type,codec_name,avg_frame_rate,width,height'
+                                                     ':format=format_name,duration',
+                                    '-of', 'json', path], stage, time_limit=FFPROBE_TIMEOUT_SECONDS)
+        if not ok:
+            return None
+        try:
+            data = json.loads(out or '{}')
+        except ValueError:
+            return None
+        streams = data.get('streams') or []
+        stream = next((s for s in streams if s.get('codec_type') == 'video'), {})
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+        num, _, den = str(stream.get('avg_frame_rate', '0/1')).partition('/')
+        try:
+            fps = float(num) / float(den or 1)
+        except (ValueError, ZeroDivisionError):
+            fps = 0.0
+        try:
+            duration = float(data.get('format', {}).get('duration', 0))
+        except ValueError:
+            duration = 0.0
+        return {'codec': stream.get('codec_name'), 'fps': fps,
+                'width': int(stream.get('width') or 0), 'height': int(stream.get('height') or 0),
+                'audio_codec': audio.get('codec_name'),
+                'format': data.get('format', {}).get('format_name', ''), 'duration': duration}
+        
+    def check_artifact(self, video, artifact, media):
+        """So thông tin ffprobe của một file với yêu cầu; trả về lý do nếu sai, None nếu đạt"""
+        if media is None:
+            return "ffprobe không đọc được file (hỏng, bị cắt hoặc quá thời gian)"
+        if artifact == 'thumbnail':
+            target = self.get_target_thumbnail_size()
+            if (media['width'], media['height']) != target:
+                return f"thumbnail {media['width']}x{media['height']}, cần {target[0]}x{target[1]}"
+            return None
+        if artifact == 'video':
+            if 'mp4' not in media['format'].split(','):
+                return f"container {media['format'] or '?'}, cần mp4"
+            if media['codec'] != 'h264':
+                return f"codec {media['codec'] or 'không có video'}, cần h264"
+            try:
+                fps = float(self.video_fps_var.get())
+            except ValueError:
+                fps = None  # "original": giữ FPS gốc
+            if fps and abs(media['fps'] - fps) > 0.5:
+                return f"{media['fps']:.2f} fps, cần {fps:g}"
+        elif artifact == 'audio' and not media['audio_codec']:
+            return "không có stream audio"
+        # Thời lượng API làm tròn theo giây; file ngắn hơn rõ rệt là bị cắt
+        expected = video.get('duration') or 0
+        if expected and abs(media['duration'] - expected) > max(2.0, expected * 0.02):
+            return f"dài {media['duration']:.1f}s, API báo {expected}s"
+        return None
+        
+    def record_finished(self, video, output_dir, artifacts, elapsed, probes=None):
+        """Video đã đủ nội dung (và đã qua kiểm tra nếu bật): ghi chỉ mục, 'done' vào nhật ký, thêm vào archive
+        
+        'done' xoá job khỏi replay nên chỉ được ghi sau kiểm tra; ghi sớm hơn thì 'rejected'
+        bị bỏ qua và job tải lại dở dang sẽ mất khi app tắt giữa chừng.
+        """
+        if self.output_index:
+            filename_base = self.get_filename_base(video)
+            # Job thử lại chỉ mang nội dung còn thiếu: các file đã đạt từ lần trước vẫn vào bản ghi
+            extra = [a for a in self.selected_artifacts() if a not in artifacts]
+            done = list(artifacts) + [a for a in extra if a not in self.missing_artifacts(video, output_dir, extra)]
+            try:
+                self.index_video(video, output_dir, filename_base, artifacts, done, elapsed, probes)
+            except Exception as e:
+                self.log(f"⚠️ Không thể ghi chỉ mục {filename_base}: {str(e)}")
+        if self.journal:
+            self.journal.record('done', video['id'])
+        if self.active_archive is not None:
+            self.active_archive.add(video['id'])
+            
+    def verify_download(self, video, output_dir, artifacts):
+        """Kiểm tra các file vừa tải (ffprobe), chạy song song với các job tải khác
+        
+        File sai được chuyển vào _quarantine (giữ bản lỗi gần nhất, xoá khi bản tải lại đạt)
+        và ghi 'rejected' vào nhật ký; trả về (kind, missing, message) như run_download_job
+        để vòng tải đưa các file đó vào hàng thử lại.
+        Video chỉ vào chỉ mục và archive khi mọi file đều đạt.
+        """
+        self.set_video_status(video['id'], 'verifying')
+        filename_base = self.get_filename_base(video)
+        quarantine = os.path.join(output_dir, "_quarantine")
+        problems = {}
+        probes = {}
+        for artifact in artifacts:
+            if artifact == 'title':
+                continue
+            path = os.path.join(output_dir, self.artifact_filename(filename_base, artifact))
+            try:
+                media = self.probe_media(path, stage='verify')
+            except OSError as e:
+                # Không có ffprobe: không kiểm tra được thì coi như đạt, như khi tắt kiểm tra
+                self.log(f"⚠️ Không chạy được ffprobe, bỏ qua kiểm tra {filename_base}: {str(e)}")
+                problems = {}
+                break
+            probes[artifact] = media
+            reason = self.check_artifact(video, artifact, media)
+            if reason:
+                problems[artifact] = reason
+                
+        if not problems:
+            for artifact in artifacts:
+                name = self.artifact_filename(filename_base, artifact)
+                if name in self.quarantined:
+                    self.quarantined.discard(name)
+                    try:
+                        os.remove(os.path.join(quarantine, name))
+                    except OSError:
+                        pass
+            self.record_finished(video, output_dir, artifacts,
+                                 self.download_elapsed.pop(video['id'], 0.0), probes)
+            return None, [], None
+            
+        for artifact, reason in problems.items():
+            name = self.artifact_filename(filename_base, artifact)
+            self.metrics.count('verify_failures')
+            self.log(f"🔍 {name}: {reason}, chuyển vào _quarantine và tải lại")
+            try:
+                os.makedirs(quarantine, exist_ok=True)
+                os.replace(os.path.join(output_dir, name), os.path.join(quarantine, name))
+                self.quarantined.add(name)
+            except OSError as e:
+                self.log(f"⚠️ Không thể chuyển {name} vào _quarantine: {str(e)}")
+            if self.journal:
+                self.journal.record('rejected', video['id'], artifact=artifact, error=reason)
+        return 'transient', list(problems), "; ".join(f"{a}: {r}" for a, r in problems.items())
+        
+    def download_video_segmented(self, format_str, fps, output_file, filename_base, run_ytdlp):
+        """Tải video gốc (không chuyển mã), rồi nếu cần chuyển mã thì:
+        chia đoạn tại keyframe (-c copy) -> mã hoá các đoạn song song trong giới hạn CPU
+        -> nối lại không mất dữ liệu (concat demuxer, -c copy) thành output_file.
+        Nguồn đã là H.264 và đúng FPS thì chỉ remux sang mp4.
+        """
+        work_dir = tempfile.mkdtemp(prefix=f"{filename_base}_seg_", dir=os.path.dirname(output_file))
+        try:
+            args = ['-f', format_str, '-o', os.path.join(work_dir, 'source.%(ext)s'),
+                    '--merge-output-format', 'mkv', '--no-playlist']
+            if not run_ytdlp(args, f"Video {filename_base}", stage_prefix='video'):
+                return False
+            sources = [name for name in os.listdir(work_dir) if name.startswith('source.')]
+            if not sources:
+                self.log(f"⚠️ Video {filename_base}: không thấy file tải về")
+                return False
+            source = os.path.join(work_dir, sources[0])
+            
+            media = self.probe_media(source)
+            if not media:
+                return False
+            need_fps = fps != "original" and abs(media['fps'] - float(fps)) > 0.01
+            # Lưới an toàn như command_time_limit (~4 lần thời lượng); treo thì watchdog kill sớm hơn
+            time_limit = 600 + media['duration'] * 4
+            output_watch = (os.path.dirname(output_file), os.path.basename(output_file))
+            if media['codec'] == 'h264' and not need_fps:
+                ok, _ = self._run_ffmpeg([self.ffmpeg_path, '-y', '-i', source, '-map', '0:v:0', '-map', '0:a:0?',
+                                          '-c:v', 'copy', '-c:a', 'aac', '-movflags', '+faststart',
+                                          output_file], 'remux',
+                                         watch=output_watch, time_limit=time_limit, stop_with_run=True)
+                return ok
+                
+            # Đoạn đủ nhỏ để mọi CPU cùng làm việc, nhưng không quá vụn
+            cpus = self.get_transcode_cpus()
+            segment_seconds = int(min(600, max(30, media['duration'] / (cpus * 2))))
+            ok, _ = self._run_ffmpeg([self.ffmpeg_path, '-y', '-i', source, '-map', '0:v:0', '-c', 'copy',
+                                      '-f', 'segment', '-segment_time', str(segment_seconds),
+                                      '-reset_timestamps', '1', os.path.join(work_dir, 'seg_%05d.mkv')],
+                                     'segment_split',
+                                     watch=(work_dir, 'seg_'), time_limit=time_limit, stop_with_run=True)
+            segments = sorted(name for name in os.listdir(work_dir) if name.startswith('seg_'))
+            if not ok or not segments:
+                return False
+            self.log(f"✂️ Video {filename_base}: {len(segments)} đoạn x ~{segment_seconds}s, "
+                     f"mã hoá song song ({cpus} CPU)")
+            
+            slots = self.transcode_slots or threading.BoundedSemaphore(cpus)
+            
+            def encode(name):
+                stem = 'enc_' + os.path.splitext(name)[0]
+                encoded = os.path.join(work_dir, stem + '.mp4')
+                cmd = [self.ffmpeg_path, '-y', '-i', os.path.join(work_dir, name),
+                       '-c:v', 'libx264', '-threads', '1', '-an']
+                if fps != "original":
+                    cmd += ['-r', str(fps)]
+                with slots:
+                    if not self.is_downloading:
+                        return None
+                    ok, _ = self._run_ffmpeg(cmd + [encoded], 'segment_encode', watch=(work_dir, stem),
+                                             time_limit=600 + segment_seconds * 4, stop_with_run=True)
+                return encoded if ok else None
+                
+            def encode_audio():
+                audio = os.path.join(work_dir, 'audio.m4a')
+                with slots:
+                    ok, _ = self._run_ffmpeg([self.ffmpeg_path, '-y', '-i', source, '-vn', '-map', '0:a:0?',
+                                              '-c:a', 'aac', audio], 'audio_encode',
+                                             watch=(work_dir, 'audio.'), time_limit=time_limit, stop_with_run=True)
+                return audio if ok else None
+                
+            with concurrent_futures.ThreadPoolExecutor(max_workers=min(cpus, len(segments)) + 1) as executor:
+                audio_future = executor.submit(encode_audio)
+                encoded = list(executor.map(encode, segments))
+                audio = audio_future.result()
+            if not all(encoded) or not audio:
+                return False
+                
+            concat_list = os.path.join(work_dir, 'concat.txt')
+            with open(concat_list, 'w', encoding='utf-8') as f:
+                for path in encoded:
+                    f.write("file '" + path.replace("'", "'\\''") + "'\n")
+            ok, _ = self._run_ffmpeg([self.ffmpeg_path, '-y', '-f', 'concat', '-safe', '0', '-i', concat_list,
+                                      '-i', audio, '-map', '0:v', '-map', '1:a?', '-c', 'copy',
+                                      '-movflags', '+faststart', output_file], 'segment_concat',
+                                     watch=output_watch, time_limit=time_limit, stop_with_run=True)
+            return ok
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            
+    # ==================== Ước tính dung lượng ====================
+    
+    @staticmethod
+    def slim_video_info(info):
+        """Chỉ giữ các trường cần để ước tính (info đầy đủ của yt-dlp rất lớn)"""
+        keys = ('format_id', 'ext', 'vcodec', 'acodec', 'height', 'fps', 'tbr', 'abr',
+                'filesize', 'filesize_approx')
+        return {
+            'id': info.get('id'),
+            'duration': info.get('duration'),
+            'formats': [{k: f.get(k) for k in keys if f.get(k) is not None}
+                        for f in info.get('formats') or []],
+        }
+        
+    def extract_info_batch(self, video_ids):
+        """yt-dlp -j cho một lô video; info đầy đủ ghi vào cache, trả về {id: info gọn}"""
+        cmd = self.build_ytdlp_base_cmd() + ['-j', '--skip-download', '--no-playlist', '--ignore-errors']
+        cmd += [f"https://www.youtube.com/watch?v={video_id}" for video_id in video_ids]
+        creationflags = subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0
+        with self.metrics.stage('info_extract_batch') as timer:
+            result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8',
+                                    errors='replace', creationflags=creationflags)
+            timer.bytes = len(result.stdout)
+        infos = {}
+        for line in result.stdout.splitlines():
+            try:
+                info = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(info, dict) and info.get('id'):
+                if self.info_cache:
+                    self.info_cache.store(info['id'], line)
+                infos[info['id']] = self.slim_video_info(info)
+        return infos
+        
+    def start_prefetch(self, jobs, thread_count):
+        """Chạy extraction trước các worker cho video chưa có info-json trong cache"""
+        video_ids = [video['id'] for video, artifacts in jobs
+                     if ('video' in artifacts or 'audio' in artifacts) and not self.info_cache.get_path(video['id'])]
+        if not video_ids:
+            return None
+        return InfoPrefetcher(self.extract_info_batch, video_ids, workers=thread_count,
+                              batch_size=5, lookahead=thread_count * 10).start()
+        
+    def fetch_video_info(self, videos, batch_size=25):
+        """Metadata định dạng cho danh sách video: lấy từ cache, còn lại chạy yt-dlp -j theo lô song song"""
+        infos = {}
+        missing = []
+        for video in videos:
+            info = self.info_cache.load(video['id']) if self.info_cache else None
+            if info:
+                infos[video['id']] = self.slim_video_info(info)
+            else:
+                missing.append(video['id'])
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        
+        workers = max(1, int(self.thread_count_var.get() or 1))
+        with concurrent_futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_infos in executor.map(self.extract_info_batch, batches):
+                infos.update(batch_infos)
+                if not self.is_downloading:
+                    break
+        return infos
+        
+    def plan_downloads(self, jobs, output_dir, thread_count):
+        """Ước tính dung lượng từng job, báo tổng + ETA trước khi tải; trả về {id: {loại: byte}}"""
+        estimator = SizeEstimator(self.video_quality_var.get(), self.audio_format_var.get(),
+                                  self.audio_bitrate_var.get())
+        infos = {}
+        if self.preflight_var.get():
+            media_videos = [video for video, artifacts in jobs if 'video' in artifacts or 'audio' in artifacts]
+            self.log(f"🔎 Đang lấy metadata định dạng cho {len(media_videos)} video (yt-dlp -j)...")
+            infos = self.fetch_video_info(media_videos)
+            
+        estimates = {video['id']: estimator.estimate(video, artifacts, infos.get(video['id']))
+                     for video, artifacts in jobs}
+        total = sum(sum(sizes.values()) for sizes in estimates.values())
+        source = f"metadata {len(infos)}/{len(jobs)} video" if infos else "theo thời lượng"
+        message = f"📦 Ước tính: {total / 1024 ** 3:.2f} GB cho {len(jobs)} video ({source})"
+        
+        throughput = self.historical_throughput()
+        if throughput:
+            eta = total / (throughput * max(1, thread_count))
+            message += f" | ETA ~{eta / 3600:.1f} giờ" if eta >= 3600 else f" | ETA ~{max(1, round(eta / 60))} phút"
+        self.log(message)
+        
+        free = shutil.disk_usage(output_dir).free
+        if total > free:
+            self.log(f"⚠️ Ổ đĩa chỉ còn {free / 1024 ** 3:.2f} GB - các job sẽ được giữ lại khi gần đầy")
+        return estimates
+        
+    def historical_throughput(self):
+        """Tốc độ tải (byte/s mỗi job) của lần tải gần nhất, đọc từ summary trong _metrics"""
+        metrics_dir = self.get_metrics_dir()
+        try:
+            summaries = sorted(name for name in os.listdir(metrics_dir)
+                               if name.startswith("download_") and name.endswith(".json"))
+        except OSError:
+            return 0.0
+        for name in reversed(summaries):
+            try:
+                with open(os.path.join(metrics_dir, name), 'r', encoding='utf-8') as f:
+                    stage = json.load(f)['stages'].get('video_download')
+            except (OSError, ValueError, KeyError):
+                continue
+            if stage and stage.get('bytes_per_second'):
+                return stage['bytes_per_second']
+        return 0.0
+        
+    def make_disk_guard(self, output_dir):
+        """Admission control theo chỗ trống: thư mục lưu + thư mục tạm (nếu có)"""
+        try:
+            min_free = float(self.min_free_gb_var.get()) * 1024 ** 3
+        except ValueError:
+            min_free = 2 * 1024 ** 3
+        scratch_dir = self.scratch_dir_var.get().strip()
+        # Lúc đỉnh một job chiếm ~2 lần dung lượng (file tải về + file sau khi ghép/chuyển mã)
+        paths = {output_dir: 1, scratch_dir: 2} if scratch_dir else {output_dir: 2}
+        return DiskSpaceGuard(paths, min_free)
+        
+    # ==================== Coordinator / Worker ====================
+    
+    def run_coordinator(self, queue, wait=True, poll_interval=5.0):
+        """Quét kênh, đưa video (sau lọc, bỏ qua archive) vào hàng đợi chung rồi theo dõi tới khi xong
+        
+        Trả về số job failed (0 = mọi job đã xong).
+        """
+        self._scan_channel_thread()
+        if not self.videos:
+            return 1
+        filtered_videos = self.filter_videos()
+        artifacts = self.selected_artifacts()
+        jobs = self.skip_archived([(video, artifacts) for video in filtered_videos])
+        queue.set_meta('settings', {k: v for k, v in self.collect_settings().items()
+                                    if k not in self.MACHINE_SETTINGS})
+        added = queue.enqueue(jobs)
+        self.log(f"📮 Đã đưa {added}/{len(jobs)} video vào hàng đợi: {queue.path}")
+        if not wait:
+            return 0
+            
+        last = None
+        while True:
+            queue.requeue_expired()
+            counts = queue.counts()
+            if counts != last:
+                self.log(f"📮 Chờ: {counts['queued']} | Đang tải: {counts['leased']} | "
+                         f"Xong: {counts['done']} | Lỗi: {counts['failed']}")
+                last = counts
+            if not counts['queued'] and not counts['leased']:
+                break
+            time.sleep(poll_interval)
+        self.log("✅ Hàng đợi đã xong")
+        return counts['failed']
+        
+    def run_queue_worker(self, queue, worker_id, wait=False, poll_interval=2.0):
+        """Worker: lease job từ hàng đợi chung, tải bằng thread_count luồng, heartbeat và báo kết quả
+        
+        Thoát khi hàng đợi không còn job chờ/đang chạy (wait=True: chờ job mới mãi).
+        Trả về số video tải xong.
+        """
+        shared = queue.get_meta('settings', {})
+        self.apply_settings({**self.collect_settings(),
+                             **{k: v for k, v in shared.items() if k not in self.MACHINE_SETTINGS}})
+        self.metrics = RunMetrics("worker")
+        output_dir = self.output_dir_var.get()
+        os.makedirs(output_dir, exist_ok=True)
+        thread_count = int(self.thread_count_var.get())
+        self.is_downloading = True
+        self.active_archive = self.get_download_archive() if self.use_download_archive_var.get() else None
+        self.active_failures = self.get_permanent_failures()
+        self.prepare_download_run(output_dir, thread_count)
+        self.connection_budget.set_remaining(thread_count)
+        
+        active = set()
+        active_lock = threading.Lock()
+        stop = threading.Event()
+        finished = []
+        
+        def heartbeat():
+            while not stop.wait(queue.lease_ttl / 3):
+                with active_lock:
+                    video_ids = list(active)
+                try:
+                    queue.heartbeat(worker_id, video_ids)
+                except Exception as e:
+                    self.log(f"⚠️ Heartbeat lỗi: {str(e)}")
+                    
+        def slot():
+            while self.is_downloading:
+                job = queue.lease(worker_id)
+                if job is None:
+                    counts = queue.counts()
+                    if not wait and not counts['queued'] and not counts['leased']:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+                video, artifacts = job
+                with active_lock:
+                    active.add(video['id'])
+                try:
+                    kind, missing, message = self.run_download_job(video, output_dir, artifacts)
+                    if not kind and not missing and self.verify_downloads_var.get():
+                        kind, _, message = self.verify_download(video, output_dir, artifacts)
+                finally:
+                    with active_lock:
+                        active.discard(video['id'])
+                missing = self.missing_artifacts(video, output_dir, artifacts)
+                if kind == 'permanent':
+                    self.drop_permanent(video, message)
+                elif kind:
+                    self.metrics.count(f"{kind}_failures")
+                queue.complete(worker_id, video['id'], missing, message or ("thiếu " + ",".join(missing)),
+                               permanent=kind == 'permanent')
+                if not missing:
+                    finished.append(video['id'])
+                    
+        self.log(f"👷 Worker {worker_id}: {thread_count} luồng, hàng đợi {queue.path}")
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            with concurrent_futures.ThreadPoolExecutor(max_workers=thread_count) as executor:
+                for future in [executor.submit(slot) for _ in range(thread_count)]:
+                    future.result()
+        finally:
+            stop.set()
+            self.is_downloading = False
+            self.cleanup_download_run()
+            self.finish_metrics()
+        self.log(f"👷 Worker {worker_id}: đã tải xong {len(finished)} video")
+        return len(finished)
+        
+    # ==================== Metrics ====================
+    
+    def get_metrics_dir(self):
+        """Thư mục chứa metrics (summary JSON + metrics.prom) nằm trong thư mục lưu"""
+        return os.path.join(self.output_dir_var.get(), "_metrics")
+        
+    def finish_metrics(self):
+        """Xuất summary của run hiện tại và ghi vài dòng tóm tắt vào log"""
+        try:
+            path = self.metrics.export_summary(self.get_metrics_dir())
+            for stage, s in self.metrics.summary()['stages'].items():
+                self.log(f"⏱️ {stage}: {s['count']} lần | p50 {s['p50_seconds']:.2f}s | "
+                         f"p95 {s['p95_seconds']:.2f}s | {s['bytes'] / 1024 / 1024:.1f} MB")
+            self.log(f"📈 Đã lưu metrics: {path}")
+        except Exception as e:
+            self.log(f"⚠️ Không thể lưu metrics: {str(e)}")
+            
+    # ==================== Profiling ====================
+    
+    def is_profiling_enabled(self):
+        """Bật bằng setting hoặc biến môi trường NTB_PROFILE=1"""
+        env = os.environ.get("NTB_PROFILE", "").strip().lower()
+        if env:
+            return env not in ("0", "false", "no", "off")
+        return bool(self.profiling_var.get())
+        
+    def run_with_profiling(self, run_name, func):
+        """Chạy func (thread quét/tải), có profiling nếu được bật"""
+        if not self.is_profiling_enabled():
+            return func()
+            
+        try:
+            top_n = int(os.environ.get("NTB_PROFILE_TOP", "30"))
+        except ValueError:
+            top_n = 30
+        profiler = RunProfiler(run_name, top_n=top_n)
+        self.log(f"🔬 Profiling đang bật cho lần {run_name} này")
+        try:
+            with profiler:
+                return func()
+        finally:
+            try:
+                report = profiler.write_reports(os.path.join(self.output_dir_var.get(), "_profiles"))
+                self.log(f"🔬 Đã lưu profile: {report}")
+            except Exception as e:
+                self.log(f"⚠️ Không thể lưu profile: {str(e)}")
+
+
+# ==================== Service HTTP cục bộ ====================
+class ServiceJob:
+    """Một yêu cầu gửi tới service: quét kênh (hoặc danh sách video) rồi tải"""
+
+    MAX_EVENTS = 5000
+
+    def __init__(self, job_id, request):
+        self.id = job_id
+        self.channel_url = request.get('channel_url', '')
+        self.video_ids = list(request.get('videos') or [])
+        self.settings = dict(request.get('settings') or {})
+        self.status = 'queued'
+        self.error = None
+        self.videos = 0
+        self.completed = 0
+        self.total = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = False
+        # Sự kiện cho SSE; bỏ bớt sự kiện cũ, event_base = số sự kiện đã bỏ
+        self.events = []
+        self.event_base = 0
+        self.cond = threading.Condition()
+
+    def emit(self, kind, **data):
+        with self.cond:
+            self.events.append((kind, data))
+            if len(self.events) > self.MAX_EVENTS:
+                drop = len(self.events) // 2
+                del self.events[:drop]
+                self.event_base += drop
+            self.cond.notify_all()
+
+    def set_status(self, status, error=None):
+        self.status = status
+        self.error = error
+        if status == 'running':
+            self.started_at = time.time()
+        elif status in ('done', 'failed', 'cancelled'):
+            self.finished_at = time.time()
+        self.emit('status', status=status, error=error)
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def events_after(self, index, timeout):
+        """Sự kiện từ vị trí index (tuyệt đối); chờ tối đa timeout giây nếu chưa có gì mới"""
+        with self.cond:
+            if index - self.event_base >= len(self.events) and not self.finished:
+                self.cond.wait(timeout)
+            start = max(0, index - self.event_base)
+            return self.event_base + start, self.events[start:]
+
+    def to_dict(self):
+        # Key, cookie và đường dẫn không bao giờ trả ra ngoài
+        hidden = YouTubeChannelDownloader.MACHINE_SETTINGS
+        return {
+            'id': self.id, 'status': self.status, 'error': self.error,
+            'channel_url': self.channel_url, 'video_ids': len(self.video_ids),
+            'videos': self.videos, 'completed': self.completed, 'total': self.total,
+            'created_at': self.created_at, 'started_at': self.started_at, 'finished_at': self.finished_at,
+            'settings': {k: ('***' if k in hidden else v) for k, v in self.settings.items()},
+        }
+
+
+class DownloadService:
+    """Bọc engine quét/tải (một app headless luôn chạy) sau một HTTP/JSON API cục bộ
+
+    Job chạy lần lượt trên cùng một app nên pool key, cache API/info-json, archive
+    và session HTTP được giữ ấm giữa các lần gửi. API:
+        POST /jobs                 {"channel_url"| "videos": [id...], "settings": {...}}
+        GET  /jobs, /jobs/<id>
+        GET  /jobs/<id>/events     server-sent events: log, progress, status
+        POST /jobs/<id>/cancel
+        GET  /metrics              summary JSON của run hiện tại (?format=prometheus)
+
+    Mỗi job chỉ được đổi các tuỳ chọn tải (JOB_SETTINGS); key, cookie, đường dẫn và tài nguyên
+    máy (MACHINE_SETTINGS) luôn lấy từ settings của server.
+    """
+
+    JOB_SETTINGS = frozenset(YouTubeChannelDownloader.SETTING_VARS) \
+        - set(YouTubeChannelDownloader.MACHINE_SETTINGS) - {'channel_url'}
+
+    def __init__(self, app, base_settings=None):
+        self.app = app
+        self.host = "127.0.0.1"
+        self.base_settings = dict(base_settings or {})
+        self.jobs = {}
+        self.order = []
+        self.lock = threading.Lock()
+        self.pending = threading.Condition(self.lock)
+        self.current = None
+        self.next_id = 1
+        app.log = self.log
+        app.progress_hook = self.on_progress
+
+    def log(self, message):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {message}", flush=True)
+        job = self.current
+        if job:
+            job.emit('log', message=message)
+
+    def on_progress(self, completed, total):
+        job = self.current
+        if job:
+            job.completed, job.total = completed, total
+            job.emit('progress', completed=completed, total=total)
+
+    def submit(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("body phải là JSON object")
+        if not isinstance(request.get('channel_url') or '', str):
+            raise ValueError("channel_url phải là chuỗi")
+        videos = request.get('videos') or []
+        if not isinstance(videos, list) or not all(isinstance(v, str) for v in videos):
+            raise ValueError("videos phải là danh sách ID (chuỗi)")
+        if not request.get('channel_url') and not videos:
+            raise ValueError("cần channel_url hoặc videos")
+        settings = request.get('settings') or {}
+        if not isinstance(settings, dict):
+            raise ValueError("settings phải là JSON object")
+        unknown = set(settings) - self.JOB_SETTINGS
+        if unknown:
+            raise ValueError(f"setting không hợp lệ cho job: {', '.join(sorted(unknown))}")
+        with self.pending:
+            job = ServiceJob(str(self.next_id), request)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            self.order.append(job.id)
+            self.pending.notify()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return [self.jobs[job_id].to_dict() for job_id in self.order]
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if not job or job.finished:
+            return job
+        job.cancelled = True
+        if job is self.current:
+            self.app.is_downloading = False
+        else:
+            job.set_status('cancelled')
+        return job
+
+    def run(self):
+        """Vòng lặp chạy job lần lượt (thread riêng)"""
+        while True:
+            with self.pending:
+                while True:
+                    job = next((self.jobs[i] for i in self.order if self.jobs[i].status == 'queued'), None)
+                    if job:
+                        break
+                    self.pending.wait()
+            self.current = job
+            try:
+                self.run_job(job)
+            except Exception as e:
+                self.app.log(f"❌ Lỗi: {str(e)}")
+                job.set_status('failed', str(e))
+            finally:
+                self.current = None
+
+    def run_job(self, job):
+        app = self.app
+        job.set_status('running')
+        app.apply_settings({**self.base_settings, **job.settings})
+        if job.channel_url:
+            app.channel_url_var.set(job.channel_url)
+            app._scan_channel_thread()
+        else:
+            # Danh sách video đã chọn sẵn: chỉ lọc khi job yêu cầu rõ
+            for key in ('use_date_filter', 'use_duration_filter', 'use_view_filter'):
+                if key not in job.settings:
+                    getattr(app, app.SETTING_VARS[key]).set(False)
+            app.metrics = RunMetrics("lookup")
+            app.videos = app.get_videos_by_id(job.video_ids)
+            app.save_key_pool()
+        job.videos = len(app.videos)
+        if job.cancelled:
+            job.set_status('cancelled')
+            return
+        if not app.videos:
+            job.set_status('failed', "không có video nào")
+            return
+        app.is_downloading = True
+        app._download_thread()
+        if job.cancelled:
+            job.set_status('cancelled')
+        else:
+            job.set_status('done')
+
+    def metrics(self, fmt='json'):
+        if fmt == 'prometheus':
+            return self.app.metrics.to_prometheus()
+        return self.app.metrics.summary()
+
+    def serve(self, host="127.0.0.1", port=8765):
+        """Chạy HTTP server (chặn tới khi Ctrl+C)"""
+        from http.server import ThreadingHTTPServer
+        self.host = host
+        threading.Thread(target=self.run, daemon=True).start()
+        httpd = ThreadingHTTPServer((host, port), make_service_handler(self))
+        httpd.daemon_threads = True
+        self.log(f"🌐 Service đang chạy tại http://{host}:{httpd.server_address[1]}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.app.is_downloading = False
+            httpd.server_close()
+
+
+def make_service_handler(service):
+    """Handler HTTP của DownloadService (import http.server chỉ khi chạy service)"""
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+        LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+        def log_message(self, format, *args):
+            pass
+
+        def local_request(self):
+            """Chặn trang web khác (CSRF, DNS rebinding): Host và Origin (nếu có) phải là máy này"""
+            allowed = set(self.LOCAL_HOSTS)
+            if service.host not in ('', '0.0.0.0', '::'):
+                allowed.add(service.host)
+            origin = self.headers.get('Origin')
+            if origin is not None and urlsplit(origin).hostname not in allowed:
+                return False
+            return urlsplit('//' + self.headers.get('Host', '')).hostname in allowed
+
+        def send_json(self, payload, status=200):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def route(self):
+            url = urlsplit(self.path)
+            return [p for p in url.path.split('/') if p], parse_qs(url.query)
+
+        def do_GET(self):
+            if not self.local_request():
+                return self.send_json({'error': 'forbidden'}, 403)
+            parts, query = self.route()
+            if parts == ['jobs']:
+                return self.send_json(service.list())
+            if parts == ['metrics']:
+                if query.get('format') == ['prometheus']:
+                    body = service.metrics('prometheus').encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                return self.send_json(service.metrics())
+            job = service.get(parts[1]) if len(parts) >= 2 and parts[0] == 'jobs' else None
+            if not job:
+                return self.send_json({'error': 'not found'}, 404)
+            if len(parts) == 2:
+                return self.send_json(job.to_dict())
+            if parts[2:] == ['events']:
+                try:
+                    index = max(0, int(query.get('from', ['0'])[0]))
+                except ValueError:
+                    return self.send_json({'error': 'from phải là số nguyên'}, 400)
+                return self.stream_events(job, index)
+            self.send_json({'error': 'not found'}, 404)
+
+        def do_POST(self):
+            if not self.local_request():
+                return self.send_json({'error': 'forbidden'}, 403)
+            parts, _ = self.route()
+            if parts == ['jobs']:
+                # Chỉ nhận JSON: form HTML/fetch "simple request" từ trang khác không gửi được
+                if self.headers.get_content_type() != 'application/json':
+                    return self.send_json({'error': 'Content-Type phải là application/json'}, 415)
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                    job = service.submit(request)
+                except ValueError as e:
+                    return self.send_json({'error': str(e)}, 400)
+                return self.send_json(job.to_dict(), 201)
+            if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+                job = service.cancel(parts[1])
+                if not job:
+                    return self.send_json({'error': 'not found'}, 404)
+                return self.send_json(job.to_dict())
+            self.send_json({'error': 'not found'}, 404)
+
+        def stream_events(self, job, index):
+            """Server-sent events tới khi job kết thúc hoặc client ngắt kết nối"""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            try:
+                while True:
+                    finished = job.finished
+                    index, events = job.events_after(index, timeout=15)
+                    chunks = []
+                    for kind, data in events:
+                        chunks.append(f"id: {index}\nevent: {kind}\ndata: "
+                                      f"{json.dumps(data, ensure_ascii=False)}\n\n")
+                        index += 1
+                    self.wfile.write((''.join(chunks) or ": keep-alive\n\n").encode('utf-8'))
+                    self.wfile.flush()
+                    if finished and not events:
+                        return
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return ServiceHandler
 
 
 def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="YouTube Channel Downloader")
+    parser.add_argument("--install-deps", action="store_true",
+                        help="Kiểm tra và cài các thư viện cần thiết rồi thoát")
+    parser.add_argument("--coordinator", metavar="QUEUE_DB",
+                        help="Không mở cửa sổ: quét kênh theo settings, đưa job vào hàng đợi SQLite dùng chung")
+    parser.add_argument("--worker", metavar="QUEUE_DB",
+                        help="Không mở cửa sổ: nhận job từ hàng đợi SQLite dùng chung và tải")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--settings", default=os.path.join(BASE_PATH, "settings.json"),
+                        help="File settings cho chế độ coordinator/worker")
+    parser.add_argument("--no-wait", action="store_true",
+                        help="Coordinator: đưa job vào hàng đợi rồi thoát, không chờ các worker")
+    parser.add_argument("--keep-alive", action="store_true",
+                        help="Worker: hàng đợi trống thì chờ job mới thay vì thoát")
+    parser.add_argument("--lease", type=float, default=60.0, help="Thời hạn lease (giây)")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+                        help="Không mở cửa sổ: chạy service HTTP/JSON cục bộ (mặc định 127.0.0.1)")
+    args = parser.parse_args()
+    
+    if args.install_deps:
+        install_requirements()
+        return
+        
+    if args.coordinator or args.worker or args.serve:
+        settings = {}
+        if os.path.exists(args.settings):
+            with open(args.settings, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+        app = YouTubeChannelDownloader(None, settings)
+        # Quota và cache API nằm cạnh file settings (mặc định: cạnh tool như khi chạy UI)
+        state_dir = os.path.dirname(os.path.abspath(args.settings))
+        app.api_quota_file = os.path.join(state_dir, "api_quota.json")
+        app.api_cache_dir = os.path.join(state_dir, "_api_cache")
+        app.info_cache_dir = os.path.join(state_dir, "_info_cache")
+        if args.serve:
+            host, _, port = args.serve.rpartition(':')
+            DownloadService(app, settings).serve(host or "127.0.0.1", int(port))
+            return
+        if args.coordinator:
+            queue = JobQueue(args.coordinator, lease_ttl=args.lease)
+            raise SystemExit(1 if app.run_coordinator(queue, wait=not args.no_wait) else 0)
+        queue = JobQueue(args.worker, lease_ttl=args.lease)
+        app.run_queue_worker(queue, args.worker_id, wait=args.keep_alive)
+        return
+        
+    # Lần chạy đầu (chưa có settings.json): kiểm tra thư viện trước khi mở cửa sổ
+    if not os.path.exists(os.path.join(BASE_PATH, "settings.json")):
+        install_requirements()
+        
     root = tk.Tk()
     app = YouTubeChannelDownloader(root)
+    root.after_idle(app.report_startup_time)
     root.mainloop()
 
 